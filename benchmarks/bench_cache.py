@@ -0,0 +1,104 @@
+"""Time repeated joins to a dimension table read from a .csv, with and without
+caching it, and a join and sort replayed from a cache on disk
+
+Run from the repository root:
+
+    python -m benchmarks.bench_cache
+"""
+import csv
+import os
+import random
+import shutil
+import tempfile
+import timeit
+
+from messydata import *
+
+N_ORDERS = 20000
+N_CUSTOMERS = 50000
+N_QUERIES = 10
+
+
+class Orders(Table):
+    id = IntField("ID")
+    customer_id = IntField("Customer ID")
+    amount = FloatField("Amount")
+
+    @staticmethod
+    def rows(**kwargs):
+        return ORDERS
+
+
+class Customers(Table):
+    id = IntField("ID")
+    name = StringField("Name")
+    region = StringField("Region")
+
+    @staticmethod
+    def rows(**kwargs):
+        return []
+
+
+rnd = random.Random(0)
+ORDERS = [
+    Orders(i, rnd.randint(1, N_CUSTOMERS), rnd.randint(0, 100000) / 100.0)
+    for i in range(N_ORDERS)
+]
+
+
+def write_customers(file_path):  # type: (str) -> None
+    with open(file_path, mode="w") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["ID", "Name", "Region"])
+        for i in range(1, N_CUSTOMERS + 1):
+            writer.writerow([i, "Customer {}".format(i), rnd.choice("NSEW")])
+
+
+def queries(customers):  # type: (Tbl) -> None
+    for _ in range(N_QUERIES):
+        list(
+            Orders.join(
+                customers, Orders.customer_id, Customers.id, strategy="hash"
+            ).rows()
+        )
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "customers.csv")
+        write_customers(file_path)
+        customers = Customers.from_csv(file_path)
+        for name, tbl in (("uncached", customers), ("cached", customers.cache())):
+            seconds = min(timeit.repeat(lambda: queries(tbl), number=1, repeat=3))
+            print("{:<10} {:>8.3f}s for {} joins".format(name, seconds, N_QUERIES))
+
+        # Orders produces its own rows, so the report reads them from a .csv
+        # to be cached on disk
+        orders_path = os.path.join(tmp_dir, "orders.csv")
+        with open(orders_path, mode="w") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["ID", "Customer ID", "Amount"])
+            writer.writerows(row.values() for row in ORDERS)
+
+        def run(cache_dir=None):
+            tbl = Orders.from_csv(orders_path).join(
+                customers, Orders.customer_id, Customers.id
+            ).sort((Customers.region, "asc"), (Orders.amount, "desc"))
+            if cache_dir is not None:
+                tbl = tbl.cache(directory=cache_dir)
+            return list(tbl.rows())
+
+        cache_dir = os.path.join(tmp_dir, "cache")
+
+        def cold():
+            run(cache_dir)
+            shutil.rmtree(cache_dir)
+
+        # every run builds a new table, as a new process would
+        for name, fn in (
+            ("report", run),
+            ("cold disk", cold),
+            ("warm disk", lambda: run(cache_dir)),
+        ):
+            seconds = min(timeit.repeat(fn, number=1, repeat=3))
+            print("{:<10} {:>8.4f}s".format(name, seconds))
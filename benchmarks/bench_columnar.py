@@ -0,0 +1,57 @@
+"""Compare the memory held by a table cached as a list of rows and as columns
+
+Run from the repository root:
+
+    python -m benchmarks.bench_columnar
+"""
+import datetime
+import random
+import tracemalloc
+
+from messydata import *
+from messydata.types_ import Tuple
+
+N_ROWS = 200000
+
+
+class Orders(Table):
+    id = IntField("ID")
+    region = StringField("Region")
+    order_date = DateField("Order Date", and_time=False)
+    amount = CurrencyField("Amount")
+    quantity = IntField("Quantity")
+
+    @staticmethod
+    def rows(**kwargs):
+        rnd = random.Random(0)
+        regions = ["North", "South", "East", "West", None]
+        for i in range(N_ROWS):
+            yield Orders(
+                i,
+                rnd.choice(regions),
+                datetime.date(2018, 1, 1) + datetime.timedelta(days=rnd.randint(0, 365)),
+                rnd.randint(0, 100000) / 100.0,
+                rnd.randint(0, 20) or None,
+            )
+
+
+def as_rows():
+    return list(Orders.rows())
+
+
+def as_columns():
+    return ColumnarTable.from_table(Orders)
+
+
+def bytes_held(fn):  # type: (...) -> Tuple[int, object]
+    tracemalloc.start()
+    materialized = fn()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held, materialized
+
+
+if __name__ == "__main__":
+    for fn in (as_rows, as_columns):
+        held, _ = bytes_held(fn)
+        print("{:<12} {:>6.0f} bytes per row".format(fn.__name__, held / float(N_ROWS)))
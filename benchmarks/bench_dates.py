@@ -0,0 +1,72 @@
+"""Time reading a date-heavy .csv with every date parsed by dateutil and with
+the layouts DateParser sniffs per column
+
+Run from the repository root (pass the number of rows, 1,000,000 by default):
+
+    python -m benchmarks.bench_dates [rows]
+"""
+import csv
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+from messydata import *
+from messydata import converters
+from messydata.accessors import FieldAccessors
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+
+class Shipments(Table):
+    id = IntField("ID")
+    ordered = DateField("Ordered", and_time=False)
+    shipped = DateField("Shipped")
+    delivered = DateField("Delivered", and_time=False)
+
+    @staticmethod
+    def rows(**kwargs):
+        return []
+
+
+def write_csv(file_path):  # type: (str) -> None
+    rnd = random.Random(0)
+    start = datetime.datetime(2015, 1, 1)
+    with open(file_path, mode="w") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["ID", "Ordered", "Shipped", "Delivered"])
+        for i in range(N_ROWS):
+            ordered = start + datetime.timedelta(days=rnd.randint(0, 3650))
+            shipped = ordered + datetime.timedelta(minutes=rnd.randint(0, 10000))
+            delivered = shipped + datetime.timedelta(days=rnd.randint(1, 10))
+            writer.writerow(
+                [
+                    i,
+                    ordered.strftime("%Y-%m-%d"),
+                    shipped.strftime("%Y-%m-%d %H:%M:%S"),
+                    delivered.strftime("%m/%d/%Y"),
+                ]
+            )
+
+
+def rows_per_second(file_path):  # type: (str) -> float
+    # new converters, created with the current settings and empty caches
+    Shipments.accessors = FieldAccessors(Shipments.fields)
+    start = time.time()
+    n = sum(1 for _ in Shipments.from_csv(file_path).rows())
+    return n / (time.time() - start)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "shipments.csv")
+        write_csv(file_path)
+        for fast in (False, True):
+            converters.fast_date_parsing = fast
+            print(
+                "{:<9} {:>10,.0f} rows/s".format(
+                    "sniffed" if fast else "dateutil", rows_per_second(file_path)
+                )
+            )
@@ -0,0 +1,68 @@
+"""Time updating a pivot with a batch of appended rows, against pivoting every
+row again
+
+Run from the repository root (pass the number of rows and of appended rows):
+
+    python -m benchmarks.bench_incremental_pivot [rows] [appended]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from messydata import *
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+N_APPENDED = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+N_CUSTOMERS = 5000
+
+
+class Sales(Table):
+    id = IntField("ID")
+    customer_id = IntField("Customer ID")
+    region = StringField("Region")
+    amount = FloatField("Amount")
+
+    @staticmethod
+    def rows(**kwargs):
+        return []
+
+
+def sales(first, n):  # type: (int, int) -> List[Row]
+    rnd = random.Random(first)
+    return [
+        Sales(
+            i,
+            rnd.randint(1, N_CUSTOMERS),
+            rnd.choice(["North", "South", "East", "West"]),
+            rnd.randint(0, 100000) / 100.0,
+        )
+        for i in range(first, first + n)
+    ]
+
+
+group_by = [Sales.customer_id, Sales.region]
+aggregations = [(Sales.amount, "sum"), (Sales.amount, "max"), (Sales.id, "last")]
+
+
+if __name__ == "__main__":
+    history, appended = sales(0, N_ROWS), sales(N_ROWS, N_APPENDED)
+    everything = history + appended
+
+    start = time.time()
+    n = len(list(Sales.from_iterable(everything).pivot(group_by, aggregations).rows()))
+    print("full pivot   {:>8.3f}s  {:>6,} groups".format(time.time() - start, n))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        state = os.path.join(tmp_dir, "sales.state")
+        batch = list(history)
+        rolling = Sales.from_iterable(batch).incremental_pivot(
+            group_by, aggregations, state=state
+        )
+        list(rolling.rows())
+        batch[:] = appended
+        start = time.time()
+        n = len(list(rolling.rows()))
+        print("incremental  {:>8.3f}s  {:>6,} groups changed".format(time.time() - start, n))
+        print("state file   {:>8,} bytes".format(os.path.getsize(state)))
@@ -0,0 +1,74 @@
+"""Time expressions evaluated row by row with the general operator functions
+and with the kernels specialized for the types of their fields
+
+Run from the repository root:
+
+    python -m benchmarks.bench_kernels
+"""
+import datetime
+import random
+import timeit
+from decimal import Decimal
+
+from messydata import *
+from messydata import kernels, vectorized
+from messydata.row import make_row
+
+N_ROWS = 200000
+
+
+class Orders(Table):
+    id = IntField("ID")
+    customer_id = IntField("Customer ID")
+    amount = CurrencyField("Amount")
+    order_date = DateField("Order Date", and_time=False)
+
+    @staticmethod
+    def rows(**kwargs):
+        return rows
+
+
+keys = list(Orders.fields.keys())
+rnd = random.Random(0)
+rows = [
+    make_row(
+        keys,
+        (
+            i,
+            rnd.randint(1, 5000),
+            Decimal(rnd.randint(0, 100000)) / 100,
+            datetime.date(2018, 1, 1) + datetime.timedelta(days=rnd.randint(0, 365)),
+        ),
+    )
+    for i in range(N_ROWS)
+]
+
+
+def where_int():
+    return sum(1 for _ in Orders.where(Orders.customer_id == 42).rows())
+
+
+def where_date():
+    cutoff = datetime.date(2018, 7, 1)
+    return sum(1 for _ in Orders.where(Orders.order_date >= cutoff).rows())
+
+
+def assign_decimal():
+    tbl = Orders.assign("Doubled", Orders.amount + Orders.amount, data_type="currency")
+    return sum(1 for _ in tbl.rows())
+
+
+def assign_date():
+    tbl = Orders.assign("Due", Orders.order_date + 30, data_type="date")
+    return sum(1 for _ in tbl.rows())
+
+
+if __name__ == "__main__":
+    # time the row by row path only
+    vectorized.vectorize_expressions = False
+    for fn in (where_int, where_date, assign_decimal, assign_date):
+        timings = []
+        for specialize in (False, True):
+            kernels.specialize_operators = specialize
+            timings.append(min(timeit.repeat(fn, number=1, repeat=3)))
+        print("{:<15} general {:.2f}s  kernels {:.2f}s".format(fn.__name__, *timings))
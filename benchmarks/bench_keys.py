@@ -0,0 +1,76 @@
+"""Time the operations that read key values out of every row: sorts, joins and
+pivots
+
+Run from the repository root:
+
+    python -m benchmarks.bench_keys
+"""
+import random
+import timeit
+
+from messydata import *
+
+N_ROWS = 200000
+N_CUSTOMERS = 5000
+
+
+class Orders(Table):
+    id = IntField("ID")
+    customer_id = IntField("Customer ID")
+    region = StringField("Region")
+    amount = FloatField("Amount")
+
+    @staticmethod
+    def rows(**kwargs):
+        return ORDERS
+
+
+class Customers(Table):
+    id = IntField("ID")
+    name = StringField("Name")
+
+    @staticmethod
+    def rows(**kwargs):
+        return CUSTOMERS
+
+
+rnd = random.Random(0)
+ORDERS = [
+    Orders(
+        i,
+        rnd.randint(1, N_CUSTOMERS),
+        rnd.choice(["North", "South", "East", "West", None]),
+        rnd.randint(0, 100000) / 100.0,
+    )
+    for i in range(N_ROWS)
+]
+CUSTOMERS = [Customers(i, "Customer {}".format(i)) for i in range(1, N_CUSTOMERS + 1)]
+
+
+def sort():
+    return Orders.sort((Orders.region, "asc"), (Orders.amount, "desc")).rows()
+
+
+def join_sort():
+    return list(Orders.join(Customers, Orders.customer_id, Customers.id).rows())
+
+
+def join_hash():
+    return list(
+        Orders.join(Customers, Orders.customer_id, Customers.id, strategy="hash").rows()
+    )
+
+
+def pivot():
+    return list(
+        Orders.pivot(
+            group_by_fields=[Orders.region, Orders.customer_id],
+            aggregations=[(Orders.amount, "sum")],
+        ).rows()
+    )
+
+
+if __name__ == "__main__":
+    for fn in (sort, join_sort, join_hash, pivot):
+        seconds = min(timeit.repeat(fn, number=1, repeat=3))
+        print("{:<10} {:>8.3f}s for {} rows".format(fn.__name__, seconds, N_ROWS))
@@ -0,0 +1,66 @@
+"""Time joining two streams already in key order with each join strategy, and
+measure the memory each one holds at its peak
+
+Run from the repository root (pass the number of rows per side):
+
+    python -m benchmarks.bench_merge_join [rows]
+"""
+import sys
+import time
+import tracemalloc
+
+from messydata import *
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+
+class Readings(Table):
+    minute = IntField("Minute")
+    value = FloatField("Value")
+
+    @staticmethod
+    def rows(**kwargs):
+        return (Readings(i, i * 0.5) for i in range(N_ROWS))
+
+
+class Alerts(Table):
+    minute = IntField("Alert Minute")
+    level = IntField("Level")
+
+    @staticmethod
+    def rows(**kwargs):
+        # every other minute, so half the readings have no alert
+        return (Alerts(i * 2, i % 5) for i in range(N_ROWS))
+
+
+def joined(strategy, how):  # type: (str, str) -> Tbl
+    return Readings.join(
+        right=Alerts,
+        left_on=Readings.minute,
+        right_on=Alerts.minute,
+        how=how,
+        strategy=strategy,
+    )
+
+
+def run(strategy, how):  # type: (str, str) -> Tuple[int, float, float]
+    start = time.time()
+    n = sum(1 for _ in joined(strategy, how).rows())
+    seconds = time.time() - start
+    tracemalloc.start()
+    for _ in joined(strategy, how).rows():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n, seconds, peak / 1024.0 / 1024.0
+
+
+if __name__ == "__main__":
+    for how in ("inner", "left", "outer"):
+        for strategy in ("sort", "hash", "merge"):
+            n, seconds, peak = run(strategy, how)
+            print(
+                "{:<5} {:<5} {:>8,} rows {:>8.3f}s  peak {:>8.2f} MiB".format(
+                    how, strategy, n, seconds, peak
+                )
+            )
@@ -0,0 +1,71 @@
+"""Time reading a .csv in this process and in a pool of processes
+
+Run from the repository root (pass the number of rows and of processes):
+
+    python -m benchmarks.bench_parallel_csv [rows] [processes]
+"""
+import csv
+import datetime
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from messydata import *
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+PROCESSES = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+
+
+class Orders(Table):
+    id = IntField("ID")
+    customer = StringField("Customer")
+    ordered = DateField("Ordered")
+    amount = CurrencyField("Amount")
+    quantity = IntField("Quantity")
+
+    @staticmethod
+    def rows(**kwargs):
+        return []
+
+
+def write_csv(file_path):  # type: (str) -> None
+    rnd = random.Random(0)
+    start = datetime.datetime(2015, 1, 1)
+    with open(file_path, mode="w") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["ID", "Customer", "Ordered", "Amount", "Quantity"])
+        for i in range(N_ROWS):
+            ordered = start + datetime.timedelta(minutes=rnd.randint(0, 5000000))
+            writer.writerow(
+                [
+                    i,
+                    "Customer {}".format(rnd.randint(1, 10000)),
+                    ordered.strftime("%Y-%m-%d %H:%M:%S"),
+                    "{:.2f}".format(rnd.uniform(0, 1000)),
+                    rnd.randint(1, 20),
+                ]
+            )
+
+
+def rows_per_second(file_path, **kwargs):  # type: (str, ...) -> float
+    start = time.time()
+    n = sum(1 for _ in Orders.from_csv(file_path, **kwargs).rows())
+    return n / (time.time() - start)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "orders.csv")
+        write_csv(file_path)
+        print("serial               {:>10,.0f} rows/s".format(rows_per_second(file_path)))
+        for ordered in (True, False):
+            print(
+                "{} processes {:<9}{:>10,.0f} rows/s".format(
+                    PROCESSES,
+                    "ordered" if ordered else "unordered",
+                    rows_per_second(file_path, processes=PROCESSES, ordered=ordered),
+                )
+            )
@@ -0,0 +1,61 @@
+"""Time reading a sqlite table in this process and in a pool of processes
+
+Run from the repository root (pass the number of rows and of processes):
+
+    python -m benchmarks.bench_parallel_sqlite [rows] [processes]
+"""
+import datetime
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from messydata import *
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+PROCESSES = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+
+
+class Orders(Table):
+    id = IntField("ID")
+    customer = StringField("Customer")
+    ordered = DateField("Ordered")
+    amount = CurrencyField("Amount")
+    quantity = IntField("Quantity")
+
+    @staticmethod
+    def rows(**kwargs):
+        rnd = random.Random(0)
+        start = datetime.datetime(2015, 1, 1)
+        for i in range(N_ROWS):
+            yield Orders(
+                i,
+                "Customer {}".format(rnd.randint(1, 10000)),
+                start + datetime.timedelta(minutes=rnd.randint(0, 5000000)),
+                rnd.randint(0, 100000) / 100.0,
+                rnd.randint(1, 20),
+            )
+
+
+def rows_per_second(db_path, **kwargs):  # type: (str, ...) -> float
+    start = time.time()
+    orders = Orders.from_sqlite(db_path=db_path, table_name="orders", **kwargs)
+    n = sum(1 for _ in orders.rows())
+    return n / (time.time() - start)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "orders.db")
+        Orders.to_sqlite(db_path=db_path, table_name="orders")
+        print("serial               {:>10,.0f} rows/s".format(rows_per_second(db_path)))
+        for ordered in (True, False):
+            print(
+                "{} processes {:<9}{:>10,.0f} rows/s".format(
+                    PROCESSES,
+                    "ordered" if ordered else "unordered",
+                    rows_per_second(db_path, processes=PROCESSES, ordered=ordered),
+                )
+            )
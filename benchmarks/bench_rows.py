@@ -0,0 +1,56 @@
+"""Compare the memory held by materialized rows with OrderedDict rows
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rows
+"""
+import datetime
+import sys
+import tracemalloc
+
+from messydata import *
+from messydata.types_ import OrderedDict, Tuple
+
+N_ROWS = 100000
+
+
+class Orders(Table):
+    id = IntField("ID")
+    region = StringField("Region")
+    order_date = DateField("Order Date", and_time=False)
+    amount = CurrencyField("Amount")
+    quantity = IntField("Quantity")
+
+    @staticmethod
+    def rows(**kwargs):
+        for i in range(N_ROWS):
+            yield Orders(i, "North", datetime.date(2018, 1, 1), 10, i % 20)
+
+
+def as_ordered_dicts():
+    """The previous row format"""
+    return [OrderedDict(row.items()) for row in Orders.rows()]
+
+
+def as_rows():
+    return list(Orders.rows())
+
+
+def bytes_held(fn):  # type: (...) -> Tuple[int, int]
+    """Memory allocated for the rows, and the part of it that's the row objects
+    themselves rather than the values they hold"""
+    tracemalloc.start()
+    rows = fn()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(rows) == N_ROWS
+    return held, sum(sys.getsizeof(row) for row in rows)
+
+
+if __name__ == "__main__":
+    for fn in (as_ordered_dicts, as_rows):
+        held, containers = bytes_held(fn)
+        print(
+            "{:<16} {:>6.0f} bytes per row, {:>6.0f} of them for the row "
+            "itself".format(fn.__name__, held / N_ROWS, containers / N_ROWS)
+        )
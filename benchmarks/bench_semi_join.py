@@ -0,0 +1,70 @@
+"""Time joins where few rows of the larger side have a match, with and without
+a prefilter on that side, read from memory and from a sqlite table
+
+Run from the repository root (pass the number of orders and of customers):
+
+    python -m benchmarks.bench_semi_join [orders] [customers]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from messydata import *
+
+N_ORDERS = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+N_CUSTOMERS = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+
+class Orders(Table):
+    id = IntField("ID")
+    customer_id = IntField("Customer ID")
+    amount = FloatField("Amount")
+
+    @staticmethod
+    def rows(**kwargs):
+        rnd = random.Random(0)
+        return [
+            Orders(i, rnd.randint(1, 100000), rnd.uniform(0, 100))
+            for i in range(N_ORDERS)
+        ]
+
+
+class Customers(Table):
+    id = IntField("Customer")
+    name = StringField("Name")
+
+    @staticmethod
+    def rows(**kwargs):
+        return [Customers(i, "Customer {}".format(i)) for i in range(N_CUSTOMERS)]
+
+
+def timed(orders, strategy, prefilter):  # type: (Tbl, str, Optional[str]) -> Tuple[int, float]
+    tbl = orders.join(
+        right=Customers,
+        left_on=Orders.customer_id,
+        right_on=Customers.id,
+        strategy=strategy,
+        prefilter=prefilter,
+    )
+    start = time.time()
+    n = sum(1 for _ in tbl.rows())
+    return n, time.time() - start
+
+
+if __name__ == "__main__":
+    in_memory = Orders.from_iterable(Orders.rows())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "orders.db")
+        in_memory.to_sqlite(db_path=db_path, table_name="orders")
+        from_sqlite = Orders.from_sqlite(db_path=db_path, table_name="orders")
+        for source, orders in (("memory", in_memory), ("sqlite", from_sqlite)):
+            for strategy in ("sort", "hash"):
+                for prefilter in (None, "left"):
+                    n, seconds = timed(orders, strategy, prefilter)
+                    print(
+                        "{:<7} {:<5} prefilter={:<5} {:>6,} rows {:>8.3f}s".format(
+                            source, strategy, str(prefilter), n, seconds
+                        )
+                    )
@@ -0,0 +1,72 @@
+"""Compare sorting once per order-by field with a single composite-key sort
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sort
+"""
+import datetime
+import random
+import timeit
+
+from messydata import *
+from messydata.table import field_value_getter_or_default
+
+N_ROWS = 200000
+
+
+class Orders(Table):
+    id = IntField("ID")
+    region = StringField("Region")
+    order_date = DateField("Order Date", and_time=False)
+    amount = CurrencyField("Amount")
+    quantity = IntField("Quantity")
+
+    @staticmethod
+    def rows(**kwargs):
+        return ROWS
+
+
+random.seed(0)
+ROWS = [
+    Orders(
+        i,
+        random.choice(["North", "South", "East", "West", None]),
+        datetime.date(2018, 1, 1) + datetime.timedelta(days=random.randint(0, 365)),
+        random.randint(0, 100000) / 100.0,
+        random.randint(0, 20) or None,
+    )
+    for i in range(N_ROWS)
+]
+
+ORDER_BY = [
+    (Orders.region, "asc"),
+    (Orders.order_date, "desc"),
+    (Orders.amount, "desc"),
+    (Orders.quantity, "asc"),
+    (Orders.id, "desc"),
+]
+
+
+def sort_per_field():
+    """The previous implementation: one full sort per order-by field"""
+    sorted_rows = Orders.rows()
+    for fld, direction in reversed(ORDER_BY):
+        sorted_rows = sorted(
+            sorted_rows,
+            key=field_value_getter_or_default(
+                field_names=((fld.table_name, fld.name),), fields=Orders.fields
+            ),
+            reverse=direction == "desc",
+        )
+    return sorted_rows
+
+
+def sort_composite():
+    return Orders.sort(*ORDER_BY).rows()
+
+
+if __name__ == "__main__":
+    assert sort_per_field() == sort_composite()
+    for fn in (sort_per_field, sort_composite):
+        seconds = min(timeit.repeat(fn, number=1, repeat=3))
+        print("{:<16} {:>8.3f}s for {} rows".format(fn.__name__, seconds, N_ROWS))
@@ -0,0 +1,73 @@
+"""Time writing rows to sqlite with to_sqlite's defaults and loading in bulk
+
+Run from the repository root (pass the number of rows, 1,000,000 by default):
+
+    python -m benchmarks.bench_to_sqlite [rows]
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+from messydata import *
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+
+class Orders(Table):
+    id = IntField("ID")
+    customer = StringField("Customer")
+    ordered = DateField("Ordered")
+    amount = CurrencyField("Amount")
+    quantity = IntField("Quantity")
+
+    @staticmethod
+    def rows(**kwargs):
+        return ROWS
+
+
+rnd = random.Random(0)
+start = datetime.datetime(2015, 1, 1)
+ROWS = [
+    Orders(
+        i,
+        "Customer {}".format(rnd.randint(1, 10000)),
+        start + datetime.timedelta(minutes=rnd.randint(0, 5000000)),
+        Decimal(rnd.randint(0, 100000)) / 100,
+        rnd.randint(1, 20),
+    )
+    for i in range(N_ROWS)
+]
+
+
+def rows_per_second(**kwargs):  # type: (...) -> float
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "orders.db")
+        start = time.time()
+        Orders.to_sqlite(db_path=db_path, table_name="orders", **kwargs)
+        return N_ROWS / (time.time() - start)
+
+
+if __name__ == "__main__":
+    for label, kwargs in (
+        ("defaults", {}),
+        ("indexed", {"indexes": [Orders.customer]}),
+        ("bulk", {"batch_size": 10000}),
+        (
+            "bulk, WAL, sync off",
+            {"batch_size": 10000, "journal_mode": "WAL", "synchronous": "OFF"},
+        ),
+        (
+            "bulk, indexed",
+            {
+                "batch_size": 10000,
+                "journal_mode": "WAL",
+                "synchronous": "OFF",
+                "indexes": [Orders.customer],
+            },
+        ),
+    ):
+        print("{:<20} {:>10,.0f} rows/s".format(label, rows_per_second(**kwargs)))
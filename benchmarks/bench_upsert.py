@@ -0,0 +1,58 @@
+"""Time refreshing a sqlite table where 1% of the rows changed: overwriting it,
+upserting every row and upserting only the rows whose hash changed
+
+Run from the repository root (pass the number of rows, 500,000 by default):
+
+    python -m benchmarks.bench_upsert [rows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from messydata import *
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+
+
+class Accounts(Table):
+    id = IntField("ID")
+    owner = StringField("Owner")
+    balance = FloatField("Balance")
+
+    @staticmethod
+    def rows(**kwargs):
+        return ROWS
+
+
+rnd = random.Random(0)
+ROWS = [
+    Accounts(i, "Owner {}".format(rnd.randint(1, 10000)), rnd.randint(0, 10 ** 6) / 100.0)
+    for i in range(N_ROWS)
+]
+
+
+def refresh(db_path, **kwargs):  # type: (str, ...) -> float
+    """Change 1% of the rows and write them all again"""
+    for i in rnd.sample(range(N_ROWS), N_ROWS // 100):
+        account_id, owner, _ = ROWS[i].values()
+        ROWS[i] = Accounts(account_id, owner, rnd.random())
+    start = time.time()
+    Accounts.to_sqlite(db_path=db_path, table_name="accounts", **kwargs)
+    return time.time() - start
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, kwargs in (
+            ("overwrite", {"mode": "o"}),
+            ("upsert", {"mode": "u", "keys": [Accounts.id]}),
+            (
+                "upsert changed",
+                {"mode": "u", "keys": [Accounts.id], "skip_unchanged": True},
+            ),
+        ):
+            db_path = os.path.join(tmp_dir, "{}.db".format(label))
+            refresh(db_path, **kwargs)  # the initial load
+            print("{:<15} {:.2f}s".format(label, refresh(db_path, **kwargs)))
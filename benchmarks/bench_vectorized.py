@@ -0,0 +1,52 @@
+"""Time where() and assign() over numeric fields row by row and in NumPy batches
+
+Run from the repository root (NumPy must be installed for the batched timings):
+
+    python -m benchmarks.bench_vectorized
+"""
+import random
+import timeit
+
+from messydata import *
+from messydata import vectorized
+from messydata.row import make_row
+
+N_ROWS = 500000
+
+
+class Orders(Table):
+    id = IntField("ID")
+    price = FloatField("Price")
+    quantity = IntField("Quantity")
+
+    @staticmethod
+    def rows(**kwargs):
+        return rows
+
+
+keys = list(Orders.fields.keys())
+rnd = random.Random(0)
+rows = [
+    make_row(keys, (i, rnd.randint(0, 100000) / 100.0, rnd.randint(0, 20) or None))
+    for i in range(N_ROWS)
+]
+
+
+def where():
+    return sum(1 for _ in Orders.where(Orders.price >= 500.0).rows())
+
+
+def assign():
+    tbl = Orders.assign("Total", Orders.price * Orders.quantity, data_type="float")
+    return sum(1 for _ in tbl.rows())
+
+
+if __name__ == "__main__":
+    for fn in (where, assign):
+        timings = []
+        for vectorize in (False, True):
+            vectorized.vectorize_expressions = vectorize
+            timings.append(min(timeit.repeat(fn, number=1, repeat=3)))
+        print(
+            "{:<8} row by row {:.2f}s  batched {:.2f}s".format(fn.__name__, *timings)
+        )
@@ -0,0 +1,79 @@
+"""Time reading what was appended to a .csv and a sqlite table since the last
+read, against reading them from the start
+
+Run from the repository root (pass the number of rows and of appended rows):
+
+    python -m benchmarks.bench_watermarks [rows] [appended]
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+from messydata import *
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+N_APPENDED = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+
+class Events(Table):
+    id = IntField("ID")
+    user = StringField("User")
+    amount = CurrencyField("Amount")
+
+    @staticmethod
+    def rows(**kwargs):
+        return []
+
+
+def events(first, n):  # type: (int, int) -> List[List[Any]]
+    rnd = random.Random(first)
+    return [
+        [i, "User {}".format(rnd.randint(1, 1000)), "{:.2f}".format(rnd.uniform(0, 100))]
+        for i in range(first, first + n)
+    ]
+
+
+def timed(tbl):  # type: (Tbl) -> Tuple[int, float]
+    start = time.time()
+    n = sum(1 for _ in tbl.rows())
+    return n, time.time() - start
+
+
+def report(name, tbl, full):  # type: (str, Tbl, Tbl) -> None
+    n, seconds = timed(full)
+    print("{:<7} full read {:>8,} rows {:>8.3f}s".format(name, n, seconds))
+    n, seconds = timed(tbl)
+    print("{:<7} tail read {:>8,} rows {:>8.3f}s".format(name, n, seconds))
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "events.csv")
+        db_path = os.path.join(tmp_dir, "events.db")
+        with open(csv_path, mode="w") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["ID", "User", "Amount"])
+            writer.writerows(events(0, N_ROWS))
+        Events.from_csv(csv_path).to_sqlite(db_path=db_path, table_name="events")
+
+        from_csv = Events.from_csv(
+            csv_path, watermark=os.path.join(tmp_dir, "csv.watermark")
+        )
+        from_sqlite = Events.from_sqlite(
+            db_path=db_path,
+            table_name="events",
+            watermark=os.path.join(tmp_dir, "sqlite.watermark"),
+        )
+        timed(from_csv)
+        timed(from_sqlite)
+
+        with open(csv_path, mode="a") as fh:
+            csv.writer(fh).writerows(events(N_ROWS, N_APPENDED))
+        Events.from_csv(csv_path).where(Events.id >= N_ROWS).to_sqlite(
+            db_path=db_path, table_name="events", mode="a"
+        )
+        report("csv", from_csv, Events.from_csv(csv_path))
+        report("sqlite", from_sqlite, Events.from_sqlite(db_path=db_path, table_name="events"))
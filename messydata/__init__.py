@@ -1,4 +1,7 @@
+from messydata.columnar import *
+from messydata.compiler import *
 from messydata.field import *
+from messydata.plan import *
 from messydata.table import *
 from messydata.field import *
 
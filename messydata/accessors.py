@@ -0,0 +1,196 @@
+"""Field accessors compiled once per table
+
+Every table class gets a FieldAccessors bundle when it's created.  It holds,
+by field position, the converters, defaults and sqlite converters of the
+table's fields, and builds the functions that pull key values out of rows for
+sorts, joins and pivots.  Those functions are generated as Python source, like
+compiled expressions, so that for rows of the table's own row class each value
+is read straight from its position in the tuple instead of through
+Record.__getitem__.  Rows of any other kind (dicts from a user's rows() method,
+...) are read key by key.
+"""
+import six
+
+from messydata.field import *
+from messydata.field import Field, unconverted
+from messydata.row import row_class
+from messydata.types_ import *
+
+__all__ = ()
+
+numeric_sort_types = (DataType.Boolean, DataType.Currency, DataType.Float, DataType.Int)
+date_sort_types = (DataType.Date, DataType.DateTime)
+
+
+class DescendingKey(object):
+    """Sort key that inverts the ordering of a value that can't be negated"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):  # type: (Primitive) -> None
+        self.value = value
+
+    def __eq__(self, other):  # type: (DescendingKey) -> bool
+        return self.value == other.value
+
+    def __lt__(self, other):  # type: (DescendingKey) -> bool
+        return other.value < self.value
+
+
+class FieldAccessors(object):
+    """Converters, defaults and key getters of a table's fields
+
+    :param fields: The table's fields, in order
+    """
+
+    __slots__ = (
+        "keys",
+        "positions",
+        "row_class",
+        "data_types",
+        "converters",
+        "lenient_converters",
+        "defaults",
+        "sqlite_converters",
+        "_getters",
+    )
+
+    def __init__(self, fields):  # type: (Dict[Tuple[TableName, FieldName], Field]) -> None
+        self.keys = tuple(fields.keys())
+        self.positions = {key: pos for pos, key in enumerate(self.keys)}
+        self.row_class = row_class(self.keys)
+        self.data_types = tuple(fld.data_type for fld in fields.values())
+        self.converters = tuple(dt.converter(False) for dt in self.data_types)
+        self.lenient_converters = tuple(dt.converter(True) for dt in self.data_types)
+        self.defaults = tuple(dt.default for dt in self.data_types)
+        self.sqlite_converters = tuple(dt.sqlite_converter for dt in self.data_types)
+        self._getters = {}  # type: Dict[Any, Callable[[Row], Any]]
+
+    def converters_for(self, ignore_errors):  # type: (bool) -> Tuple[Callable, ...]
+        if ignore_errors:
+            return self.lenient_converters
+        return self.converters
+
+    def default(self, key):  # type: (Tuple[TableName, FieldName]) -> Primitive
+        return self.defaults[self.positions[key]]
+
+    def getter(self, keys, or_defaults=False):
+        # type: (Iterable[Tuple[TableName, FieldName]], bool) -> Callable[[Row], Tuple[Primitive, ...]]
+        """Function returning a tuple of the values of some fields of a row
+
+        :param or_defaults: Replace nulls with the default of the field's type
+        """
+        keys = tuple(keys)
+        cache_key = ("get", keys, or_defaults)
+        if cache_key not in self._getters:
+            self._getters[cache_key] = self._compile(
+                [
+                    (key, "{value} or {default}" if or_defaults else "{value}")
+                    for key in keys
+                ],
+                as_tuple=True,
+            )
+        return self._getters[cache_key]
+
+    def sort_key(self, order_by):
+        # type: (Sequence[Tuple[Field, SortDirection]]) -> Callable[[Row], Any]
+        """Build a single composite sort key for a list of fields and
+        directions
+
+        Nulls are replaced with the default of the field's data type.
+        Descending numeric fields are negated, descending dates become their
+        distance from the minimum date and other descending fields are wrapped
+        in a DescendingKey, so one stable sort gives the same order as sorting
+        once per field.
+        """
+        cache_key = (
+            "sort",
+            tuple((fld.table_name, fld.name, str(direction)) for fld, direction in order_by),
+        )
+        if cache_key not in self._getters:
+            terms = []
+            for fld, direction in order_by:
+                if str(direction) == "asc":
+                    template = "{value} or {default}"
+                elif fld.data_type in numeric_sort_types:
+                    template = "-({value} or {default})"
+                elif fld.data_type in date_sort_types:
+                    # the distance back to the earliest date is a timedelta,
+                    # which sorts in reverse and is still compared in C
+                    template = "{default} - ({value} or {default})"
+                else:
+                    template = "DescendingKey({value} or {default})"
+                terms.append(((fld.table_name, fld.name), template, fld.data_type.default))
+            self._getters[cache_key] = self._compile(terms, as_tuple=len(terms) != 1)
+        return self._getters[cache_key]
+
+    def sqlite_values(self):  # type: () -> Callable[[Row], Tuple[Primitive, ...]]
+        """Function returning a tuple of the values of a row as sqlite3 stores
+        them, in field order
+
+        Only the values whose sqlite converter changes them are passed through it.
+        """
+        cache_key = ("sqlite",)
+        if cache_key not in self._getters:
+            terms, names = [], {}
+            for i, (key, convert) in enumerate(zip(self.keys, self.sqlite_converters)):
+                if convert is unconverted:
+                    terms.append((key, "{value}"))
+                else:
+                    names["sqlite{}".format(i)] = convert
+                    terms.append((key, "sqlite{}({{value}})".format(i)))
+            self._getters[cache_key] = self._compile(terms, as_tuple=True, names=names)
+        return self._getters[cache_key]
+
+    def _compile(self, terms, as_tuple, names=None):
+        # type: (Sequence[Tuple], bool, Optional[Dict[str, Any]]) -> Callable[[Row], Any]
+        """Generate a function of a row from one template per value
+
+        :param terms: (key, template) or (key, template, default) per value.  The
+            template formats `{value}` and `{default}` into an expression.
+        :param as_tuple: Return a tuple even if there's only one value
+        :param names: Other names the templates use
+        """
+        namespace = {
+            "DescendingKey": DescendingKey,
+            "cls": self.row_class,
+            "item": tuple.__getitem__,
+        }  # type: Dict[str, Any]
+        namespace.update(names or {})
+        fast, slow = [], []
+        for i, term in enumerate(terms):
+            key, template = term[:2]
+            namespace["k{}".format(i)] = key
+            if len(term) > 2:
+                namespace["d{}".format(i)] = term[2]
+            elif key in self.positions:
+                namespace["d{}".format(i)] = self.default(key)
+            default = "d{}".format(i)
+            slow.append(template.format(value="row[k{}]".format(i), default=default))
+            if key in self.positions:
+                fast.append(
+                    template.format(
+                        value="item(row, {})".format(self.positions[key]),
+                        default=default,
+                    )
+                )
+        if as_tuple:
+            fast_source, slow_source = (
+                "({},)".format(", ".join(exprs)) if exprs else "()"
+                for exprs in (fast, slow)
+            )
+        else:
+            fast_source, slow_source = fast[0] if fast else "", slow[0]
+
+        lines = ["def get(row):"]
+        if len(fast) == len(slow):
+            lines += [
+                "    if row.__class__ is cls:",
+                "        return {}".format(fast_source),
+            ]
+        lines.append("    return {}".format(slow_source))
+        source = "\n".join(lines) + "\n"
+        six.exec_(source, namespace)
+        fn = namespace["get"]
+        fn.source = source
+        return fn
@@ -0,0 +1,423 @@
+"""Rows of a table kept in memory, or on disk, so they're only produced once
+
+Table.cache() puts a RowCache in front of a table.  The first time the cached
+table's rows are asked for with a set of rows(**kwargs) they're materialized
+into a list, and later calls with the same kwargs read the list instead of
+running the table's plan again (re-reading a file, re-sorting for a join, ...).
+
+A cache holds up to max_rows rows, counted across the results of every set
+of kwargs.  Storing a result that doesn't fit evicts the least recently read
+results first, and a result larger than the whole budget isn't stored at all.
+
+With a directory the results are also written to disk by a DiskCache, so that
+other processes (the next run of a report, ...) replay them instead of
+producing them.  A result on disk is keyed by a fingerprint of the plan it
+came from (its operators, their arguments and fields) and by the state of
+every .csv and sqlite file the plan reads, so it's only replayed while none
+of them has changed.
+"""
+import contextlib
+import gc
+import hashlib
+import os
+import threading
+import types
+from collections import OrderedDict
+from uuid import uuid4
+
+import six
+from six.moves import cPickle as pickle
+
+from messydata.field import Field
+from messydata.plan import describe_arg
+from messydata.row import row_class, values_getter
+from messydata.types_ import *
+
+__all__ = ()
+
+replace_file = getattr(os, "replace", os.rename)
+
+
+class RowCache(object):
+    """Materialized rows of a table by rows(**kwargs)
+
+    :param produce: The rows(**kwargs) method of the table being cached
+    :param max_rows: Most rows to hold at once, None for no limit
+    :param disk: Where to keep the results between processes as well
+    """
+
+    __slots__ = (
+        "produce",
+        "max_rows",
+        "disk",
+        "results",
+        "size",
+        "hits",
+        "misses",
+        "lock",
+    )
+
+    def __init__(self, produce, max_rows=None, disk=None):
+        # type: (Callable[..., Rows], Optional[int], Optional[DiskCache]) -> None
+        if max_rows is not None and max_rows < 0:
+            raise ValueError("max_rows can't be negative, got {}".format(max_rows))
+        self.produce = produce
+        self.max_rows = max_rows
+        self.disk = disk
+        # least recently read first
+        self.results = OrderedDict()  # type: Dict[Any, List[Row]]
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def rows(self, **kwargs):  # type: (...) -> Iterator[Row]
+        key = kwargs_key(kwargs)
+        if key is None:
+            # kwargs that can't be told apart can't be cached
+            return iter(self.produce(**kwargs))
+        if self.disk is not None:
+            # rows read before a source changed are kept apart
+            key = (key, self.disk.version())
+        with self.lock:
+            rows = self.results.pop(key, None)
+            if rows is not None:
+                self.results[key] = rows
+                self.hits += 1
+                return iter(rows)
+            self.misses += 1
+        rows = None
+        if self.disk is not None:
+            rows = self.disk.read(key)
+        if rows is None:
+            rows = list(self.produce(**kwargs))
+            if self.disk is not None:
+                self.disk.write(key, rows)
+        self.store(key, rows)
+        return iter(rows)
+
+    def store(self, key, rows):  # type: (Any, List[Row]) -> None
+        if self.max_rows is not None and len(rows) > self.max_rows:
+            return
+        with self.lock:
+            replaced = self.results.pop(key, None)
+            if replaced is not None:
+                self.size -= len(replaced)
+            while self.max_rows is not None and self.size + len(rows) > self.max_rows:
+                _, evicted = self.results.popitem(last=False)
+                self.size -= len(evicted)
+            self.results[key] = rows
+            self.size += len(rows)
+
+    def invalidate(self, **kwargs):  # type: (...) -> None
+        """Drop the rows cached for these kwargs, or every result without any"""
+        with self.lock:
+            if kwargs:
+                key = kwargs_key(kwargs)
+                for cached_key in list(self.results):
+                    # with a disk cache keys are (kwargs, version of the sources)
+                    kwargs_part = cached_key if self.disk is None else cached_key[0]
+                    if kwargs_part == key:
+                        self.size -= len(self.results.pop(cached_key))
+            else:
+                self.results.clear()
+                self.size = 0
+        if self.disk is not None:
+            if kwargs:
+                self.disk.remove((kwargs_key(kwargs), self.disk.version()))
+            else:
+                self.disk.clear()
+
+
+def kwargs_key(kwargs):  # type: (Dict[str, Any]) -> Optional[Tuple[Tuple[str, Any], ...]]
+    """Hashable key of a set of rows(**kwargs), None if a value isn't hashable"""
+    key = tuple(sorted(kwargs.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+# Bumped when the layout of the files changes, so older files are ignored
+file_format = 1
+file_suffix = ".rows"
+
+
+class DiskCache(object):
+    """Results of a plan in a directory, one file per set of kwargs
+
+    Every file holds a header and the rows' values, pickled.  Writers pickle
+    to a temporary file of their own and rename it into place, so readers
+    only ever see complete files and concurrent writers of the same result
+    just replace each other's (identical) copy.  Reading a file touches it,
+    and once the files take more than max_bytes the least recently touched
+    ones are deleted.
+
+    :param directory: Folder for the files, shared by any number of plans
+    :param plan: Plan of the table being cached
+    :param max_bytes: Size the folder's files are kept under, None for no limit
+    :param hash_sources: Tell whether a source changed by hashing its contents
+        instead of by its size and modification time
+    """
+
+    __slots__ = (
+        "directory",
+        "max_bytes",
+        "hash_sources",
+        "plan_key",
+        "prefix",
+        "sources",
+        "keys",
+        "new_row",
+        "get_values",
+    )
+
+    def __init__(self, directory, plan, max_bytes=None, hash_sources=False):
+        # type: (str, Any, Optional[int], bool) -> None
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash_sources = hash_sources
+        self.plan_key = plan_fingerprint(plan)
+        # every file of the plan starts with this, whatever the kwargs and
+        # sources it was produced from
+        self.prefix = hashlib.sha256(self.plan_key.encode("utf-8")).hexdigest()[:32]
+        self.sources = sorted(set(source_paths(plan)))
+        self.keys = tuple(plan.fields.keys())
+        self.new_row = row_class(self.keys)
+        self.get_values = values_getter(self.keys)
+
+    def version(self):  # type: () -> Tuple[Any, ...]
+        """State of the files the plan reads"""
+        return tuple(
+            file_state(path, self.hash_sources)
+            for source in self.sources
+            for path in source
+        )
+
+    def path(self, key):  # type: (Any) -> str
+        digest = hashlib.sha256(repr((file_format, key)).encode("utf-8")).hexdigest()
+        return os.path.join(
+            self.directory, "{}-{}{}".format(self.prefix, digest[:32], file_suffix)
+        )
+
+    def read(self, key):  # type: (Any) -> Optional[List[Row]]
+        path = self.path(key)
+        try:
+            with open(path, mode="rb") as fh:
+                header = pickle.load(fh)
+                if header != (file_format, self.keys):
+                    return None
+                with gc_paused():
+                    values = pickle.load(fh)
+            os.utime(path, None)
+        except (EnvironmentError, EOFError, pickle.UnpicklingError):
+            # not there, or evicted while being read
+            return None
+        with gc_paused():
+            return [self.new_row(row_values) for row_values in values]
+
+    def write(self, key, rows):  # type: (Any, List[Row]) -> None
+        path = self.path(key)
+        temp_path = "{}.{}.tmp".format(path, uuid4().hex)
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # another process made it first
+                if not os.path.isdir(self.directory):
+                    raise
+        try:
+            with open(temp_path, mode="wb") as fh:
+                # pickled apart, so the header can be read on its own
+                pickle.dump((file_format, self.keys), fh, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(
+                    [self.get_values(row) for row in rows], fh, pickle.HIGHEST_PROTOCOL
+                )
+            replace_file(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict()
+
+    def remove(self, key):  # type: (Any) -> None
+        remove_quietly(self.path(key))
+
+    def clear(self):  # type: () -> None
+        """Delete every result of the plan"""
+        for path in self.cached_files(prefix=self.prefix):
+            remove_quietly(path)
+
+    def cached_files(self, prefix=""):  # type: (str) -> List[str]
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in names
+            if name.startswith(prefix) and name.endswith(file_suffix)
+        ]
+
+    def evict(self):  # type: () -> None
+        if self.max_bytes is None:
+            return
+        files = []
+        for path in self.cached_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            remove_quietly(path)
+            total -= size
+
+
+@contextlib.contextmanager
+def gc_paused():  # type: () -> Iterator[None]
+    """Don't collect garbage while building rows in bulk
+
+    Rows can't hold reference cycles, but every collection triggered by
+    allocating them would scan all the rows built so far.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def remove_quietly(path):  # type: (str) -> None
+    """Delete a file that another process may have deleted already"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Operators that read a file, by the argument naming it.  Their inputs are
+# only the schema of the rows, so they're left out of fingerprints.
+source_operators = {
+    "from_csv": "file_path",
+    "from_sqlite": "db_path",
+    "from_sqlite_query": "db_path",
+}
+
+
+def plan_fingerprint(node):  # type: (Any) -> str
+    """Description of a plan that changes whenever what it produces could
+
+    Conditions and calculations written as Python functions are identified by
+    their code, their default arguments and the values they close over.
+    """
+    if node.operator in ("table", "from_iterable"):
+        name = node.table.__name__ if node.table is not None else node.operator
+        raise ValueError(
+            "{} produces its own rows, so a cache on disk can't tell when they "
+            "change.  Only plans that read .csv and sqlite files can be cached "
+            "on disk.".format(name)
+        )
+    parts = [
+        node.operator,
+        [(key, str(fld.data_type)) for key, fld in node.fields.items()],
+        [(name, arg_fingerprint(value)) for name, value in sorted(node.args.items())],
+    ]  # type: List[Any]
+    if node.operator not in source_operators:
+        parts.append([plan_fingerprint(input_node) for input_node in node.inputs])
+    return repr(parts)
+
+
+def arg_fingerprint(value):  # type: (Any) -> Any
+    if isinstance(value, (list, tuple)):
+        return [arg_fingerprint(item) for item in value]
+    elif isinstance(value, dict):
+        return sorted((repr(k), arg_fingerprint(v)) for k, v in value.items())
+    elif isinstance(value, Field):
+        return [value.full_name, str(value.data_type)]
+    elif isinstance(value, types.FunctionType):
+        code = six.get_function_code(value)
+        defaults = six.get_function_defaults(value) or ()
+        kwdefaults = getattr(value, "__kwdefaults__", None) or {}
+        closure = six.get_function_closure(value) or ()
+        return [
+            value.__module__,
+            value.__name__,
+            code_fingerprint(code),
+            [bound_fingerprint(value, default) for default in defaults],
+            sorted(
+                (name, bound_fingerprint(value, default))
+                for name, default in kwdefaults.items()
+            ),
+            [bound_fingerprint(value, cell_contents(cell)) for cell in closure],
+        ]
+    return describe_arg(value)
+
+
+def bound_fingerprint(fn, value):  # type: (types.FunctionType, Any) -> Any
+    """Fingerprint of a value a function closes over or defaults an argument to
+
+    Objects that are only told apart by their identity can't be fingerprinted,
+    since another process would see a different one.
+    """
+    if (
+        not isinstance(value, (dict, list, tuple, Field, types.FunctionType))
+        and not hasattr(value, "__name__")
+        and type(value).__repr__ is object.__repr__
+    ):
+        raise ValueError(
+            "{} uses a {} whose state a cache on disk can't tell, so it can't "
+            "tell when the function's results change.  Pass the values it "
+            "needs as literals or use a cache in memory.".format(
+                fn.__name__, type(value).__name__
+            )
+        )
+    return arg_fingerprint(value)
+
+
+def cell_contents(cell):  # type: (Any) -> Any
+    try:
+        return cell.cell_contents
+    except ValueError:
+        # a variable the function closes over that was never assigned
+        return None
+
+
+def code_fingerprint(code):  # type: (types.CodeType) -> str
+    consts = [
+        code_fingerprint(const) if isinstance(const, types.CodeType) else repr(const)
+        for const in code.co_consts
+    ]
+    return hashlib.sha1(
+        code.co_code + repr((consts, code.co_names)).encode("utf-8")
+    ).hexdigest()
+
+
+def source_paths(node):  # type: (Any) -> List[Tuple[str, ...]]
+    """The files a plan reads, with a sqlite database's write-ahead log"""
+    if node.operator in source_operators:
+        path = os.path.abspath(node.args[source_operators[node.operator]])
+        if node.operator == "from_csv":
+            return [(path,)]
+        return [(path, path + "-wal")]
+    return [path for input_node in node.inputs for path in source_paths(input_node)]
+
+
+def file_state(path, hash_contents):  # type: (str, bool) -> Optional[Tuple[Any, ...]]
+    """Size and modification time of a file, or a hash of it, None if it's missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not hash_contents:
+        return path, stat.st_size, getattr(stat, "st_mtime_ns", stat.st_mtime)
+    digest = hashlib.sha1()
+    with open(path, mode="rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return path, digest.hexdigest()
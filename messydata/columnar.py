@@ -0,0 +1,215 @@
+"""Column-oriented storage for materialized tables
+
+Each field is kept in one column.  Int, Float, Boolean, Currency, Date and
+DateTime values are packed into an array.array with a bitmap marking the
+nulls.  Currency is stored as a count of cents, dates as ordinals and
+datetimes as microseconds since the start of the proleptic calendar.
+Strings, and any column holding a value its packed form can't reproduce
+exactly (an int too big for 64 bits, a float in an Int field, ...), fall back
+to a plain list.
+"""
+from array import array
+
+import six
+
+from messydata.field import *
+from messydata.row import row_class, values_getter
+from messydata.table import Table, new_table
+from messydata.types_ import *
+
+__all__ = ("ColumnarTable",)
+
+MICROSECONDS_PER_DAY = 86400 * 10 ** 6
+
+
+def encode_currency(value):  # type: (Decimal) -> Optional[int]
+    if not value.is_finite() or value.as_tuple().exponent != -2:
+        return None
+    return int(value.scaleb(2))
+
+
+def decode_currency(value):  # type: (int) -> Decimal
+    return Decimal(value).scaleb(-2)
+
+
+def encode_datetime(value):  # type: (datetime.datetime) -> Optional[int]
+    if value.tzinfo is not None:
+        return None
+    seconds = value.hour * 3600 + value.minute * 60 + value.second
+    return (
+        value.toordinal() * MICROSECONDS_PER_DAY
+        + seconds * 10 ** 6
+        + value.microsecond
+    )
+
+
+def decode_datetime(value):  # type: (int) -> datetime.datetime
+    days, microseconds = divmod(value, MICROSECONDS_PER_DAY)
+    return datetime.datetime.fromordinal(days) + datetime.timedelta(
+        microseconds=microseconds
+    )
+
+
+# For each data type: the array typecode, the exact type of the values that
+# can be packed, and functions that pack a value (returning None if it can't be
+# packed exactly) and unpack it.  A None function means the value is stored as
+# is.
+packings = {
+    DataType.Boolean: ("b", bool, None, bool),
+    DataType.Currency: ("q", Decimal, encode_currency, decode_currency),
+    DataType.Date: ("i", datetime.date, datetime.date.toordinal, datetime.date.fromordinal),
+    DataType.DateTime: ("q", datetime.datetime, encode_datetime, decode_datetime),
+    DataType.Float: ("d", float, None, None),
+    DataType.Int: ("q", int, None, None),
+}
+
+
+class Column(object):
+    """The values of one field
+
+    :param data_type: DataType of the field, which decides how values are packed
+    """
+
+    __slots__ = ("values", "nulls", "null_count", "packed_type", "encode", "decode")
+
+    def __init__(self, data_type):  # type: (DataType) -> None
+        packing = packings.get(data_type)
+        if packing is None:
+            self.values = []  # type: Union[array, List[Primitive]]
+            self.packed_type = None
+            self.encode = self.decode = None
+        else:
+            typecode, self.packed_type, self.encode, self.decode = packing
+            self.values = array(typecode)
+        self.nulls = bytearray()
+        self.null_count = 0
+
+    @property
+    def is_packed(self):  # type: () -> bool
+        return self.packed_type is not None
+
+    def append(self, value):  # type: (Primitive) -> None
+        if self.packed_type is None:
+            self.values.append(value)
+            return
+
+        pos = len(self.values)
+        if not pos & 7:
+            self.nulls.append(0)
+        if value is None:
+            self.nulls[pos >> 3] |= 1 << (pos & 7)
+            self.null_count += 1
+            self.values.append(0)
+            return
+
+        if type(value) is self.packed_type:
+            packed = value if self.encode is None else self.encode(value)
+            if packed is not None:
+                try:
+                    self.values.append(packed)
+                    return
+                except OverflowError:
+                    pass
+        self.unpack()
+        self.values.append(value)
+
+    def unpack(self):  # type: () -> None
+        """Switch to storing the values in a plain list"""
+        self.values = list(self)
+        self.packed_type = self.encode = self.decode = None
+        self.nulls = bytearray()
+        self.null_count = 0
+
+    def is_null(self, pos):  # type: (int) -> bool
+        return bool(self.nulls[pos >> 3] >> (pos & 7) & 1)
+
+    def __getitem__(self, pos):  # type: (int) -> Primitive
+        if pos < 0:
+            pos += len(self.values)
+        if self.packed_type is not None and self.is_null(pos):
+            return None
+        value = self.values[pos]
+        return value if self.decode is None else self.decode(value)
+
+    def __iter__(self):  # type: () -> Iterator[Primitive]
+        decode = self.decode
+        if not self.null_count:
+            if decode is None:
+                return iter(self.values)
+            return six.moves.map(decode, self.values)
+        null_flags = (byte >> bit & 1 for byte in self.nulls for bit in range(8))
+        if decode is None:
+            return (
+                None if is_null else value
+                for value, is_null in six.moves.zip(self.values, null_flags)
+            )
+        return (
+            None if is_null else decode(value)
+            for value, is_null in six.moves.zip(self.values, null_flags)
+        )
+
+    def __len__(self):  # type: () -> int
+        return len(self.values)
+
+    @property
+    def nbytes(self):  # type: () -> int
+        """Memory used by the packed values and the null bitmap"""
+        if self.packed_type is None:
+            return 0
+        return self.values.itemsize * len(self.values) + len(self.nulls)
+
+
+def column_rows(columns, keys):
+    # type: (Dict[Tuple[TableName, FieldName], Column], Sequence[Tuple[TableName, FieldName]]) -> Rows
+    """Rows assembled from some of the columns"""
+    new_row = row_class(keys)
+    return six.moves.map(new_row, six.moves.zip(*[columns[key] for key in keys]))
+
+
+class ColumnarTable(Table):
+    """A table materialized into one typed column per field
+
+    Create one with ColumnarTable.from_table(SomeTable).  It can be used like
+    any other table; its rows are assembled from the columns as they're read.
+    """
+
+    columns = OrderedDict()  # type: Dict[Tuple[TableName, FieldName], Column]
+    row_count = 0
+
+    @classmethod
+    def from_table(cls, table, **kwargs):  # type: (Tbl, Dict[str, Any]) -> Tbl
+        """Read all the rows of a table into columns"""
+        columns = OrderedDict(
+            (key, Column(fld.data_type)) for key, fld in table.fields.items()
+        )
+        appenders = [column.append for column in columns.values()]
+        get_values = values_getter(columns.keys())
+        row_count = 0
+        for row in table.rows(**kwargs):
+            for append, value in zip(appenders, get_values(row)):
+                append(value)
+            row_count += 1
+        keys = list(columns.keys())
+
+        def rows(**kwargs):  # type: (...) -> Rows
+            return column_rows(columns, keys)
+
+        columnar_tbl = new_table(
+            base_name=table.__name__, fields=table.fields, rows_method=rows, base=cls
+        )
+        columnar_tbl.columns = columns
+        columnar_tbl.row_count = row_count
+        return columnar_tbl
+
+    @classmethod
+    def column(cls, field):  # type: (Field) -> Column
+        """The stored values of a field"""
+        return cls.columns[(field.table_name, field.name)]
+
+    @classmethod
+    def select(cls, *columns):  # type: (Sequence[Union[str, Field]]) -> Tbl
+        """Select a subset of columns, reading only the selected columns"""
+        selected = super(ColumnarTable, cls).select(*columns)
+        stored, keys = cls.columns, list(selected.fields.keys())
+        selected._rows = staticmethod(lambda **kwargs: column_rows(stored, keys))
+        return selected
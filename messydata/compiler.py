@@ -0,0 +1,99 @@
+import six
+
+from messydata.field import *
+from messydata.field import CalculatedField, DeferredRowValue, Field
+from messydata.types_ import *
+
+__all__ = ("compile_expression",)
+
+# Flip to True to evaluate expressions with the recursive interpreter
+# (Expression.__call__) instead of the generated closures, e.g. when debugging.
+interpret_expressions = False
+
+LITERAL_TYPES = (bool, datetime.date, datetime.datetime, float, Decimal, int) + tuple(
+    six.string_types
+)
+
+
+class ExpressionCompiler(object):
+    """Flatten an expression tree into the source of a single Python function
+
+    Every field lookup, literal and operator function in the tree is bound to a
+    name in the namespace of the generated function, so evaluating a row does not
+    have to walk the tree, test operand types or look up its kernel again.
+    """
+
+    def __init__(self):
+        self.namespace = {}  # type: Dict[str, Any]
+        self._names = {}  # type: Dict[Tuple[str, int], str]
+
+    def bind(self, prefix, value):  # type: (str, Any) -> str
+        """Add a value to the namespace of the generated function"""
+        key = (prefix, id(value))
+        if key not in self._names:
+            name = "{}{}".format(prefix, len(self.namespace))
+            self.namespace[name] = value
+            self._names[key] = name
+        return self._names[key]
+
+    def source(self, operand):  # type: (Any) -> str
+        """Python source evaluating the operand for the row named `row`"""
+        if isinstance(operand, Expression):
+            fn = self.bind("fn", operand.kernel)
+            if operand.operator.is_binary:
+                return "{}({}, {})".format(
+                    fn, self.source(operand.operand1), self.source(operand.operand2)
+                )
+            return "{}({})".format(fn, self.source(operand.operand1))
+        elif isinstance(operand, LITERAL_TYPES):
+            return self.bind("lit", operand)
+        elif isinstance(operand, Field):
+            return "row[{}]".format(
+                self.bind("key", (operand.table_name, operand.name))
+            )
+        elif isinstance(operand, DeferredRowValue):
+            return "{}(row)".format(
+                self.bind("deferred", compile_expression(operand.expression))
+            )
+        else:
+            raise ValueError("Unrecognized expression value: {}".format(operand))
+
+    def compile(self, expression):  # type: (Expression) -> Callable[[Row], Primitive]
+        source = "def compiled_expression(row):\n    return {}\n".format(
+            self.source(expression)
+        )
+        six.exec_(source, self.namespace)
+        fn = self.namespace["compiled_expression"]
+        fn.source = source
+        return fn
+
+
+def compile_expression(
+    expression,  # type: Union[ExpressionWrapper, Callable[[Row], Primitive]]
+    interpret=None,  # type: Optional[bool]
+):  # type: (...) -> Callable[[Row], Primitive]
+    """Turn an expression into a single callable that takes a row
+
+    :param expression: Expression, DeferredRowValue, CalculatedField, Field or a
+        plain function of a row
+    :param interpret: Return the expression as is so it is evaluated by the
+        interpreter.  Defaults to the module-level `interpret_expressions` switch.
+    :return: function that evaluates the expression for a row
+    """
+    if interpret is None:
+        interpret = interpret_expressions
+    if interpret:
+        return expression
+
+    if isinstance(expression, Expression):
+        return ExpressionCompiler().compile(expression)
+    elif isinstance(expression, CalculatedField):
+        return compile_expression(expression._expression)
+    elif isinstance(expression, DeferredRowValue):
+        return compile_expression(expression.expression)
+    elif isinstance(expression, Field):
+        key = (expression.table_name, expression.name)
+        return lambda row: row[key]
+    elif callable(expression):
+        return expression
+    raise ValueError("Unrecognized expression value: {}".format(expression))
@@ -1,8 +1,14 @@
 import decimal
+import re
 import six
 
 from dateutil.parser import parse
 
+try:
+    from functools import lru_cache
+except ImportError:  # Python 2.7
+    lru_cache = None
+
 from messydata.types_ import *
 from messydata.util import list_wrapper
 
@@ -52,9 +58,124 @@ def try_currency(
     return wrapper
 
 
+# Flip to False to parse every date with dateutil, e.g. to compare timings.  It
+# applies to converters created after it changes.
+fast_date_parsing = True
+
+# Parsed values remembered per column, since date columns repeat their values
+date_cache_size = 4096
+
+
+def iso_layout(text):  # type: (str) -> Optional[datetime.datetime]
+    """2010-01-02, 2010-01-02 03:04, 2010-01-02T03:04:05.123456"""
+    match = iso_pattern.match(text)
+    if match is None:
+        return None
+    if fromisoformat is not None:
+        try:
+            return fromisoformat(text)
+        except ValueError:
+            return None
+    return datetime_from_groups(match.groups())
+
+
+def us_layout(text):  # type: (str) -> Optional[datetime.datetime]
+    """1/2/2010, 01/02/2010 03:04, 01/02/2010 03:04:05 (month first, like dateutil)"""
+    match = us_pattern.match(text)
+    if match is None:
+        return None
+    month, day, year = match.group(1, 2, 3)
+    return datetime_from_groups((year, month, day) + match.group(4, 5, 6, 7))
+
+
+def month_name_layout(text):  # type: (str) -> Optional[datetime.datetime]
+    """02-Jan-2010"""
+    if month_name_pattern.match(text) is None:
+        return None
+    try:
+        return datetime.datetime.strptime(text, "%d-%b-%Y")
+    except ValueError:
+        return None
+
+
+def datetime_from_groups(groups):
+    # type: (Sequence[Optional[str]]) -> Optional[datetime.datetime]
+    """Build a datetime from year, month, day, hour, minute, second and fraction
+    strings, the time parts being optional"""
+    year, month, day, hour, minute, second, fraction = groups
+    try:
+        return datetime.datetime(
+            int(year),
+            int(month),
+            int(day),
+            int(hour or 0),
+            int(minute or 0),
+            int(second or 0),
+            int((fraction or "").ljust(6, "0")),
+        )
+    except ValueError:
+        return None
+
+
+iso_pattern = re.compile(
+    r"([0-9]{4})-([0-9]{2})-([0-9]{2})"
+    r"(?:[T ]([0-9]{2}):([0-9]{2})(?::([0-9]{2})(?:\.([0-9]{1,6}))?)?)?\Z"
+)
+us_pattern = re.compile(
+    r"([0-9]{1,2})/([0-9]{1,2})/([0-9]{4})"
+    r"(?: ([0-9]{1,2}):([0-9]{2})(?::([0-9]{2})(?:\.([0-9]{1,6}))?)?)?\Z"
+)
+month_name_pattern = re.compile(r"[0-9]{1,2}-[A-Za-z]{3}-[0-9]{4}\Z")
+fromisoformat = getattr(datetime.datetime, "fromisoformat", None)
+
+# Layouts parse the cells that match them exactly and return None for the rest,
+# which dateutil parses.
+date_layouts = (iso_layout, us_layout, month_name_layout)
+
+
+class DateParser(object):
+    """Parse the strings of one column to datetimes
+
+    The layout of the first cell a layout matches is used for the next cells
+    until one doesn't match it, so a column of the same layout costs one
+    regex match and a datetime constructor per distinct value.  Cells that
+    match no layout are parsed by dateutil, so values are the same as
+    dateutil's whichever way they're parsed.
+    """
+
+    __slots__ = ("layout", "parse")
+
+    def __init__(self, cache_size=None):  # type: (Optional[int]) -> None
+        self.layout = None  # type: Optional[Callable[[str], Optional[datetime.datetime]]]
+        if cache_size is None:
+            cache_size = date_cache_size
+        if not fast_date_parsing:
+            self.parse = parse
+        elif lru_cache is not None and cache_size:
+            self.parse = lru_cache(maxsize=cache_size)(self.parse_uncached)
+        else:
+            self.parse = self.parse_uncached
+
+    def parse_uncached(self, text):  # type: (str) -> datetime.datetime
+        layout = self.layout
+        if layout is not None:
+            value = layout(text)
+            if value is not None:
+                return value
+        for candidate in date_layouts:
+            if candidate is not layout:
+                value = candidate(text)
+                if value is not None:
+                    self.layout = candidate
+                    return value
+        return parse(text)
+
+
 def try_date(
     ignore_errors=False
 ):  # type: (bool) -> Callable[[Primitive], Optional[datetime.date]]
+    parse_date = DateParser().parse
+
     def wrapper(val):  # type: (Primitive) -> Optional[datetime.date]
         if not val:
             return None
@@ -65,7 +186,7 @@ def try_date(
         elif isinstance(val, (float, int, Decimal)):
             return None
         try:
-            return parse(str(val)).date()
+            return parse_date(str(val)).date()
         except:
             if ignore_errors:
                 return None
@@ -78,6 +199,8 @@ def try_date(
 
 def try_datetime(ignore_errors=False):
     # type: (bool) -> Callable[[Primitive], Optional[datetime.date]]
+    parse_datetime = DateParser().parse
+
     def wrapper(val):  # type: (Primitive) -> Optional[datetime.date]
         if not val:
             return None
@@ -86,7 +209,7 @@ def try_datetime(ignore_errors=False):
         elif isinstance(val, datetime.date):
             return datetime.datetime.combine(val, datetime.datetime.min.time())
         try:
-            return parse(str(val))
+            return parse_datetime(str(val))
         except:
             if ignore_errors:
                 return None
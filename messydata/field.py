@@ -2,6 +2,7 @@ from enum import Enum
 from weakref import WeakValueDictionary
 
 from messydata.converters import *
+from messydata.kernels import literal_type, select_kernel
 from messydata.operators import Operator
 from messydata.types_ import *
 from messydata.util import unwrap_to_list, eomonth, bomonth
@@ -36,64 +37,23 @@ class DataType(Enum):
 
     @property
     def converter(self):  # type: () -> Callable[[bool], Callable[[str], Any]]
-        return {
-            DataType.Boolean: try_bool,
-            DataType.Currency: try_currency,
-            DataType.Date: try_date,
-            DataType.DateTime: try_datetime,
-            DataType.Float: try_float,
-            DataType.Int: try_int,
-            DataType.String: try_str,
-        }[self]
+        return data_type_converters[self]
 
     @property
     def default(self):  # type: () -> Primitive
-        return {
-            DataType.Boolean: False,
-            DataType.Currency: Decimal(0),
-            DataType.Date: datetime.date.min,
-            DataType.DateTime: datetime.datetime.min,
-            DataType.Float: 0.0,
-            DataType.Int: 0,
-            DataType.String: "",
-        }[self]
+        return data_type_defaults[self]
 
     @property
     def is_numeric(self):  # type: () -> bool
-        return {
-            DataType.Boolean: False,
-            DataType.Currency: True,
-            DataType.Date: False,
-            DataType.DateTime: False,
-            DataType.Float: True,
-            DataType.Int: True,
-            DataType.String: False,
-        }[self]
+        return self in numeric_data_types
 
     @property
     def sqlite_converter(self):  # type: () -> Callable[[Primitive], Primitive]
-        noop = lambda v: v
-        return {
-            DataType.Boolean: lambda v: 1 if v else 0,
-            DataType.Currency: lambda v: float(v),
-            DataType.Date: noop,
-            DataType.DateTime: noop,
-            DataType.Float: noop,
-            DataType.Int: lambda v: int(v) if v else None,
-            DataType.String: noop,
-        }[self]
+        return data_type_sqlite_converters[self]
 
     @property
     def sqlite_data_type(self):  # type: () -> str
-        return {
-            DataType.Boolean: "INTEGER",
-            DataType.Currency: "NUMERIC",
-            DataType.Date: "DATE",
-            DataType.DateTime: "TIMESTAMP",
-            DataType.Float: "REAL",
-            DataType.Int: "INTEGER",
-            DataType.String: "TEXT",
-        }[self]
+        return data_type_sqlite_names[self]
 
     def __eq__(self, other):
         return str(self) == str(other)
@@ -108,8 +68,82 @@ class DataType(Enum):
         return self.value
 
 
+# The properties of DataType look these up rather than building a dict on
+# every access.
+data_type_converters = {
+    DataType.Boolean: try_bool,
+    DataType.Currency: try_currency,
+    DataType.Date: try_date,
+    DataType.DateTime: try_datetime,
+    DataType.Float: try_float,
+    DataType.Int: try_int,
+    DataType.String: try_str,
+}
+
+data_type_defaults = {
+    DataType.Boolean: False,
+    DataType.Currency: Decimal(0),
+    DataType.Date: datetime.date.min,
+    DataType.DateTime: datetime.datetime.min,
+    DataType.Float: 0.0,
+    DataType.Int: 0,
+    DataType.String: "",
+}
+
+numeric_data_types = frozenset([DataType.Currency, DataType.Float, DataType.Int])
+
+
+def unconverted(value):  # type: (Primitive) -> Primitive
+    """sqlite converter of the data types sqlite3 stores as they are"""
+    return value
+
+
+data_type_sqlite_converters = {
+    DataType.Boolean: lambda v: 1 if v else 0,
+    DataType.Currency: lambda v: float(v),
+    DataType.Date: unconverted,
+    DataType.DateTime: unconverted,
+    DataType.Float: unconverted,
+    DataType.Int: lambda v: int(v) if v else None,
+    DataType.String: unconverted,
+}
+
+data_type_sqlite_names = {
+    DataType.Boolean: "INTEGER",
+    DataType.Currency: "NUMERIC",
+    DataType.Date: "DATE",
+    DataType.DateTime: "TIMESTAMP",
+    DataType.Float: "REAL",
+    DataType.Int: "INTEGER",
+    DataType.String: "TEXT",
+}
+
+# The type of the values the converter of each data type returns
+data_type_python_types = {
+    DataType.Boolean: bool,
+    DataType.Currency: Decimal,
+    DataType.Date: datetime.date,
+    DataType.DateTime: datetime.datetime,
+    DataType.Float: float,
+    DataType.Int: int,
+    DataType.String: str,
+}
+
+
+def static_type(operand):  # type: (Any) -> Optional[type]
+    """The type of the values an operand evaluates to, if it's known before
+    any row is read"""
+    if isinstance(operand, Expression):
+        return operand.result_type
+    elif isinstance(operand, (Field, DeferredRowValue)):
+        return data_type_python_types.get(operand.data_type)
+    elif isinstance(operand, ExpressionWrapper):
+        return None
+    return literal_type(operand)
+
+
 class Expression(object):
-    __slots__ = ("operator", "operand1", "operand2", "_fields")
+    __slots__ = ("operator", "operand1", "operand2", "kernel", "result_type", "_fields")
 
     def __init__(
         self,
@@ -121,6 +155,14 @@ class Expression(object):
         self.operand1 = operand1
         self.operand2 = operand2
 
+        # The operand types are known now, so pick the operator function
+        # specialized for them once instead of testing them on every row
+        self.kernel, self.result_type = select_kernel(
+            operator,
+            static_type(operand1),
+            static_type(operand2) if operator.is_binary else None,
+        )
+
         self._fields = None
 
     def __call__(self, row):  # type: (Row) -> Primitive
@@ -135,11 +177,11 @@ class Expression(object):
             right = self.operand2(row)
 
         if self.operator.type == "binary":
-            return self.operator.fn(
+            return self.kernel(
                 unwrap_field_value(row, left), unwrap_field_value(row, right)
             )
         elif self.operator.type == "unary":
-            return self.operator.fn(unwrap_field_value(row, left))
+            return self.kernel(unwrap_field_value(row, left))
         else:
             raise ValueError("Unrecognized operator {!r}".format(self.operator))
 
@@ -276,6 +318,7 @@ class Field(ExpressionWrapper):
         return DeferredRowValue(
             expression=mapper,
             data_type=self.data_type,
+            fields=[self],
             description="{}.map(values={})".format(self.full_name, values),
         )
 
@@ -289,6 +332,7 @@ class Field(ExpressionWrapper):
         return DeferredRowValue(
             expression=expression,
             data_type=DataType.Boolean,
+            fields=[self],
             description="{}.is_null(or_blank={})".format(self.name, or_blank),
         )
 
@@ -314,19 +358,25 @@ class DeferredRowValue(ExpressionWrapper):
     a DeferredRowValue is not named, and is not persisted.
     """
 
-    __slots__ = ("expression", "data_type", "description")
+    __slots__ = ("expression", "data_type", "description", "fields")
 
     def __init__(
         self,
         expression,  # type: Expression
         data_type,  # type: DataType
         description="",  # type: str
+        fields=None,  # type: Optional[List[Field]]
     ):
+        """
+        :param fields: The fields the expression reads, if they are known.  None
+            means the expression may read any field of the row.
+        """
         super(DeferredRowValue, self).__init__()
 
         self.expression = expression
         self.data_type = data_type
         self.description = description
+        self.fields = fields
 
     def __call__(self, row):  # type: (Row) -> Primitive
         return self.expression(row)
@@ -428,6 +478,7 @@ class DateField(Field):
         return DeferredRowValue(
             expression=expression,
             data_type=DataType.Date,
+            fields=[self],
             description="{}.eomonth(months={})".format(self.full_name, months),
         )
 
@@ -440,6 +491,7 @@ class DateField(Field):
         return DeferredRowValue(
             expression=expression,
             data_type=DataType.Date,
+            fields=[self],
             description="{}.eomonth(months={})".format(self.full_name, months),
         )
 
@@ -482,6 +534,7 @@ class StringField(Field):
         return DeferredRowValue(
             expression=expression,
             data_type=DataType.Boolean,
+            fields=[self],
             description=(
                 "{}.contains(fragment={!r}, ignore_case={})".format(
                     self.full_name, fragment, ignore_case
@@ -501,6 +554,7 @@ class StringField(Field):
         return DeferredRowValue(
             expression=expression,
             data_type=DataType.String,
+            fields=[self],
             description=(
                 "{}.endswith(suffix={!r}, ignore_case={})".format(
                     self.full_name, suffix, ignore_case
@@ -521,6 +575,7 @@ class StringField(Field):
         return DeferredRowValue(
             expression=expression,
             data_type=DataType.String,
+            fields=[self],
             description=(
                 "{}.replace(fragment={!r}, replacement={!r})".format(
                     self.full_name, fragment, replacement
@@ -540,6 +595,7 @@ class StringField(Field):
         return DeferredRowValue(
             expression=expression,
             data_type=DataType.String,
+            fields=[self],
             description=(
                 "{}.startswith(prefix={!r}, ignore_case={})".format(
                     self.full_name, prefix, ignore_case
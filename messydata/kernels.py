@@ -0,0 +1,321 @@
+"""Operator functions specialized for the types of their operands
+
+The functions in messydata.operators accept values of any type, so every call
+tests the types of both operands and comparisons upcast them through
+converters.upcast_values.  When an Expression is built the types of its
+operands are usually known from the data types of its fields and the types of
+its literals, so a kernel for that combination of types is picked once:
+an int-vs-int comparison, a Decimal addition, a date plus a number of days,
+...
+
+A kernel only trusts the values it gets when they have exactly the types it
+was built for.  Anything else (a None, a value a rows() method didn't convert,
+an operand whose type isn't known) goes to the general operator function, so
+kernels return what the general functions return, value for value, and raise
+what they raise.
+"""
+from __future__ import division
+
+from operator import eq, ge, gt, le, lt, ne
+
+import six
+
+from messydata.converters import *
+from messydata.converters import coalesce_pair
+from messydata.operators import Operator
+from messydata.types_ import *
+
+__all__ = ()
+
+# Flip to False to evaluate every operator with its general function, e.g. to
+# compare timings.  It applies to expressions built after it changes.
+specialize_operators = True
+
+numeric_types = (Decimal, float, int)
+date_types = (datetime.date, datetime.datetime)
+
+# A value of each type that can be upcast, to find out the type upcast_values
+# converts a pair of types to
+upcast_samples = {
+    bool: True,
+    datetime.date: datetime.date.min,
+    datetime.datetime: datetime.datetime.min,
+    Decimal: Decimal(1),
+    float: 1.0,
+    int: 1,
+    str: "",
+}
+
+# The same conversions upcast_values makes
+upcast_converters = {
+    bool: try_bool(ignore_errors=False),
+    datetime.date: try_date(ignore_errors=False),
+    datetime.datetime: try_datetime(ignore_errors=False),
+    float: try_float(ignore_errors=False),
+    int: try_int(ignore_errors=False),
+    Decimal: try_currency(ignore_errors=False),
+    str: try_str(ignore_errors=False),
+}
+
+comparisons = {
+    Operator.Equals: eq,
+    Operator.GreaterThan: gt,
+    Operator.GreaterThanOrEquals: ge,
+    Operator.LessThan: lt,
+    Operator.LessThanOrEquals: le,
+    Operator.NotEquals: ne,
+}
+
+
+def upcast_type(left_type, right_type):  # type: (type, type) -> Optional[type]
+    """The type upcast_values converts a pair of values of these types to"""
+    try:
+        return coalesce_pair(upcast_samples[left_type], upcast_samples[right_type])
+    except (KeyError, StopIteration):
+        return None
+
+
+def comparison_kernel(operator, generic, left_type, right_type):
+    # type: (Operator, Callable, type, type) -> Optional[Tuple[Callable, type]]
+    """Upcast with the converters the types need, then compare like `equals`,
+    `greater_than` and `less_than` do"""
+    target = upcast_type(left_type, right_type)
+    if target is None:
+        return None
+    op = comparisons[operator]
+    cast_left = None if issubclass(left_type, target) else upcast_converters[target]
+    cast_right = None if issubclass(right_type, target) else upcast_converters[target]
+    cast_left_type = left_type if cast_left is None else target
+    cast_right_type = right_type if cast_right is None else target
+    recast = upcast_type(cast_left_type, cast_right_type)
+    if not (
+        recast
+        and issubclass(cast_left_type, recast)
+        and issubclass(cast_right_type, recast)
+    ):
+        # Upcasting the upcast values again would convert them once more
+        return None
+
+    if cast_left is None and cast_right is None:
+
+        def compare(left, right):  # type: (Primitive, Primitive) -> bool
+            if type(left) is left_type and type(right) is right_type:
+                if left and right:
+                    return op(left, right)
+                return not left and not right
+            return generic(left, right)
+
+    else:
+
+        def compare(left, right):  # type: (Primitive, Primitive) -> bool
+            if type(left) is left_type and type(right) is right_type:
+                cast_left_value = left if cast_left is None else cast_left(left)
+                cast_right_value = right if cast_right is None else cast_right(right)
+                # the converters return None for some values, which the
+                # general function has to deal with
+                if (
+                    type(cast_left_value) is cast_left_type
+                    and type(cast_right_value) is cast_right_type
+                ):
+                    if cast_left_value and cast_right_value:
+                        return op(cast_left_value, cast_right_value)
+                    return not cast_left_value and not cast_right_value
+            return generic(left, right)
+
+    return compare, bool
+
+
+def add_kernel(operator, generic, left_type, right_type):
+    # type: (Operator, Callable, type, type) -> Optional[Tuple[Callable, type]]
+    """add_fields for numbers, strings and dates plus days"""
+    if left_type in date_types and right_type in (float, int):
+
+        def add(left, right):  # type: (Primitive, Primitive) -> Primitive
+            if type(left) is left_type and type(right) is right_type:
+                if right:
+                    return left + datetime.timedelta(days=right)
+                return left
+            return generic(left, right)
+
+        return add, left_type
+
+    elif left_type in (float, int) and right_type in date_types:
+
+        def add(left, right):  # type: (Primitive, Primitive) -> Primitive
+            if type(left) is left_type and type(right) is right_type:
+                if left:
+                    return right + datetime.timedelta(days=left)
+                return right
+            return generic(left, right)
+
+        return add, right_type
+
+    elif left_type is right_type and left_type in numeric_types + (str,):
+
+        def add(left, right):  # type: (Primitive, Primitive) -> Primitive
+            if type(left) is left_type and type(right) is right_type:
+                if left and right:
+                    return left + right
+                return left or right
+            return generic(left, right)
+
+        return add, left_type
+
+    elif left_type in numeric_types and right_type in numeric_types:
+
+        def add(left, right):  # type: (Primitive, Primitive) -> Primitive
+            if type(left) is left_type and type(right) is right_type:
+                if left and right:
+                    return left + left_type(right)
+                return left or right
+            return generic(left, right)
+
+        return add, None
+
+    return None
+
+
+def subtract_kernel(operator, generic, left_type, right_type):
+    # type: (Operator, Callable, type, type) -> Optional[Tuple[Callable, type]]
+    """subtract_fields for numbers and dates minus days"""
+    if left_type in date_types and right_type in (float, int):
+
+        def subtract(left, right):  # type: (Primitive, Primitive) -> Primitive
+            if type(left) is left_type and type(right) is right_type:
+                if right:
+                    return left - datetime.timedelta(days=right)
+                return left
+            return generic(left, right)
+
+        return subtract, left_type
+
+    elif left_type in numeric_types and right_type in numeric_types:
+        convert = None if left_type is right_type else left_type
+
+        def subtract(left, right):  # type: (Primitive, Primitive) -> Primitive
+            if type(left) is left_type and type(right) is right_type:
+                if left and right:
+                    return left - (right if convert is None else convert(right))
+                elif left:
+                    return left
+                return -right
+            return generic(left, right)
+
+        return subtract, left_type if convert is None else None
+
+    return None
+
+
+def multiply_kernel(operator, generic, left_type, right_type):
+    # type: (Operator, Callable, type, type) -> Optional[Tuple[Callable, type]]
+    """multiply_fields, which multiplies ints as floats"""
+    if left_type not in numeric_types or right_type not in numeric_types:
+        return None
+    # the types of the operands once ints are turned into floats
+    product_type = float if left_type is int else left_type
+    factor_type = float if right_type is int else right_type
+
+    if product_type is float and factor_type is float:
+
+        def multiply(left, right):  # type: (Primitive, Primitive) -> Primitive
+            if type(left) is left_type and type(right) is right_type:
+                if left and right:
+                    return float(left) * float(right)
+                return 0
+            return generic(left, right)
+
+    else:
+
+        def multiply(left, right):  # type: (Primitive, Primitive) -> Primitive
+            if type(left) is left_type and type(right) is right_type:
+                if left and right:
+                    return product_type(left) * product_type(factor_type(right))
+                return 0
+            return generic(left, right)
+
+    return multiply, None
+
+
+def divide_kernel(operator, generic, left_type, right_type):
+    # type: (Operator, Callable, type, type) -> Optional[Tuple[Callable, type]]
+    """divide_fields for numbers"""
+    if left_type not in numeric_types or right_type not in numeric_types:
+        return None
+    left_zero, right_zero = left_type(0), right_type(0)
+
+    def divide(left, right):  # type: (Primitive, Primitive) -> Primitive
+        if type(left) is left_type and type(right) is right_type:
+            if left and right:
+                return left / left_type(right)
+            elif left:
+                return left_zero
+            return right_zero
+        return generic(left, right)
+
+    return divide, None
+
+
+def negate_kernel(operator, generic, value_type, _=None):
+    # type: (Operator, Callable, type, None) -> Optional[Tuple[Callable, type]]
+    """negate_field for numbers"""
+    if value_type not in numeric_types:
+        return None
+    minus_one = value_type(-1)
+
+    def negate(value):  # type: (Primitive) -> Primitive
+        if type(value) is value_type:
+            if value:
+                return value * minus_one
+            return value
+        return generic(value)
+
+    return negate, value_type
+
+
+kernel_builders = {
+    Operator.Add: add_kernel,
+    Operator.Divide: divide_kernel,
+    Operator.Multiply: multiply_kernel,
+    Operator.Negate: negate_kernel,
+    Operator.Subtract: subtract_kernel,
+}
+for comparison_operator in comparisons:
+    kernel_builders[comparison_operator] = comparison_kernel
+
+# Kernels are shared by every expression over the same types
+kernels = {}  # type: Dict[Tuple[str, Optional[type], Optional[type]], Tuple[Callable, Optional[type]]]
+
+
+def select_kernel(operator, left_type=None, right_type=None):
+    # type: (Operator, Optional[type], Optional[type]) -> Tuple[Callable, Optional[type]]
+    """Pick the function that evaluates an operator
+
+    :param left_type: Type of the (first) operand's values, None if unknown
+    :param right_type: Type of the second operand's values, None if unknown
+    :return: the kernel, or the operator's general function if there's none for
+        these types, and the type of the values it returns if that's known
+    """
+    if not specialize_operators:
+        left_type = right_type = None
+    cache_key = (operator.name, left_type, right_type)
+    if cache_key not in kernels:
+        builder = kernel_builders.get(operator)
+        selected = None
+        if builder is not None and left_type is not None:
+            if right_type is not None or not operator.is_binary:
+                selected = builder(operator, operator.fn, left_type, right_type)
+        if selected is None:
+            comparison = operator in comparisons
+            selected = operator.fn, bool if comparison else None
+        kernels[cache_key] = selected
+    return kernels[cache_key]
+
+
+def literal_type(value):  # type: (Any) -> Optional[type]
+    """Type of a literal operand, if kernels know about it"""
+    value_type = type(value)
+    if value_type in upcast_samples:
+        return value_type
+    elif isinstance(value, six.string_types):
+        return str
+    return None
@@ -32,39 +32,11 @@ class Operator(Enum):
 
     @property
     def type(self):
-        return {
-            Operator.Add: "binary",
-            Operator.And: "binary",
-            Operator.Divide: "binary",
-            Operator.Equals: "binary",
-            Operator.GreaterThan: "binary",
-            Operator.GreaterThanOrEquals: "binary",
-            Operator.LessThan: "binary",
-            Operator.LessThanOrEquals: "binary",
-            Operator.Multiply: "binary",
-            Operator.Negate: "unary",
-            Operator.NotEquals: "binary",
-            Operator.Or: "binary",
-            Operator.Subtract: "binary",
-        }[self]
+        return "unary" if self is Operator.Negate else "binary"
 
     @property
     def fn(self):
-        return {
-            Operator.Add: add_fields,
-            Operator.And: and_,
-            Operator.Divide: divide_fields,
-            Operator.Equals: fields_are_equal,
-            Operator.GreaterThan: field_greater_than,
-            Operator.GreaterThanOrEquals: field_greater_than_or_equals,
-            Operator.LessThan: field_less_than,
-            Operator.LessThanOrEquals: field_less_than_or_equals,
-            Operator.Multiply: multiply_fields,
-            Operator.Negate: negate_field,
-            Operator.NotEquals: fields_are_not_equal,
-            Operator.Or: or_,
-            Operator.Subtract: subtract_fields,
-        }[self]
+        return operator_functions[self]
 
     @property
     def is_binary(self):
@@ -262,3 +234,20 @@ def subtract_fields(left, right):  # type: (Primitive, Primitive) -> Primitive
             return -right
         else:
             raise ValueError("Cannot subtract the value {!r}".format(right))
+
+
+operator_functions = {
+    Operator.Add: add_fields,
+    Operator.And: and_,
+    Operator.Divide: divide_fields,
+    Operator.Equals: fields_are_equal,
+    Operator.GreaterThan: field_greater_than,
+    Operator.GreaterThanOrEquals: field_greater_than_or_equals,
+    Operator.LessThan: field_less_than,
+    Operator.LessThanOrEquals: field_less_than_or_equals,
+    Operator.Multiply: multiply_fields,
+    Operator.Negate: negate_field,
+    Operator.NotEquals: fields_are_not_equal,
+    Operator.Or: or_,
+    Operator.Subtract: subtract_fields,
+}
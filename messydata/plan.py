@@ -0,0 +1,467 @@
+import six
+
+from messydata import sql
+from messydata.field import *
+from messydata.field import CalculatedField, DeferredRowValue, Field
+from messydata.types_ import *
+from messydata.util import list_wrapper, tuple_wrapper
+
+__all__ = ("PlanNode", "optimize")
+
+# Flip to False to run every derived table exactly as it was written, without
+# rewriting its plan first.
+optimize_plans = True
+
+LITERAL_TYPES = (bool, datetime.date, datetime.datetime, float, Decimal, int) + tuple(
+    six.string_types
+)
+
+
+class PlanNode(object):
+    """Logical description of how a table's rows are produced
+
+    :param operator: Name of the Table method that produces the rows (e.g.
+        'where'), or 'table' for a user-defined Table with its own rows method
+    :param inputs: Plans of the tables the operator reads from
+    :param args: Keyword arguments to pass to the Table method
+    :param fields: Fields of the resulting table
+    :param table: The table the plan belongs to.  Rewritten nodes have no table
+        until they are built.
+    """
+
+    __slots__ = ("operator", "inputs", "args", "fields", "table")
+
+    def __init__(
+        self,
+        operator,  # type: str
+        inputs=(),  # type: Sequence[PlanNode]
+        args=None,  # type: Optional[Dict[str, Any]]
+        fields=None,  # type: Optional[Dict[Tuple[TableName, FieldName], Field]]
+        table=None,  # type: Optional[Tbl]
+    ):
+        self.operator = operator
+        self.inputs = tuple(inputs)
+        self.args = args or {}
+        self.fields = fields if fields is not None else OrderedDict()
+        self.table = table
+
+    def replace(self, **changes):  # type: (...) -> PlanNode
+        """Copy the node with some attributes changed.  The copy isn't built."""
+        attrs = {
+            "operator": self.operator,
+            "inputs": self.inputs,
+            "args": self.args,
+            "fields": self.fields,
+        }
+        attrs.update(changes)
+        return PlanNode(**attrs)
+
+    def explain(self, indent=0):  # type: (int) -> str
+        """Render the plan as an indented tree, one operator per line"""
+        if self.operator == "table":
+            line = "table({})".format(self.table.__name__)
+        else:
+            line = "{}({})".format(
+                self.operator,
+                ", ".join(
+                    "{}={}".format(name, describe_arg(value))
+                    for name, value in sorted(self.args.items())
+                ),
+            )
+        lines = ["  " * indent + line]
+        lines.extend(node.explain(indent + 1) for node in self.inputs)
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "PlanNode(operator={!r}, inputs={!r}, args={!r})".format(
+            self.operator, self.inputs, self.args
+        )
+
+
+def describe_arg(value):  # type: (Any) -> str
+    if isinstance(value, Field):
+        return value.full_name
+    elif isinstance(value, (list, tuple)):
+        return "[{}]".format(", ".join(describe_arg(v) for v in value))
+    elif isinstance(value, DeferredRowValue):
+        return value.description
+    elif isinstance(value, (Expression, bool, float, int, Decimal)):
+        return str(value)
+    elif isinstance(value, six.string_types):
+        return repr(value)
+    elif hasattr(value, "__name__"):
+        return value.__name__
+    return repr(value)
+
+
+def expression_fields(expression, top_level=True):
+    # type: (Any, bool) -> Optional[Set[Tuple[TableName, FieldName]]]
+    """Keys of the fields an expression reads, or None if that can't be known"""
+    if isinstance(expression, CalculatedField) and top_level:
+        return expression_fields(expression._expression)
+    elif isinstance(expression, Field):
+        return {(expression.table_name, expression.name)}
+    elif isinstance(expression, Expression):
+        keys = set()
+        for operand in (expression.operand1, expression.operand2):
+            operand_keys = expression_fields(operand, top_level=False)
+            if operand_keys is None:
+                return None
+            keys |= operand_keys
+        return keys
+    elif isinstance(expression, DeferredRowValue):
+        if expression.fields is None:
+            return None
+        return {(fld.table_name, fld.name) for fld in expression.fields}
+    elif expression is None or isinstance(expression, LITERAL_TYPES):
+        return set()
+    return None
+
+
+def push_down_filter(node):  # type: (PlanNode) -> PlanNode
+    """Move a where() below operators that don't change the values it reads"""
+    if node.operator != "where":
+        return node
+    child = node.inputs[0]
+    keys = expression_fields(node.args["condition"])
+    if keys is None:
+        return node
+
+    def filtered(input_node):  # type: (PlanNode) -> PlanNode
+        return node.replace(inputs=(input_node,), fields=input_node.fields)
+
+    if child.operator in ("select", "sort", "unique"):
+        return child.replace(inputs=(filtered(child.inputs[0]),))
+    elif child.operator == "assign":
+        grandchild = child.inputs[0]
+        # a calculation assigned again under the same name hides the old value
+        if keys <= set(grandchild.fields) and child.args["key"] not in keys:
+            return child.replace(inputs=(filtered(grandchild),))
+    elif child.operator == "join":
+        left, right = child.inputs
+        how = child.args["how"]
+        left_deduped, right_deduped = deduped_join_sides(child)
+        shared_keys = set(left.fields) & set(right.fields)
+        if keys & shared_keys:
+            return node
+        if how in ("inner", "left") and keys <= set(left.fields) and not left_deduped:
+            return child.replace(inputs=(filtered(left), right))
+        if how in ("inner", "right") and keys <= set(right.fields) and not right_deduped:
+            return child.replace(inputs=(left, filtered(right)))
+    return node
+
+
+def deduped_join_sides(node):  # type: (PlanNode) -> Tuple[bool, bool]
+    """Does a join keep only the first row per key of its left, right input?
+
+    Filtering such a side first could make a later row the first one.
+    """
+    relationship = str(node.args["relationship"].value)
+    left = relationship in ("one-to-one", "one-to-many")
+    right = relationship in ("one-to-one", "many-to-one")
+    if node.args["how"] == "right":
+        # a right join is run as a left join with the inputs swapped
+        return right, left
+    return left, right
+
+
+def push_filter_into_sqlite(node):  # type: (PlanNode) -> PlanNode
+    """Hand a where() directly over from_sqlite() to SQLite
+
+    A from_sqlite() with a watermark is left as it is, see prune_columns().
+    """
+    if node.operator != "where" or node.inputs[0].operator != "from_sqlite":
+        return node
+    child = node.inputs[0]
+    condition = node.args["condition"]
+    if child.args.get("watermark") is not None or not sql.can_translate(
+        condition, child.fields
+    ):
+        return node
+    args = dict(child.args)
+    args["where"] = list_wrapper(args.get("where")) + [condition]
+    return child.replace(args=args)
+
+
+def merge_selects(node):  # type: (PlanNode) -> PlanNode
+    """Collapse a select() of a select() into a single select()"""
+    if node.operator != "select" or node.inputs[0].operator != "select":
+        return node
+    child = node.inputs[0]
+    if set(node.fields) <= set(child.fields):
+        return node.replace(inputs=child.inputs)
+    return node
+
+
+def drop_redundant_sorts(node):  # type: (PlanNode) -> PlanNode
+    """Remove sorts that can't change the order of the rows
+
+    A sort without any fields is a no-op.  Since sorting is stable, sorting the
+    output of another sort is the same as one sort on the outer fields followed
+    by the inner ones.
+    """
+    if node.operator != "sort":
+        return node
+    order_by = node.args["order_by"]
+    if not order_by:
+        return node.inputs[0]
+    child = node.inputs[0]
+    if child.operator == "sort":
+        outer_keys = {(fld.table_name, fld.name) for fld, _ in order_by}
+        inner = [
+            (fld, direction)
+            for fld, direction in child.args["order_by"]
+            if (fld.table_name, fld.name) not in outer_keys
+        ]
+        return node.replace(
+            inputs=child.inputs, args={"order_by": list(order_by) + inner}
+        )
+    return node
+
+
+rules = [push_down_filter, push_filter_into_sqlite, merge_selects, drop_redundant_sorts]
+
+
+# Operators whose input is run by the input's own table, so the input isn't
+# rewritten in ways the operator can't see (the rows a cache holds are the rows
+# of its input as written)
+barriers = frozenset(["cache"])
+
+
+def rewrite(node):  # type: (PlanNode) -> PlanNode
+    """Rewrite a plan until none of the rules apply"""
+    if node.operator in barriers:
+        return node
+    inputs = tuple(rewrite(input_node) for input_node in node.inputs)
+    if any(new is not old for new, old in zip(inputs, node.inputs)):
+        node = node.replace(inputs=inputs)
+    for rule in rules:
+        rewritten = rule(node)
+        if rewritten is not node:
+            return rewrite(rewritten)
+    return node
+
+
+def field_keys(fields):  # type: (Iterable[Field]) -> Set[Tuple[TableName, FieldName]]
+    return {(fld.table_name, fld.name) for fld in fields}
+
+
+def keys_or_all(expression, node):
+    # type: (Any, PlanNode) -> Set[Tuple[TableName, FieldName]]
+    """Keys an expression reads, or all of the node's fields if that's unknown"""
+    keys = expression_fields(expression)
+    return set(node.fields) if keys is None else keys
+
+
+def project(node, required):
+    # type: (PlanNode, Set[Tuple[TableName, FieldName]]) -> PlanNode
+    """Narrow a node's rows to the required fields, if it has any others"""
+    if set(node.fields) <= required:
+        return node
+    fields = OrderedDict(
+        (key, fld) for key, fld in node.fields.items() if key in required
+    )
+    return PlanNode(
+        "select", inputs=(node,), args={"columns": list(fields.values())}, fields=fields
+    )
+
+
+def prune_columns(node, required):
+    # type: (PlanNode, Set[Tuple[TableName, FieldName]]) -> PlanNode
+    """Only produce the fields that are read further up the plan
+
+    Sources read fewer columns, calculations nobody reads are dropped and rows
+    are narrowed before they are held in memory by a sort or a join.
+
+    :param required: Keys of the fields the node's consumer reads
+    """
+    op = node.operator
+    if op == "assign":
+        calc_key = node.args["key"]
+        if calc_key not in required:
+            return prune_columns(node.inputs[0], required)
+        input_required = (required - {calc_key}) | keys_or_all(
+            node.args["expression"], node.inputs[0]
+        )
+    elif op == "select":
+        input_required = field_keys(node.args["columns"])
+    elif op == "where":
+        input_required = required | keys_or_all(node.args["condition"], node.inputs[0])
+    elif op in ("sort", "top"):
+        input_required = required | field_keys(fld for fld, _ in node.args["order_by"])
+    elif op in ("pivot", "incremental_pivot"):
+        input_required = field_keys(node.args["group_by_fields"]) | field_keys(
+            fld for fld, _ in node.args["aggregations"]
+        )
+    elif op == "join":
+        sides = zip(node.inputs, (node.args["left_on"], node.args["right_on"]))
+        inputs = []
+        for side, join_on in sides:
+            side_required = (required & set(side.fields)) | field_keys(
+                tuple_wrapper(join_on)
+            )
+            inputs.append(project(prune_columns(side, side_required), side_required))
+        return replace_inputs(node, inputs)
+    elif op in ("from_csv", "from_sqlite"):
+        # a source with a watermark keeps the bounds of its first read, which a
+        # copy of it wouldn't share
+        if set(node.fields) <= required or node.args.get("watermark") is not None:
+            return node
+        fields = OrderedDict(
+            (key, fld) for key, fld in node.fields.items() if key in required
+        )
+        args = dict(node.args)
+        args["columns"] = list(fields.values())
+        return node.replace(args=args, fields=fields)
+    else:
+        # unique() compares whole rows, a cache holds whole rows and the other
+        # leaves produce their rows as is.
+        return node
+
+    input_node = prune_columns(node.inputs[0], input_required)
+    if op in ("sort", "top"):
+        input_node = project(input_node, input_required)
+    return replace_inputs(node, (input_node,))
+
+
+def replace_inputs(node, inputs):  # type: (PlanNode, Sequence[PlanNode]) -> PlanNode
+    """Copy a node over new inputs, keeping only the fields they still produce"""
+    if all(new is old for new, old in zip(inputs, node.inputs)):
+        return node
+    if node.operator in ("select", "pivot", "incremental_pivot"):
+        return node.replace(inputs=inputs)
+    available = set()
+    for input_node in inputs:
+        available |= set(input_node.fields)
+    if node.operator == "assign":
+        available.add(node.args["key"])
+    fields = OrderedDict(
+        (key, fld) for key, fld in node.fields.items() if key in available
+    )
+    return node.replace(inputs=inputs, fields=fields)
+
+
+# Operators whose rows come out in the order of their input's rows
+order_preserving = frozenset(["assign", "cache", "select", "unique", "where"])
+
+
+def sort_order(node):  # type: (PlanNode) -> List[Tuple[Field, Any]]
+    """Fields and directions a plan's rows are known to be sorted by, most
+    significant first, [] if nothing is known
+
+    Like sort(), nulls are ordered as the default of the field's type.
+    """
+    if node.operator in ("sort", "top"):
+        return list(node.args["order_by"])
+    elif node.operator == "pivot":
+        if not (node.args["sort"] or node.args["strategy"] == "sort"):
+            return []
+        return [(fld, "asc") for fld in node.args["group_by_fields"]]
+    elif node.operator == "incremental_pivot":
+        return [(fld, "asc") for fld in node.args["group_by_fields"]]
+    elif node.operator not in order_preserving:
+        return []
+    order = []
+    for fld, direction in sort_order(node.inputs[0]):
+        key = (fld.table_name, fld.name)
+        # a field that's dropped or calculated anew no longer orders the
+        # fields after it
+        if key not in node.fields or (
+            node.operator == "assign" and key == node.args["key"]
+        ):
+            break
+        order.append((fld, direction))
+    return order
+
+
+def sorted_on(node, keys):
+    # type: (PlanNode, Sequence[Tuple[TableName, FieldName]]) -> bool
+    """Are a plan's rows known to be in ascending order of these fields?"""
+    order = sort_order(node)[: len(keys)]
+    return bool(keys) and [
+        ((fld.table_name, fld.name), str(direction)) for fld, direction in order
+    ] == [(key, "asc") for key in keys]
+
+
+def source_table_plan(node):  # type: (PlanNode) -> PlanNode
+    """Plan of the table the left-most from_sqlite() in a plan was called on"""
+    while node.operator != "from_sqlite":
+        node = node.inputs[0]
+    return node.inputs[0]
+
+
+def reads_watermark(node):  # type: (PlanNode) -> bool
+    """Does a plan read a source that only yields its new rows once?"""
+    return node.args.get("watermark") is not None or any(
+        reads_watermark(input_node) for input_node in node.inputs
+    )
+
+
+def run_in_sqlite(node):  # type: (PlanNode) -> PlanNode
+    """Replace the largest parts of a plan that only read from one sqlite
+    database with a single query"""
+    if node.operator in barriers:
+        return node
+    if node.operator in sql.translators and node.operator != "from_sqlite":
+        query = sql.plan_to_sql(node)
+        if query is not None:
+            return PlanNode(
+                "from_sqlite_query",
+                inputs=(source_table_plan(node),),
+                args={
+                    "db_path": query.db_path,
+                    "query": sql.pipeline_sql(query, node.fields),
+                    "params": query.params,
+                    "columns": list(node.fields.values()),
+                },
+                fields=node.fields,
+            )
+    inputs = tuple(run_in_sqlite(input_node) for input_node in node.inputs)
+    if any(new is not old for new, old in zip(inputs, node.inputs)):
+        return node.replace(inputs=inputs)
+    return node
+
+
+def optimize(node):  # type: (PlanNode) -> PlanNode
+    """Rewrite a plan, prune the columns it doesn't need and hand the parts that
+    only read from sqlite over to SQLite
+
+    Nodes that don't change are returned as is, so they keep their table.
+    """
+    return run_in_sqlite(prune_columns(rewrite(node), set(node.fields)))
+
+
+# Table methods that take a list of fields as *args
+star_args = {"select": "columns", "sort": "order_by", "top": "order_by"}
+
+# Arguments a node records about what the method made of its arguments, which
+# aren't passed back to it
+derived_args = {"assign": ("key",)}
+
+
+def build(node):  # type: (PlanNode) -> Tbl
+    """Create the table described by a plan"""
+    if node.table is not None:
+        return node.table
+    inputs = [build(input_node) for input_node in node.inputs]
+    kwargs = dict(node.args)
+    args = list(kwargs.pop(star_args.get(node.operator), ()))
+    for name in derived_args.get(node.operator, ()):
+        del kwargs[name]
+    if "n" in kwargs:
+        args.insert(0, kwargs.pop("n"))
+    if len(inputs) > 1:
+        kwargs["right"] = inputs[1]
+    node.table = getattr(inputs[0], node.operator)(*args, **kwargs)
+    return node.table
+
+
+def execute(table, **kwargs):  # type: (Tbl, Dict[str, Any]) -> Rows
+    """Produce the rows of a derived table from its optimized plan"""
+    if not optimize_plans:
+        return table._rows(**kwargs)
+    if table._optimized is None:
+        table._optimized = build(optimize(table.plan))
+    if table._optimized is table:
+        return table._rows(**kwargs)
+    return table._optimized.rows(**kwargs)
@@ -0,0 +1,158 @@
+"""Compact rows
+
+A row is a tuple of values.  The position of each (table name, field name) key
+is resolved once per schema and kept on a class shared by all of the schema's
+rows, so a row costs about as much memory as a plain tuple of its values.
+Rows can still be read like the OrderedDicts they replace: row[key], get(),
+keys(), values(), items() and `key in row` all work, and a row equals an
+OrderedDict with the same items.
+"""
+from itertools import chain
+from operator import itemgetter
+
+from six.moves.collections_abc import Mapping
+
+from messydata.types_ import *
+
+__all__ = ()
+
+row_classes = {}  # type: Dict[Tuple[Tuple[TableName, FieldName], ...], type]
+
+
+class Record(tuple):
+    """Base class of the row class of each schema"""
+
+    __slots__ = ()
+
+    _keys = ()  # type: Tuple[Tuple[TableName, FieldName], ...]
+    _positions = {}  # type: Dict[Tuple[TableName, FieldName], int]
+
+    def __getitem__(self, key):  # type: (Tuple[TableName, FieldName]) -> Primitive
+        return tuple.__getitem__(self, self._positions[key])
+
+    def __contains__(self, key):  # type: (Tuple[TableName, FieldName]) -> bool
+        return key in self._positions
+
+    def __iter__(self):  # type: () -> Iterator[Tuple[TableName, FieldName]]
+        return iter(self._keys)
+
+    def get(self, key, default=None):
+        # type: (Tuple[TableName, FieldName], Primitive) -> Primitive
+        pos = self._positions.get(key)
+        if pos is None:
+            return default
+        return tuple.__getitem__(self, pos)
+
+    def keys(self):  # type: () -> Tuple[Tuple[TableName, FieldName], ...]
+        return self._keys
+
+    def values(self):  # type: () -> Tuple[Primitive, ...]
+        return tuple.__getitem__(self, slice(None))
+
+    def items(self):  # type: () -> List[Tuple[Tuple[TableName, FieldName], Primitive]]
+        return list(zip(self._keys, self.values()))
+
+    def __eq__(self, other):  # type: (Any) -> bool
+        if isinstance(other, Record):
+            return self._keys == other._keys and tuple.__eq__(self, other)
+        elif isinstance(other, OrderedDict):
+            return self.items() == list(other.items())
+        elif isinstance(other, Mapping):
+            return dict(self.items()) == dict(other)
+        elif isinstance(other, tuple):
+            # Rows aren't tuples of values as far as callers can tell
+            return False
+        return NotImplemented
+
+    def __ne__(self, other):  # type: (Any) -> bool
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = tuple.__hash__
+
+    def __reduce__(self):
+        return make_row, (self._keys, self.values())
+
+    def __repr__(self):  # type: () -> str
+        return "Row({!r})".format(self.items())
+
+
+Mapping.register(Record)
+
+
+def row_class(keys):  # type: (Iterable[Tuple[TableName, FieldName]]) -> type
+    """The row class for a schema, created the first time it's asked for
+
+    :param keys: Keys of the schema's fields, in order
+    """
+    keys = tuple(keys)
+    cls = row_classes.get(keys)
+    if cls is None:
+        cls = row_classes[keys] = type(
+            "Row",
+            (Record,),
+            {
+                "__slots__": (),
+                "_keys": keys,
+                "_positions": {key: pos for pos, key in enumerate(keys)},
+            },
+        )
+    return cls
+
+
+def make_row(keys, values):
+    # type: (Iterable[Tuple[TableName, FieldName]], Iterable[Primitive]) -> Row
+    return row_class(keys)(values)
+
+
+def to_row(mapping):  # type: (Dict[Tuple[TableName, FieldName], Primitive]) -> Row
+    """Convert a dict-style row"""
+    return row_class(mapping.keys())(mapping.values())
+
+
+def values_getter(keys):
+    # type: (Iterable[Tuple[TableName, FieldName]]) -> Callable[[Row], Tuple[Primitive, ...]]
+    """Function that returns the values of some keys of a row, in order
+
+    Rows of the schema with exactly these keys are copied without looking up
+    any keys.  Other rows, including dicts, are read key by key.
+    """
+    keys = tuple(keys)
+    cls = row_class(keys)
+
+    def get(row):  # type: (Row) -> Tuple[Primitive, ...]
+        if row.__class__ is cls:
+            return row.values()
+        return tuple([row[key] for key in keys])
+
+    return get
+
+
+def row_combiner(left_keys, right_keys):
+    # type: (Sequence[Tuple[TableName, FieldName]], Sequence[Tuple[TableName, FieldName]]) -> Callable[[Row, Row], Row]
+    """Function that merges a left and a right row into one row
+
+    The result has the left keys followed by the right keys the left side
+    doesn't have.  Where both sides have a key the right value wins, like
+    OrderedDict.update().
+    """
+    left_keys, right_keys = tuple(left_keys), tuple(right_keys)
+    left_get, right_get = values_getter(left_keys), values_getter(right_keys)
+    right_positions = {key: len(left_keys) + pos for pos, key in enumerate(right_keys)}
+    keys = tuple(OrderedDict.fromkeys(chain(left_keys, right_keys)))
+    positions = [
+        right_positions[key] if key in right_positions else left_keys.index(key)
+        for key in keys
+    ]
+    cls = row_class(keys)
+    if len(positions) == 1:
+        pick = lambda values: (values[positions[0]],)
+    else:
+        pick = itemgetter(*positions)
+
+    def combine(left_row, right_row):  # type: (Row, Row) -> Row
+        return cls(pick(left_get(left_row) + right_get(right_row)))
+
+    return combine
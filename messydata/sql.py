@@ -0,0 +1,618 @@
+import re
+
+import six
+
+from messydata.field import *
+from messydata.field import CalculatedField, Field, data_type_python_types
+from messydata.kernels import upcast_converters, upcast_type
+from messydata.operators import Operator
+from messydata.types_ import *
+from messydata.util import list_wrapper
+
+__all__ = ()
+
+comparison_operators = {
+    Operator.Equals: "=",
+    Operator.GreaterThan: ">",
+    Operator.GreaterThanOrEquals: ">=",
+    Operator.LessThan: "<",
+    Operator.LessThanOrEquals: "<=",
+    Operator.NotEquals: "<>",
+}
+
+boolean_operators = {Operator.And: "AND", Operator.Or: "OR"}
+
+numeric_types = (DataType.Currency, DataType.Float, DataType.Int)
+
+
+def split_conjuncts(condition):  # type: (Any) -> List[Any]
+    """Split a condition on its top-level 'and's so each part can be handled alone"""
+    if isinstance(condition, Expression) and condition.operator == Operator.And:
+        return split_conjuncts(condition.operand1) + split_conjuncts(condition.operand2)
+    return [condition]
+
+
+def literal_matches(data_type, value):  # type: (DataType, Primitive) -> bool
+    """Will SQLite compare the literal to the column the way Python would?"""
+    if data_type in numeric_types:
+        return isinstance(value, (float, int, Decimal)) and not isinstance(value, bool)
+    elif data_type == DataType.Boolean:
+        return isinstance(value, bool)
+    elif data_type == DataType.String:
+        return isinstance(value, six.string_types)
+    elif data_type == DataType.DateTime:
+        return isinstance(value, datetime.datetime)
+    elif data_type == DataType.Date:
+        return isinstance(value, datetime.date) and not isinstance(
+            value, datetime.datetime
+        )
+    return False
+
+
+def types_match(left, right):  # type: (DataType, DataType) -> bool
+    if left in numeric_types and right in numeric_types:
+        return True
+    return left == right
+
+
+def upcast_column(column, data_type, target):
+    # type: (str, DataType, Optional[type]) -> Optional[str]
+    """SQL of a numeric column's value as upcast_values converts it to target,
+    None if SQLite can't convert it the same way
+
+    A Currency or Float value compared to an int is truncated, and a Float
+    compared to a Decimal is rounded to cents.
+    """
+    value_type = data_type_python_types[data_type]
+    if target is None or (target is Decimal and value_type is float):
+        return None
+    if target is int and value_type is not int:
+        return "CAST({} AS INTEGER)".format(column)
+    return column
+
+
+def upcast_literal(value, target):  # type: (Primitive, type) -> Primitive
+    """A numeric literal as upcast_values converts it to target"""
+    if isinstance(value, target):
+        return value
+    return upcast_converters[target](value)
+
+
+def truthy_sql(column, data_type):  # type: (str, DataType) -> str
+    """SQL that is true when Python would consider the column's value truthy"""
+    if data_type in (DataType.Date, DataType.DateTime):
+        return "{} IS NOT NULL".format(column)
+    elif data_type == DataType.String:
+        return "({col} IS NOT NULL AND {col} <> '')".format(col=column)
+    return "({col} IS NOT NULL AND {col} <> 0)".format(col=column)
+
+
+def comparison_to_sql(
+    expression,  # type: Expression
+    columns,  # type: Dict[Tuple[TableName, FieldName], str]
+    fields,  # type: Dict[Tuple[TableName, FieldName], Field]
+):  # type: (...) -> Optional[Tuple[str, List[Primitive]]]
+    """Translate a comparison between a field and a field or literal
+
+    The operator functions treat falsy values (None, 0, '') as empty: two empty
+    values are equal to each other under every operator, and an empty value
+    compared to a non-empty one is always False.  The SQL reproduces that.
+    """
+    op = comparison_operators[expression.operator]
+    left, right = expression.operand1, expression.operand2
+    literal_first = isinstance(right, Field) and not isinstance(left, Field)
+    if literal_first:
+        left, right = right, left
+        op = {">": "<", ">=": "<=", "<": ">", "<=": ">="}.get(op, op)
+
+    if isinstance(left, CalculatedField) or not isinstance(left, Field):
+        return None
+    left_key = (left.table_name, left.name)
+    if left_key not in columns:
+        return None
+    data_type = fields[left_key].data_type
+    left_column = columns[left_key]
+
+    if isinstance(right, Field):
+        right_key = (right.table_name, right.name)
+        if isinstance(right, CalculatedField) or right_key not in columns:
+            return None
+        right_type = fields[right_key].data_type
+        if not types_match(data_type, right_type):
+            return None
+        right_column = columns[right_key]
+        if data_type in numeric_types:
+            # the operator functions upcast both values before comparing them
+            target = upcast_type(
+                data_type_python_types[data_type], data_type_python_types[right_type]
+            )
+            left_column = upcast_column(left_column, data_type, target)
+            right_column = upcast_column(right_column, right_type, target)
+            if left_column is None or right_column is None:
+                return None
+        left_truthy = truthy_sql(left_column, data_type)
+        right_truthy = truthy_sql(right_column, right_type)
+        sql = "(({lt} AND {rt} AND {l} {op} {r}) OR (NOT {lt} AND NOT {rt}))".format(
+            lt=left_truthy, rt=right_truthy, l=left_column, r=right_column, op=op
+        )
+        return sql, []
+
+    if not literal_matches(data_type, right):
+        return None
+    if data_type in numeric_types:
+        column_type = data_type_python_types[data_type]
+        if literal_first:
+            target = upcast_type(type(right), column_type)
+        else:
+            target = upcast_type(column_type, type(right))
+        left_column = upcast_column(left_column, data_type, target)
+        if left_column is None:
+            return None
+        right = upcast_literal(right, target)
+    left_truthy = truthy_sql(left_column, data_type)
+    if not right:
+        return "(NOT {})".format(left_truthy), []
+    if isinstance(right, Decimal):
+        right = float(right)
+    elif isinstance(right, bool):
+        right = int(right)
+    return "({} AND {} {} ?)".format(left_truthy, left_column, op), [right]
+
+
+def condition_to_sql(
+    condition,  # type: Any
+    columns,  # type: Dict[Tuple[TableName, FieldName], str]
+    fields,  # type: Dict[Tuple[TableName, FieldName], Field]
+):  # type: (...) -> Optional[Tuple[str, List[Primitive]]]
+    """Translate a where() condition into a parameterized SQL predicate
+
+    :param columns: SQL column name for each field key
+    :param fields: Field for each field key
+    :return: The SQL and its parameters, or None if the condition can't be
+        translated exactly
+    """
+    if not isinstance(condition, Expression):
+        return None
+    if condition.operator in comparison_operators:
+        return comparison_to_sql(condition, columns, fields)
+    if condition.operator in boolean_operators:
+        left = condition_to_sql(condition.operand1, columns, fields)
+        right = condition_to_sql(condition.operand2, columns, fields)
+        if left is None or right is None:
+            return None
+        sql = "({} {} {})".format(
+            left[0], boolean_operators[condition.operator], right[0]
+        )
+        return sql, left[1] + right[1]
+    return None
+
+
+def where_clause(
+    conditions,  # type: Any
+    columns,  # type: Dict[Tuple[TableName, FieldName], str]
+    fields,  # type: Dict[Tuple[TableName, FieldName], Field]
+):  # type: (...) -> Tuple[str, List[Primitive], List[Any]]
+    """Split conditions into a SQL WHERE clause and the ones left for Python
+
+    :return: The WHERE clause ('' if there is none), its parameters and the
+        conditions that have to be applied after the rows are read
+    """
+    predicates, params, residual = [], [], []
+    for condition in list_wrapper(conditions):
+        for conjunct in split_conjuncts(condition):
+            translated = condition_to_sql(conjunct, columns, fields)
+            if translated is None:
+                residual.append(conjunct)
+            else:
+                predicates.append(translated[0])
+                params.extend(translated[1])
+    if predicates:
+        return " WHERE " + " AND ".join(predicates), params, residual
+    return "", params, residual
+
+
+def can_translate(condition, fields):
+    # type: (Any, Dict[Tuple[TableName, FieldName], Field]) -> bool
+    """Can at least part of the condition run as SQL against these fields?"""
+    columns = {key: "c" for key in fields}
+    return any(
+        condition_to_sql(conjunct, columns, fields) is not None
+        for conjunct in split_conjuncts(condition)
+    )
+
+
+# Whole pipelines
+#
+# A plan whose leaves all read from the same sqlite database can be run as one
+# statement.  Each operator is translated into a subquery over its input's
+# subquery.  Every subquery names its columns c0, c1, ... and carries a column
+# 'o' holding the position the Python engine would produce the row in, so
+# stable sorts and first-appearance orders survive the trip through SQL.
+
+Query = NamedTuple(
+    "Query",
+    [
+        ("sql", str),
+        ("params", List[Primitive]),
+        ("columns", Dict[Tuple[TableName, FieldName], str]),
+        ("db_path", str),
+    ],
+)
+
+# Aggregations that SQLite computes exactly like the Python accumulators do
+sql_aggregations = {"max": "MAX", "min": "MIN", "sum": "SUM"}
+
+# SQLite's text for the smallest date, which is what the Python engine sorts
+# and aggregates nulls as
+min_dates = {DataType.Date: "'0001-01-01'", DataType.DateTime: "'0001-01-01 00:00:00'"}
+
+
+def default_sql(column, data_type):  # type: (str, DataType) -> str
+    """SQL for `value or data_type.default`, the value the Python engine sorts by"""
+    if data_type in min_dates:
+        return "COALESCE({}, {})".format(column, min_dates[data_type])
+    elif data_type == DataType.String:
+        return "COALESCE({}, '')".format(column)
+    return "COALESCE({}, 0)".format(column)
+
+
+def template(fmt, **parts):  # type: (str, Tuple[str, List[Primitive]]) -> Tuple[str, List[Primitive]]
+    """Fill a SQL template with (sql, params) parts, ordering the params the
+    way the parts appear in the text"""
+    params = []  # type: List[Primitive]
+    for name in re.findall(r"{(\w+)}", fmt):
+        params.extend(parts[name][1])
+    return fmt.format(**{name: sql for name, (sql, _) in parts.items()}), params
+
+
+# Python's arithmetic converts the right operand to the left operand's type
+# and treats empty operands specially, see messydata.operators.
+arithmetic_templates = {
+    Operator.Add: (
+        "(CASE WHEN {lt} AND {rt} THEN (CASE WHEN typeof({l}) = 'integer' "
+        "THEN {l} + CAST({r} AS INTEGER) ELSE {l} + {r} END) "
+        "WHEN {lt} THEN {l} ELSE {r} END)"
+    ),
+    Operator.Divide: (
+        "(CASE WHEN {lt} AND {rt} THEN CAST({l} AS REAL) / (CASE WHEN "
+        "typeof({l}) = 'integer' THEN CAST({r} AS INTEGER) ELSE {r} END) ELSE 0 END)"
+    ),
+    Operator.Multiply: "(CASE WHEN {lt} AND {rt} THEN CAST({l} AS REAL) * {r} ELSE 0 END)",
+    Operator.Subtract: (
+        "(CASE WHEN {lt} AND {rt} THEN (CASE WHEN typeof({l}) = 'integer' "
+        "THEN {l} - CAST({r} AS INTEGER) ELSE {l} - {r} END) "
+        "WHEN {lt} THEN {l} ELSE -{r} END)"
+    ),
+}
+
+
+def value_truthy_sql(value, kind):  # type: (str, str) -> str
+    if kind == "string":
+        return "COALESCE({}, '') <> ''".format(value)
+    return "COALESCE({}, 0) <> 0".format(value)
+
+
+def value_to_sql(
+    operand,  # type: Any
+    columns,  # type: Dict[Tuple[TableName, FieldName], str]
+    fields,  # type: Dict[Tuple[TableName, FieldName], Field]
+):  # type: (...) -> Optional[Tuple[str, List[Primitive], str]]
+    """Translate an assign() expression
+
+    :return: The SQL, its parameters and whether it's a 'number' or a 'string',
+        or None if the expression can't be translated exactly
+    """
+    if isinstance(operand, CalculatedField):
+        return None
+    elif isinstance(operand, Field):
+        key = (operand.table_name, operand.name)
+        if key not in columns or isinstance(fields[key], CalculatedField):
+            return None
+        data_type = fields[key].data_type
+        if data_type in numeric_types or data_type == DataType.Boolean:
+            return columns[key], [], "number"
+        elif data_type == DataType.String:
+            return columns[key], [], "string"
+        return None
+    elif isinstance(operand, six.string_types):
+        return "?", [operand], "string"
+    elif isinstance(operand, (float, int)) and not isinstance(operand, bool):
+        return "?", [operand], "number"
+    elif not isinstance(operand, Expression):
+        return None
+
+    if operand.operator in comparison_operators or operand.operator in boolean_operators:
+        translated = condition_to_sql(operand, columns, fields)
+        if translated is None:
+            return None
+        return translated[0], translated[1], "number"
+
+    left = value_to_sql(operand.operand1, columns, fields)
+    if left is None:
+        return None
+    if operand.operator == Operator.Negate:
+        if left[2] != "number":
+            return None
+        return "(-{})".format(left[0]), left[1], "number"
+
+    right = value_to_sql(operand.operand2, columns, fields)
+    if right is None or left[2] != right[2]:
+        return None
+    kind = left[2]
+    if kind == "string":
+        if operand.operator != Operator.Add:
+            return None
+        fmt = "(CASE WHEN {lt} AND {rt} THEN {l} || {r} WHEN {lt} THEN {l} ELSE {r} END)"
+    elif operand.operator in arithmetic_templates:
+        fmt = arithmetic_templates[operand.operator]
+    else:
+        return None
+    sql, params = template(
+        fmt,
+        l=left[:2],
+        r=right[:2],
+        lt=(value_truthy_sql(left[0], kind), left[1]),
+        rt=(value_truthy_sql(right[0], kind), right[1]),
+    )
+    return sql, params, kind
+
+
+def qualified(columns, table_alias):
+    # type: (Dict[Tuple[TableName, FieldName], str], str) -> Dict[Tuple[TableName, FieldName], str]
+    return OrderedDict(
+        (key, "{}.{}".format(table_alias, alias)) for key, alias in columns.items()
+    )
+
+
+def select_list(values):  # type: (Sequence[str]) -> str
+    """Name a subquery's values c0, c1, ..."""
+    return ", ".join("{} AS c{}".format(value, i) for i, value in enumerate(values))
+
+
+def renamed(keys):
+    # type: (Iterable[Tuple[TableName, FieldName]]) -> Dict[Tuple[TableName, FieldName], str]
+    return OrderedDict((key, "c{}".format(i)) for i, key in enumerate(keys))
+
+
+def is_plain(key, fields):
+    # type: (Tuple[TableName, FieldName], Dict[Tuple[TableName, FieldName], Field]) -> bool
+    """Calculated values are converted in Python, so SQL can only pass them along"""
+    return not isinstance(fields[key], CalculatedField)
+
+
+def from_sqlite_to_sql(node, inputs):  # type: (Any, List[Query]) -> Optional[Query]
+    table = node.inputs[0].table
+    if table is None or node.args.get("processes") or node.args.get("watermark"):
+        # a parallel scan or a read of new rows only was asked for
+        return None
+    names = OrderedDict(zip(table.fields.keys(), table.sql_fields().keys()))
+    where_sql, params, residual = where_clause(
+        node.args.get("where"), names, table.fields
+    )
+    if residual:
+        return None
+    sql = "SELECT rowid AS o, {} FROM {}{}".format(
+        select_list([names[key] for key in node.fields]),
+        node.args["table_name"],
+        where_sql,
+    )
+    return Query(sql, params, renamed(node.fields), node.args["db_path"])
+
+
+def select_to_sql(node, inputs):  # type: (Any, List[Query]) -> Optional[Query]
+    child = inputs[0]
+    return child._replace(
+        columns=OrderedDict((key, child.columns[key]) for key in node.fields)
+    )
+
+
+def where_to_sql(node, inputs):  # type: (Any, List[Query]) -> Optional[Query]
+    child = inputs[0]
+    where_sql, params, residual = where_clause(
+        node.args["condition"], child.columns, node.inputs[0].fields
+    )
+    if residual:
+        return None
+    sql = "SELECT * FROM ({}){}".format(child.sql, where_sql)
+    return child._replace(sql=sql, params=child.params + params)
+
+
+def order_by_sql(order_by, columns, fields):
+    # type: (List[Tuple[Field, Any]], Dict[Tuple[TableName, FieldName], str], Dict[Tuple[TableName, FieldName], Field]) -> Optional[List[str]]
+    keys = []
+    for fld, direction in order_by:
+        key = (fld.table_name, fld.name)
+        if key not in columns or not is_plain(key, fields):
+            return None
+        sql = default_sql(columns[key], fields[key].data_type)
+        if str(direction) == "desc":
+            sql += " DESC"
+        keys.append(sql)
+    return keys
+
+
+def sort_to_sql(node, inputs):  # type: (Any, List[Query]) -> Optional[Query]
+    child = inputs[0]
+    fields = node.inputs[0].fields
+    columns = qualified(child.columns, "t")
+    keys = order_by_sql(node.args["order_by"], columns, fields)
+    if keys is None:
+        return None
+    sql = "SELECT {}, ROW_NUMBER() OVER (ORDER BY {}) AS o FROM ({}) AS t".format(
+        select_list(columns.values()), ", ".join(keys + ["t.o"]), child.sql
+    )
+    query = Query(sql, child.params, renamed(child.columns), child.db_path)
+    if node.operator == "top":
+        return query._replace(
+            sql="SELECT * FROM ({}) WHERE o <= ?".format(sql),
+            params=query.params + [node.args["n"]],
+        )
+    return query
+
+
+def unique_to_sql(node, inputs):  # type: (Any, List[Query]) -> Optional[Query]
+    child = inputs[0]
+    if not all(is_plain(key, node.fields) for key in child.columns):
+        return None
+    columns = ", ".join(child.columns.values())
+    sql = "SELECT {cols}, MIN(o) AS o FROM ({child}) GROUP BY {cols}".format(
+        cols=columns, child=child.sql
+    )
+    return child._replace(sql=sql)
+
+
+def assign_to_sql(node, inputs):  # type: (Any, List[Query]) -> Optional[Query]
+    child = inputs[0]
+    columns = qualified(child.columns, "t")
+    translated = value_to_sql(node.args["expression"], columns, node.inputs[0].fields)
+    if translated is None:
+        return None
+    calc_key = node.args["key"]
+    values = OrderedDict((key, (value, [])) for key, value in columns.items())
+    values[calc_key] = translated[:2]
+    params = []  # type: List[Primitive]
+    for _, value_params in values.values():
+        params.extend(value_params)
+    sql = "SELECT {}, t.o AS o FROM ({}) AS t".format(
+        select_list([value for value, _ in values.values()]), child.sql
+    )
+    return Query(sql, params + child.params, renamed(values), child.db_path)
+
+
+def pivot_to_sql(node, inputs):  # type: (Any, List[Query]) -> Optional[Query]
+    child = inputs[0]
+    fields = node.inputs[0].fields
+    columns = qualified(child.columns, "t")
+    group_keys = [(fld.table_name, fld.name) for fld in list_wrapper(node.args["group_by_fields"])]
+    aggregations = OrderedDict(
+        ((fld.table_name, fld.name), str(agg).lower())
+        for fld, agg in node.args["aggregations"]
+    )
+    keys = group_keys + list(aggregations)
+    if not group_keys or len(set(keys)) != len(keys):
+        return None
+    if not all(key in columns and is_plain(key, fields) for key in keys):
+        return None
+
+    values = [columns[key] for key in group_keys]
+    for key, agg in aggregations.items():
+        data_type = fields[key].data_type
+        if agg not in sql_aggregations:
+            return None
+        if agg == "sum" and data_type not in numeric_types + (DataType.Boolean,):
+            return None
+        values.append(
+            "{}({})".format(sql_aggregations[agg], default_sql(columns[key], data_type))
+        )
+
+    order = ["MIN(t.o)"]
+    if node.args["sort"] or node.args["strategy"] == "sort":
+        order = [
+            default_sql(columns[key], fields[key].data_type) for key in group_keys
+        ] + order
+    sql = (
+        "SELECT {}, ROW_NUMBER() OVER (ORDER BY {}) AS o "
+        "FROM ({}) AS t GROUP BY {}".format(
+            select_list(values),
+            ", ".join(order),
+            child.sql,
+            ", ".join(columns[key] for key in group_keys),
+        )
+    )
+    return Query(sql, child.params, renamed(keys), child.db_path)
+
+
+def join_to_sql(node, inputs):  # type: (Any, List[Query]) -> Optional[Query]
+    left, right = inputs
+    if left.db_path != right.db_path:
+        return None
+    # Only the key-ordered output of the sort and merge strategies is reproduced
+    if node.args["how"] not in ("inner", "left") or node.args["strategy"] not in (
+        "merge",
+        "sort",
+    ):
+        return None
+    if str(node.args["relationship"].value) not in ("many-to-many", "unenforced"):
+        return None
+
+    left_fields, right_fields = node.inputs[0].fields, node.inputs[1].fields
+    left_columns = qualified(left.columns, "l")
+    right_columns = qualified(right.columns, "r")
+    left_keys = [(fld.table_name, fld.name) for fld in list_wrapper(node.args["left_on"])]
+    right_keys = [(fld.table_name, fld.name) for fld in list_wrapper(node.args["right_on"])]
+    if not all(key in left_columns and is_plain(key, left_fields) for key in left_keys):
+        return None
+    if not all(key in right_columns and is_plain(key, right_fields) for key in right_keys):
+        return None
+
+    # Values on the right win, like they do when the Python engine merges rows
+    values = OrderedDict(
+        (key, right_columns.get(key, left_columns.get(key))) for key in node.fields
+    )
+    on = " AND ".join(
+        "{} IS {}".format(left_columns[lk], right_columns[rk])
+        for lk, rk in zip(left_keys, right_keys)
+    )
+    order = [
+        default_sql(left_columns[key], left_fields[key].data_type) for key in left_keys
+    ] + ["l.o", "r.o"]
+    sql = (
+        "SELECT {}, ROW_NUMBER() OVER (ORDER BY {}) AS o "
+        "FROM ({}) AS l {} JOIN ({}) AS r ON {}".format(
+            select_list(values.values()),
+            ", ".join(order),
+            left.sql,
+            node.args["how"].upper(),
+            right.sql,
+            on,
+        )
+    )
+    return Query(sql, left.params + right.params, renamed(values), left.db_path)
+
+
+translators = {
+    "assign": assign_to_sql,
+    "from_sqlite": from_sqlite_to_sql,
+    "join": join_to_sql,
+    "pivot": pivot_to_sql,
+    "select": select_to_sql,
+    "sort": sort_to_sql,
+    "top": sort_to_sql,
+    "unique": unique_to_sql,
+    "where": where_to_sql,
+}
+
+
+def plan_to_sql(node):  # type: (Any) -> Optional[Query]
+    """Translate a plan into a query, if every part of it can run in SQLite"""
+    translate = translators.get(node.operator)
+    if translate is None:
+        return None
+    inputs = []
+    if node.operator != "from_sqlite":
+        for input_node in node.inputs:
+            query = plan_to_sql(input_node)
+            if query is None:
+                return None
+            inputs.append(query)
+    return translate(node, inputs)
+
+
+def pipeline_sql(query, fields):
+    # type: (Query, Dict[Tuple[TableName, FieldName], Field]) -> str
+    """The statement that reads a translated plan's rows in order
+
+    Date columns are tagged with their type so sqlite3 converts them even when
+    SQLite can't tell where a computed column came from.
+    """
+    values = []
+    for i, (key, fld) in enumerate(fields.items()):
+        if fld.data_type in min_dates and is_plain(key, fields):
+            values.append(
+                '{} AS "c{} [{}]"'.format(
+                    query.columns[key], i, fld.data_type.sqlite_data_type.lower()
+                )
+            )
+        else:
+            values.append("{} AS c{}".format(query.columns[key], i))
+    return "SELECT {} FROM ({}) ORDER BY o".format(", ".join(values), query.sql)
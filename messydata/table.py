@@ -3,21 +3,48 @@ from itertools import chain, groupby, islice
 
 import contextlib
 import csv
+import functools
+import hashlib
+import heapq
 import inspect
+import io
+import json
+import locale
+import math
+import multiprocessing
+import os
 import six
+import struct
+import sys
+import threading
+import time
 from abc import abstractmethod
 from copy import copy
 from enum import Enum
 from six import with_metaclass
 # noinspection PyUnresolvedReferences
 from six.moves import filter
+from six.moves import cPickle as pickle
 from typing import cast
 from uuid import uuid4
 from warnings import warn
 from weakref import WeakValueDictionary
 
+from messydata import sql, vectorized
+from messydata.accessors import FieldAccessors
+from messydata.cache import DiskCache, RowCache, replace_file
+from messydata.compiler import compile_expression
 from messydata.field import *
 from messydata.field import CalculatedField, ExpressionWrapper, Field
+from messydata.plan import (
+    PlanNode,
+    execute,
+    expression_fields,
+    optimize,
+    reads_watermark,
+    sorted_on,
+)
+from messydata.row import row_class, row_combiner, to_row, values_getter
 from messydata.types_ import *
 from messydata.util import *
 
@@ -32,6 +59,42 @@ def concat(*values):  # type: (Sequence[Primitive]) -> str
     return ""
 
 
+def concat_step(state, value):  # type: (Set[str], Primitive) -> Set[str]
+    if value:
+        state.add(str(value))
+    return state
+
+
+def concat_result(state):  # type: (Set[str]) -> str
+    return ", ".join(sorted(state))
+
+
+def first_step(state, value):  # type: (Primitive, Primitive) -> Primitive
+    return value if state is None else state
+
+
+def identity(state):  # type: (Any) -> Any
+    return state
+
+
+def max_step(state, value):  # type: (Primitive, Primitive) -> Primitive
+    return value if state is None or value > state else state
+
+
+def min_step(state, value):  # type: (Primitive, Primitive) -> Primitive
+    return value if state is None or value < state else state
+
+
+Accumulator = NamedTuple(
+    "Accumulator",
+    [
+        ("initial", Callable[[], Any]),
+        ("step", Callable[[Any, Primitive], Any]),
+        ("result", Callable[[Any], Primitive]),
+    ],
+)
+
+
 class AggregationMethod(Enum):
     Concat = "concat"
     First = "first"
@@ -44,14 +107,12 @@ class AggregationMethod(Enum):
     def fn(self):
         # type: (...) -> Callable[[Sequence[Primitive]], Primitive]
         """Method to apply the aggregation (e.g. sum)"""
-        return {
-            AggregationMethod.Concat: concat,
-            AggregationMethod.First: lambda rows: next(iter(rows)),
-            AggregationMethod.Last: lambda rows: list_wrapper(rows)[-1],
-            AggregationMethod.Max: max,
-            AggregationMethod.Min: min,
-            AggregationMethod.Sum: sum,
-        }[self]
+        return aggregation_functions[self]
+
+    @property
+    def accumulator(self):  # type: (...) -> Accumulator
+        """Incremental version of fn that folds in one value at a time"""
+        return aggregation_accumulators[self]
 
     @staticmethod
     def by_name(name):  # type: (str) -> "AggregationMethod"
@@ -70,6 +131,27 @@ class AggregationMethod(Enum):
         return self.value
 
 
+aggregation_functions = {
+    AggregationMethod.Concat: concat,
+    AggregationMethod.First: lambda rows: next(iter(rows)),
+    AggregationMethod.Last: lambda rows: list_wrapper(rows)[-1],
+    AggregationMethod.Max: max,
+    AggregationMethod.Min: min,
+    AggregationMethod.Sum: sum,
+}
+
+aggregation_accumulators = {
+    AggregationMethod.Concat: Accumulator(set, concat_step, concat_result),
+    AggregationMethod.First: Accumulator(lambda: None, first_step, identity),
+    AggregationMethod.Last: Accumulator(lambda: None, lambda state, value: value, identity),
+    AggregationMethod.Max: Accumulator(lambda: None, max_step, identity),
+    AggregationMethod.Min: Accumulator(lambda: None, min_step, identity),
+    AggregationMethod.Sum: Accumulator(
+        lambda: 0, lambda state, value: state + value, identity
+    ),
+}
+
+
 class JoinRelationship(Enum):
     ManyToMany = "many-to-many"
     ManyToOne = "many-to-one"
@@ -138,33 +220,471 @@ def new_table_name(base_name):  # type: (str) -> str
     return "{}_id{}".format(strip_id(base_name), uuid)
 
 
+def row_values(table, args, kwargs):
+    # type: (Tbl, Sequence[Primitive], Dict[str, Primitive]) -> Sequence[Primitive]
+    """Values for each of a table's fields from positional and keyword arguments"""
+    keys = tuple(table.fields.keys())
+    if kwargs or len(args) < len(keys):
+        row = OrderedDict(zip(keys, args))
+        row.update(OrderedDict(((table.__name__, k), v) for k, v in kwargs.items()))
+        return [row[fld_name] for fld_name in keys]
+    return args
+
+
 def row_wrapper(table):  # type: (Tbl) -> Callable[[...], Row]
+    new_row = table.accessors.row_class
+
     def wrapper(*args, **kwargs):  # type: (...) -> Row
-        row = OrderedDict(zip(table.fields.keys(), args))
-        row.update(kwargs)
-        return row
+        return new_row(islice(row_values(table, args, kwargs), len(new_row._keys)))
 
     return wrapper
 
 
 def row_wrapper_typed(table, ignore_errors=False):
     # type: (Tbl, bool) -> Callable[[...], Row]
-    converters = {
-        fld_name: fld.data_type.converter(ignore_errors)
-        for fld_name, fld in table.fields.items()
-    }
+    new_row = table.accessors.row_class
+    converters = table.accessors.converters_for(ignore_errors)
 
     def wrapper(*args, **kwargs):  # type: (...) -> Row
-        row = OrderedDict(zip(table.fields.keys(), args))
-        row.update(OrderedDict(((table.__name__, k), v) for k, v in kwargs.items()))
-        return OrderedDict(
-            (fld_name, converters[fld_name](row[fld_name]))
-            for fld_name in table.fields.keys()
+        return new_row(
+            [
+                convert(value)
+                for convert, value in zip(converters, row_values(table, args, kwargs))
+            ]
         )
 
     return wrapper
 
 
+def row_wrapper_subset(table, fields, ignore_errors=False):
+    # type: (Tbl, Dict[Tuple[TableName, FieldName], Field], bool) -> Callable[[...], Row]
+    """Like row_wrapper_typed, but only converts and keeps the cells of some fields"""
+    positions = table.accessors.positions
+    converters = table.accessors.converters_for(ignore_errors)
+    converters = [(positions[key], converters[positions[key]]) for key in fields]
+    new_row = row_class(fields.keys())
+
+    def wrapper(*args):  # type: (...) -> Row
+        return new_row([convert(args[pos]) for pos, convert in converters])
+
+    return wrapper
+
+
+def field_subset(
+    fields,  # type: Dict[Tuple[TableName, FieldName], Field]
+    keys,  # type: Set[Tuple[TableName, FieldName]]
+):  # type: (...) -> Dict[Tuple[TableName, FieldName], Field]
+    """The fields whose keys are in a set, in their original order"""
+    return OrderedDict((key, fld) for key, fld in fields.items() if key in keys)
+
+
+# Bytes of a .csv each process parses at a time when from_csv runs in parallel
+csv_chunk_size = 16 * 1024 * 1024
+
+
+def text_lines(raw):  # type: (io.RawIOBase) -> Iterable[str]
+    """Lines of a binary file as csv.reader wants them"""
+    if six.PY2:
+        return raw
+    return io.TextIOWrapper(raw)
+
+
+def csv_byte_ranges(file_path, has_header, chunk_size):
+    # type: (str, bool, int) -> Tuple[int, List[Tuple[int, int]]]
+    """Split a .csv into ranges of bytes that start and end on line boundaries
+
+    :return: the offset the rows start at, and the (start, end) of each range
+    """
+    with open(file_path, mode="rb") as fh:
+        if has_header:
+            fh.readline()
+        first_row = start = fh.tell()
+        fh.seek(0, 2)
+        size = fh.tell()
+        ranges = []
+        while start < size:
+            fh.seek(start + chunk_size - 1)
+            fh.readline()
+            end = min(fh.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return first_row, ranges
+
+
+def has_unbalanced_quotes(task):  # type: (Tuple[str, int, int]) -> bool
+    """Whether any line in a range of a .csv has an odd number of quotes
+
+    A quoted field with a newline in it starts on such a line, so a range of
+    lines without any can be parsed on its own.  (A quote inside an unquoted
+    field is reported too, which only costs a serial read.)
+    """
+    file_path, start, end = task
+    with open(file_path, mode="rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    if b'"' not in data:
+        return False
+    return any(line.count(b'"') % 2 for line in data.split(b"\n"))
+
+
+def read_csv_chunk(task):
+    # type: (Tuple[Tbl, Optional[List[Tuple[TableName, FieldName]]], str, int, int, bool]) -> List[Tuple[Primitive, ...]]
+    """Parse and convert the rows in a range of a .csv, in a worker process
+
+    :return: the values of each row, which are cheaper to send back than rows
+    """
+    table, keys, file_path, start, end, ignore_errors = task
+    if keys is None:
+        mapper = row_wrapper_typed(table=table, ignore_errors=ignore_errors)
+    else:
+        mapper = row_wrapper_subset(
+            table=table,
+            fields=field_subset(table.fields, set(keys)),
+            ignore_errors=ignore_errors,
+        )
+    with open(file_path, mode="rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    reader = csv.reader(text_lines(io.BytesIO(data)))
+    return [mapper(*row).values() for row in reader]
+
+
+# Rowids each process reads at a time when from_sqlite runs in parallel
+sqlite_range_size = 100000
+
+# Rows fetched from a cursor at a time by a parallel from_sqlite
+sqlite_fetch_size = 1000
+
+
+def connect_read_only(db_path):  # type: (str) -> sqlite3.Connection
+    """A connection that can't write to the database, e.g. from a worker"""
+    detect_types = sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+    if six.PY2:
+        return sqlite3.connect(database=db_path, detect_types=detect_types)
+    uri = "file:{}?mode=ro".format(
+        six.moves.urllib.request.pathname2url(os.path.abspath(db_path))
+    )
+    return sqlite3.connect(database=uri, detect_types=detect_types, uri=True)
+
+
+def rowid_ranges(db_path, table_name, range_size):
+    # type: (str, str, int) -> List[Tuple[int, int]]
+    """Split the rowids of a sqlite table into (first, last) ranges"""
+    with contextlib.closing(connect_read_only(db_path)) as con:
+        first, last = con.execute(
+            "SELECT MIN(rowid), MAX(rowid) FROM {}".format(table_name)
+        ).fetchone()
+    if first is None:
+        return []
+    return [
+        (start, min(start + range_size - 1, last))
+        for start in six.moves.range(first, last + 1, range_size)
+    ]
+
+
+def read_sqlite_range(task):
+    # type: (Tuple[int, str, str, List[Primitive]]) -> Tuple[int, List[Tuple[Primitive, ...]]]
+    """Read the rows of a query over a range of rowids, in a worker process"""
+    index, db_path, query, params = task
+    rows = []  # type: List[Tuple[Primitive, ...]]
+    with contextlib.closing(connect_read_only(db_path)) as con:
+        cur = con.execute(query, params)
+        while True:
+            batch = cur.fetchmany(sqlite_fetch_size)
+            if not batch:
+                break
+            rows.extend(batch)
+    return index, rows
+
+
+def read_state(path):  # type: (str) -> Optional[Dict[str, Any]]
+    """What a checkpoint or watermark file holds, None if it's missing or garbled"""
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_state(path, state):  # type: (str, Dict[str, Any]) -> None
+    temp_path = path + ".tmp"
+    with open(temp_path, mode="w") as fh:
+        json.dump(state, fh)
+    replace_file(temp_path, path)
+
+
+def load_checkpoint(checkpoint, key):  # type: (str, Dict[str, Any]) -> Set[int]
+    """The ranges a scan with the same key finished, according to its checkpoint"""
+    saved = read_state(checkpoint)
+    if saved is None or saved.get("key") != key:
+        return set()
+    return set(saved["done"])
+
+
+def save_checkpoint(checkpoint, key, done):
+    # type: (str, Dict[str, Any], Set[int]) -> None
+    write_state(checkpoint, {"key": key, "done": sorted(done)})
+
+
+def load_watermark(watermark, source):  # type: (str, Dict[str, Any]) -> Any
+    """How far the last read of the same source got, None if it's not known"""
+    saved = read_state(watermark)
+    if saved is None or saved.get("source") != source:
+        return None
+    return saved["watermark"]
+
+
+def save_watermark(watermark, source, value):
+    # type: (str, Dict[str, Any], Any) -> None
+    write_state(watermark, {"source": source, "watermark": value})
+
+
+def csv_tail(file_path, has_header, watermark):
+    # type: (str, bool, str) -> Tuple[Dict[str, Any], int, int]
+    """The bytes of a .csv that were appended since the watermark was saved
+
+    A last line without a line break is left for the next run, as it may
+    still be being written.  If the file was replaced (its first line is
+    different) or truncated, it's read from the start.
+
+    :return: what identifies the file in its watermark, and the (start, end)
+        offsets of the new lines
+    """
+    with open(file_path, mode="rb") as fh:
+        first_line = fh.readline()
+        first_row = fh.tell() if has_header else 0
+        fh.seek(0, 2)
+        end = fh.tell()
+        while end > first_row:
+            step = min(64 * 1024, end - first_row)
+            fh.seek(end - step)
+            block = fh.read(step)
+            if block.endswith(b"\n"):
+                break
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                end = end - step + newline + 1
+                break
+            end -= step
+    source = {
+        "file_path": os.path.abspath(file_path),
+        "first_line": hashlib.sha1(first_line).hexdigest(),
+    }
+    start = load_watermark(watermark, source)
+    if start is None or not first_row <= start <= end:
+        start = first_row
+    return source, start, end
+
+
+def csv_lines(file_path, start, end):  # type: (str, int, int) -> Iterator[str]
+    """Lines of a .csv between two offsets, as csv.reader wants them"""
+    encoding = locale.getpreferredencoding(False)
+    with open(file_path, mode="rb") as fh:
+        fh.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            line = fh.readline(remaining)
+            if not line:
+                break
+            remaining -= len(line)
+            yield line if six.PY2 else line.decode(encoding)
+
+
+def parallel_sqlite_rows(
+    db_path,  # type: str
+    table_name,  # type: str
+    select_sql,  # type: str
+    where_sql,  # type: str
+    params,  # type: List[Primitive]
+    fields,  # type: Dict[Tuple[TableName, FieldName], Field]
+    predicates,  # type: List[Callable[[Row], Primitive]]
+    processes,  # type: int
+    ordered,  # type: bool
+    checkpoint,  # type: Optional[str]
+):  # type: (...) -> Rows
+    """Read a sqlite table in ranges of rowids, each by a process of a pool
+
+    :param select_sql: SELECT ... FROM ... without a WHERE clause
+    :param where_sql: WHERE clause of the conditions SQLite applies, or ''
+    :param predicates: Conditions applied to the rows as they're read
+    :param checkpoint: Path of a file recording the ranges whose rows have all
+        been yielded.  A scan of the same query with the same checkpoint skips
+        them, so a scan that failed can be resumed.  It's deleted once the
+        scan finishes, or once the rows stop being read before then.
+    """
+    ranges = rowid_ranges(db_path, table_name, sqlite_range_size)
+    range_sql = "{} WHERE rowid BETWEEN ? AND ?".format(select_sql)
+    if where_sql:
+        range_sql += " AND ({})".format(where_sql[len(" WHERE "):])
+    # what the checkpoint has to match, as it reads back from json
+    key = {
+        "sql": range_sql,
+        "params": [repr(param) for param in params],
+        "ranges": [list(rowids) for rowids in ranges],
+    }
+    done = set()  # type: Set[int]
+    if checkpoint is not None:
+        done = load_checkpoint(checkpoint, key)
+    tasks = [
+        (index, db_path, range_sql, [first, last] + list(params))
+        for index, (first, last) in enumerate(ranges)
+        if index not in done
+    ]
+    new_row = row_class(fields.keys())
+    pool = multiprocessing.Pool(processes)
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for index, rows in imap(read_sqlite_range, tasks, chunksize=1):
+            for values in rows:
+                row = new_row(values)
+                if all(predicate(row) for predicate in predicates):
+                    yield row
+            if checkpoint is not None:
+                done.add(index)
+                save_checkpoint(checkpoint, key, done)
+    except GeneratorExit:
+        # The consumer stopped early (head(), ...) rather than the scan
+        # failing, so a later scan has to read every range again
+        if checkpoint is not None and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        raise
+    finally:
+        pool.terminate()
+        pool.join()
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+# Data types whose values sqlite3 stores as they are, or as plain numbers, so
+# that SQLite finds them in a json array whenever Python finds them equal
+key_list_types = (
+    DataType.Boolean,
+    DataType.Currency,
+    DataType.Float,
+    DataType.Int,
+    DataType.String,
+)
+
+_sqlite_has_json = None  # type: Optional[bool]
+
+
+def sqlite_has_json():  # type: () -> bool
+    """Does the sqlite library have json_each() (built in since 3.38)?"""
+    global _sqlite_has_json
+    if _sqlite_has_json is None:
+        with contextlib.closing(sqlite3.connect(":memory:")) as con:
+            try:
+                con.execute("SELECT value FROM json_each('[]')").fetchall()
+                _sqlite_has_json = True
+            except sqlite3.OperationalError:
+                _sqlite_has_json = False
+    return _sqlite_has_json
+
+
+def key_list_clause(column, fld, values):
+    # type: (str, Field, Iterable[Tuple[Primitive, ...]]) -> Optional[Tuple[str, List[Primitive]]]
+    """Condition keeping the rows whose column has one of the values of a set
+    of one-field keys, None if SQLite can't be trusted to compare them
+
+    The values are passed as a single json array read by json_each(), so
+    there's no limit on how many there are.  A null key keeps the rows where
+    the column is null, as joins match nulls to nulls.
+    """
+    if fld.data_type not in key_list_types or not sqlite_has_json():
+        return None
+    convert = fld.data_type.sqlite_converter
+    listed, has_null = [], False
+    for (value,) in values:
+        if value is None:
+            has_null = True
+            continue
+        try:
+            converted = convert(value)
+        except (TypeError, ValueError, ArithmeticError):
+            return None
+        # the Int converter stores 0 as a null, but a 0 already in the
+        # database still has to be found
+        if converted is not None:
+            value = converted
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            return None
+        if not isinstance(value, (bool, float, six.integer_types, six.string_types)):
+            return None
+        listed.append(value)
+    condition = "{} IN (SELECT value FROM json_each(?))".format(column)
+    if has_null:
+        condition = "({} OR {} IS NULL)".format(condition, column)
+    return condition, [json.dumps(listed)]
+
+
+def parallel_csv_rows(
+    table,  # type: Tbl
+    file_path,  # type: str
+    fields,  # type: Dict[Tuple[TableName, FieldName], Field]
+    has_header,  # type: bool
+    ignore_errors,  # type: bool
+    subset,  # type: bool
+    processes,  # type: int
+    ordered,  # type: bool
+):  # type: (...) -> Rows
+    """Read a .csv in ranges of lines parsed by a pool of processes
+
+    The file is first scanned (in parallel too) for quoted fields spanning
+    lines.  The ranges before the first line that may start one are parsed by
+    the pool, and everything from that line on is read in this process, so a
+    quoted newline never lands on the boundary of a range.
+
+    :param subset: Only convert and keep the cells of `fields`
+    :param ordered: Yield the rows in file order, rather than as the ranges
+        are parsed
+    """
+    first_row, ranges = csv_byte_ranges(file_path, has_header, csv_chunk_size)
+    if has_header and has_unbalanced_quotes((file_path, 0, first_row)):
+        ranges, serial_start = [], 0
+    else:
+        serial_start = None
+    new_row = row_class(fields.keys())
+    pool = multiprocessing.Pool(processes)
+    try:
+        if ranges:
+            unbalanced = pool.map(
+                has_unbalanced_quotes,
+                [(file_path, start, end) for start, end in ranges],
+                chunksize=1,
+            )
+            if any(unbalanced):
+                first = unbalanced.index(True)
+                serial_start = ranges[first][0]
+                ranges = ranges[:first]
+
+        keys = list(fields.keys()) if subset else None
+        tasks = [
+            (table, keys, file_path, start, end, ignore_errors) for start, end in ranges
+        ]
+        imap = pool.imap if ordered else pool.imap_unordered
+        for chunk in imap(read_csv_chunk, tasks, chunksize=1):
+            for values in chunk:
+                yield new_row(values)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if serial_start is not None:
+        if subset:
+            mapper = row_wrapper_subset(
+                table=table, fields=fields, ignore_errors=ignore_errors
+            )
+        else:
+            mapper = row_wrapper_typed(table=table, ignore_errors=ignore_errors)
+        with open(file_path, mode="rb") as fh:
+            fh.seek(serial_start)
+            reader = csv.reader(text_lines(fh))
+            if has_header and serial_start == 0:
+                next(reader)  # skip the header
+            for row in reader:
+                yield mapper(*row)
+
+
 tables = WeakValueDictionary()  # type: Dict[TableName, Tbl]
 
 
@@ -190,7 +710,9 @@ class Schema(type):
                 fld.name = fld_name
                 fld.table_name = class_name
                 cls.fields[(class_name, fld_name)] = fld
+            cls.plan = PlanNode("table", fields=cls.fields, table=cls)
 
+        cls.accessors = FieldAccessors(cls.fields)
         cls.row_wrapper = staticmethod(row_wrapper(cls))
         cls.row_wrapper_typed = staticmethod(row_wrapper_typed(cls))
 
@@ -203,6 +725,26 @@ class Table(with_metaclass(Schema, object)):
 
     fields = {}  # type: Dict[Tuple[TableName, FieldName], Field]
 
+    # Converters, defaults and key getters of the fields, built with the class
+    accessors = None  # type: FieldAccessors
+
+    # Set on sorted tables so that a limit above the sort can take the first n
+    # rows with a bounded heap instead of sorting every row.
+    _top_rows = None  # type: Optional[Callable[..., List[Row]]]
+
+    # Set on sqlite sources so that a prefiltered join can have SQLite skip
+    # the rows whose key the other side doesn't have.  Returns None when it
+    # can't for that key.
+    _semi_join_rows = None  # type: Optional[Callable[..., Optional[Rows]]]
+
+    # How the rows of the table are produced (see messydata.plan), and the
+    # table built from the optimized version of that plan.
+    plan = None  # type: PlanNode
+    _optimized = None  # type: Optional[Tbl]
+
+    # Rows kept in memory by cache()
+    row_cache = None  # type: Optional[RowCache]
+
     def __new__(cls, *args, **kwargs):  # type: (...) -> Row
         return cls.row_wrapper_typed(*args, **kwargs)
 
@@ -226,19 +768,106 @@ class Table(with_metaclass(Schema, object)):
             data_type=data_type,
         )
 
+        key = ("Calculation", calc_fld.name)
         flds = copy(cls.fields)
-        flds[("Calculation", calc_fld.name)] = calc_fld
+        flds[key] = calc_fld
+        calculate = compile_expression(calc_fld)
+        calculate_batches = vectorized.batch_calculator(calc_fld._expression, calculate)
+        converter = calc_fld.data_type.converter(ignore_errors=True)
+        new_row = row_class(flds.keys())
+        if key in cls.fields:
+            # The calculation replaces an earlier one with the same name
+            get_values = values_getter(k for k in cls.fields.keys() if k != key)
+            pos = list(flds.keys()).index(key)
+
+            def add_value(row, value):  # type: (Row, Primitive) -> Row
+                values = get_values(row)
+                return new_row(values[:pos] + (value,) + values[pos:])
+
+        else:
+            get_values = values_getter(cls.fields.keys())
+
+            def add_value(row, value):  # type: (Row, Primitive) -> Row
+                return new_row(get_values(row) + (value,))
 
         def rows(**kwargs):  # type: (...) -> Rows
+            if calculate_batches is not None:
+                for batch, values in calculate_batches(cls.rows(**kwargs)):
+                    for row in six.moves.map(
+                        add_value, batch, six.moves.map(converter, values)
+                    ):
+                        yield row
+                return
             for row in cls.rows(**kwargs):
-                calculated_value = calc_fld(row)
-                converted_value = calc_fld.data_type.converter(ignore_errors=True)(
-                    calculated_value
-                )
-                row[("Calculation", calc_fld.name)] = converted_value
-                yield row
+                yield add_value(row, converter(calculate(row)))
 
-        return new_table(base_name=cls.__name__, fields=flds, rows_method=rows)
+        return new_table(
+            base_name=cls.__name__,
+            fields=flds,
+            rows_method=rows,
+            plan=PlanNode(
+                "assign",
+                inputs=[cls.plan],
+                args={
+                    "display_name": display_name,
+                    "expression": expression,
+                    "description": description,
+                    "data_type": calc_fld.data_type,
+                    "key": key,
+                },
+                fields=flds,
+            ),
+        )
+
+    @classmethod
+    def cache(
+        cls,
+        max_rows=None,  # type: Optional[int]
+        directory=None,  # type: Optional[str]
+        max_bytes=None,  # type: Optional[int]
+        hash_sources=False,  # type: bool
+    ):  # type: (...) -> Tbl
+        """Keep the rows of the table in memory once they've been produced
+
+        The rows are materialized once per distinct set of rows(**kwargs), and
+        reading them again skips the table's plan until the cache is
+        invalidated (see invalidate()).
+
+        :param max_rows: Most rows to hold across every set of kwargs.  The
+            least recently read results are evicted to stay under it.
+        :param directory: Also write the rows to files in this folder, so other
+            processes replay them while the .csv and sqlite files the table is
+            built from are unchanged.  Every source of the table must be one of
+            those files.
+        :param max_bytes: Size to keep the directory's files under.  The least
+            recently read ones are deleted to stay under it.
+        :param hash_sources: Tell whether a source changed by hashing it
+            rather than by its size and modification time
+        """
+        disk = None
+        if directory is not None:
+            disk = DiskCache(
+                directory, cls.plan, max_bytes=max_bytes, hash_sources=hash_sources
+            )
+        row_cache = RowCache(cls.rows, max_rows=max_rows, disk=disk)
+        new_tbl = new_table(
+            base_name=cls.__name__,
+            fields=cls.fields,
+            rows_method=row_cache.rows,
+            plan=PlanNode(
+                "cache",
+                inputs=[cls.plan],
+                args={
+                    "max_rows": max_rows,
+                    "directory": directory,
+                    "max_bytes": max_bytes,
+                    "hash_sources": hash_sources,
+                },
+                fields=cls.fields,
+            ),
+        )
+        new_tbl.row_cache = row_cache
+        return new_tbl
 
     @classmethod
     def describe(cls):  # type: () -> List[Dict[str, str]]
@@ -254,6 +883,16 @@ class Table(with_metaclass(Schema, object)):
             for _, fld in sorted(cls.fields.items())
         ]
 
+    @classmethod
+    def explain(cls, optimized=True):  # type: (bool) -> str
+        """Describe the plan that produces the table's rows, one operator per line
+
+        :param optimized: Show the plan after it has been rewritten by the optimizer
+        """
+        if optimized:
+            return optimize(cls.plan).explain()
+        return cls.plan.explain()
+
     @classmethod
     def field_display_names(cls):  # type: () -> List[str]
         return dedupe_field_names(cls.fields)
@@ -280,14 +919,198 @@ class Table(with_metaclass(Schema, object)):
         return new_table(
             base_name=cls.__name__,
             fields=cls.fields,
-            rows_method=rows_method
+            rows_method=rows_method,
+            plan=PlanNode(
+                "from_iterable",
+                inputs=[cls.plan],
+                args={"rows": rows},
+                fields=cls.fields,
+            ),
+        )
+
+    @classmethod
+    def from_sqlite(
+        cls,
+        db_path,  # type: str
+        table_name,  # type: str
+        where=None,  # type: Optional[Union[Any, List[Any]]]
+        columns=None,  # type: Optional[List[Field]]
+        processes=None,  # type: Optional[int]
+        ordered=True,  # type: bool
+        checkpoint=None,  # type: Optional[str]
+        watermark=None,  # type: Optional[str]
+        watermark_field=None,  # type: Optional[Field]
+    ):  # type: (...) -> Tbl
+        """Read the rows of a table in a sqlite database
+
+        :param where: One or more conditions to filter the rows by.  Comparisons
+            of fields to literals or other fields (combined with & and |) are run
+            by SQLite, anything else is applied to the rows as they're read.
+        :param columns: Only read these fields.  Fields needed by conditions that
+            are applied in Python are read as well.
+        :param processes: Read ranges of rowids in a pool of this many
+            processes, each with its own read-only connection.  The table
+            needs rowids.
+        :param ordered: With processes, yield the rows in rowid order.  False
+            yields the rows of each range as soon as it's been read.
+        :param checkpoint: With processes, path of a file recording the ranges
+            read so far, so a scan that failed resumes after them.
+        :param watermark: Path of a file holding the largest rowid (or value of
+            watermark_field) the last run got to.  Only rows above it are
+            read, and it's moved once every row has been read.  Every read of
+            the table gets the rows that were new when it was first read, so
+            call from_sqlite() again for the rows added since.
+        :param watermark_field: A field whose values only grow as rows are
+            added, like an insert timestamp, to use instead of the rowid.  Rows
+            added later with the value the watermark is at are skipped.
+        """
+        column_names = OrderedDict(zip(cls.fields.keys(), cls.sql_fields().keys()))
+        where_sql, params, residual = sql.where_clause(
+            conditions=where, columns=column_names, fields=cls.fields
+        )
+        predicates = [compile_expression(condition) for condition in residual]
+        if columns is None:
+            fields = cls.fields
+        else:
+            keys = {(fld.table_name, fld.name) for fld in columns}
+            for condition in residual:
+                keys |= expression_fields(condition) or set(cls.fields)
+            fields = field_subset(cls.fields, keys)
+        select_sql = "SELECT {flds} FROM {tbl}".format(
+            flds=", ".join(column_names[key] for key in fields), tbl=table_name
+        )
+        if watermark_field is None:
+            watermark_column = "rowid"
+        else:
+            watermark_column = column_names[
+                (watermark_field.table_name, watermark_field.name)
+            ]
+        source = {
+            "db_path": os.path.abspath(db_path),
+            "table_name": table_name,
+            "column": watermark_column,
+        }
+        pinned = {}  # type: Dict[str, Any]
+
+        def read(key_sql, key_params, **kwargs):
+            # type: (str, List[Primitive], Any) -> Generator[Row, None, None]
+            row_where_sql, row_params = where_sql, params
+            if watermark is not None:
+                if "bounds" not in pinned:
+                    with contextlib.closing(connect_read_only(db_path)) as con:
+                        max_sql = "SELECT MAX({}) FROM {}".format(
+                            watermark_column, table_name
+                        )
+                        latest = con.execute(max_sql).fetchone()[0]
+                    pinned["bounds"] = load_watermark(watermark, source), latest
+                previous, latest = pinned["bounds"]
+                if latest is None or latest == previous:
+                    return
+                # rows added while these are read are left for the next run
+                bounds, bound_params = ["{} <= ?".format(watermark_column)], [latest]
+                if previous is not None:
+                    bounds.insert(0, "{} > ?".format(watermark_column))
+                    bound_params.insert(0, previous)
+                row_where_sql = "{} {}".format(
+                    where_sql + " AND" if where_sql else " WHERE", " AND ".join(bounds)
+                )
+                row_params = list(params) + bound_params
+            if key_sql:
+                row_where_sql = "{} {}".format(
+                    row_where_sql + " AND" if row_where_sql else " WHERE", key_sql
+                )
+                row_params = list(row_params) + key_params
+            if processes and processes > 1:
+                for row in parallel_sqlite_rows(
+                    db_path=db_path,
+                    table_name=table_name,
+                    select_sql=select_sql,
+                    where_sql=row_where_sql,
+                    params=row_params,
+                    fields=fields,
+                    predicates=predicates,
+                    processes=processes,
+                    ordered=ordered,
+                    checkpoint=checkpoint,
+                ):
+                    yield row
+            else:
+                with contextlib.closing(
+                    sqlite3.connect(
+                        database=db_path,
+                        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                    )
+                ) as con:
+                    cur = con.cursor()
+                    cur.execute(select_sql + row_where_sql, row_params)
+                    new_row = row_class(fields.keys())
+                    for row in cur:
+                        row = new_row(row)
+                        if all(predicate(row) for predicate in predicates):
+                            yield row
+            if watermark is not None and "saved" not in pinned:
+                save_watermark(watermark, source, latest)
+                pinned["saved"] = True
+
+        def rows(**kwargs):  # type: (...) -> Generator[Row, None, None]
+            return read("", [], **kwargs)
+
+        def semi_join_rows(key, values, **kwargs):
+            # type: (Tuple[Tuple[TableName, FieldName], ...], Iterable[Tuple[Primitive, ...]], Any) -> Optional[Rows]
+            if len(key) != 1 or key[0] not in fields:
+                return None
+            clause = key_list_clause(column_names[key[0]], fields[key[0]], values)
+            if clause is None:
+                return None
+            return read(clause[0], clause[1], **kwargs)
+
+        sqlite_tbl = new_table(
+            base_name=cls.__name__,
+            fields=fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "from_sqlite",
+                inputs=[cls.plan],
+                args={
+                    "db_path": db_path,
+                    "table_name": table_name,
+                    "where": where,
+                    "columns": columns,
+                    "processes": processes,
+                    "ordered": ordered,
+                    "checkpoint": checkpoint,
+                    "watermark": watermark,
+                    "watermark_field": watermark_field,
+                },
+                fields=fields,
+            ),
         )
+        sqlite_tbl._semi_join_rows = staticmethod(semi_join_rows)
+        return sqlite_tbl
 
     @classmethod
-    def from_sqlite(cls, db_path, table_name):  # type: (str, str) -> Tbl
-        sql_fields = cls.sql_fields()
-        field_list = ", ".join(sql_fields.keys())
-        select_sql = "SELECT {flds} FROM {tbl}".format(flds=field_list, tbl=table_name)
+    def from_sqlite_query(
+        cls,
+        db_path,  # type: str
+        query,  # type: str
+        params,  # type: List[Primitive]
+        columns,  # type: List[Field]
+    ):  # type: (...) -> Tbl
+        """Read the rows of a query against a sqlite database
+
+        The optimizer uses this to run plans that only read from one database as
+        a single statement.
+
+        :param columns: Fields of the query's columns, in order.  Values of
+            calculated fields are converted to their data type as they're read.
+        """
+        fields = OrderedDict(((fld.table_name, fld.name), fld) for fld in columns)
+        converters = [
+            fld.data_type.converter(ignore_errors=True)
+            if isinstance(fld, CalculatedField)
+            else None
+            for fld in columns
+        ]
 
         def rows(**kwargs):  # type: (...) -> Generator[Row, None, None]
             with contextlib.closing(
@@ -297,16 +1120,56 @@ class Table(with_metaclass(Schema, object)):
                 )
             ) as con:
                 cur = con.cursor()
-                cur.execute(select_sql)
+                cur.execute(query, params)
+                new_row = row_class(fields.keys())
                 for row in cur:
-                    yield OrderedDict(zip(cls.fields.keys(), row))
+                    yield new_row(
+                        [
+                            convert(value) if convert else value
+                            for value, convert in zip(row, converters)
+                        ]
+                    )
 
-        return new_table(base_name=cls.__name__, fields=cls.fields, rows_method=rows)
+        return new_table(
+            base_name=cls.__name__,
+            fields=fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "from_sqlite_query",
+                inputs=[cls.plan],
+                args={
+                    "db_path": db_path,
+                    "query": query,
+                    "params": params,
+                    "columns": columns,
+                },
+                fields=fields,
+            ),
+        )
 
     @classmethod
     def head(cls, n=5, **kwargs):  # type: (...) -> List[Row]
         """Return the first n rows of a table"""
-        return list(islice(cls.display_rows(**kwargs), n))
+        if cls._top_rows is None:
+            return list(islice(cls.display_rows(**kwargs), n))
+        display_names = cls.field_display_names()
+        return [
+            OrderedDict(zip(display_names, row.values()))
+            for row in cls._top_rows(n, **kwargs)
+        ]
+
+    @classmethod
+    def invalidate(cls, **kwargs):  # type: (...) -> None
+        """Drop the cached rows of every cache() the table is built on
+
+        :param kwargs: Only drop the rows cached for these rows(**kwargs)
+        """
+        nodes = [cls.plan]
+        while nodes:
+            node = nodes.pop()
+            if node.operator == "cache":
+                node.table.row_cache.invalidate(**kwargs)
+            nodes.extend(node.inputs)
 
     @classmethod
     def join(
@@ -316,13 +1179,48 @@ class Table(with_metaclass(Schema, object)):
         right_on,  # type: Field
         how="inner",  # type: str
         relationship=JoinRelationship.Unenforced,  # type: JoinRelationship
+        strategy="sort",  # type: str
+        prefilter=None,  # type: Optional[str]
     ):  # type: (...) -> Tbl
-        """Create a table as a combination of two tables"""
+        """Create a table as a combination of two tables
+
+        :param strategy: 'sort' groups both sides in key order, 'hash' builds a
+            lookup on the smaller side and streams the larger side through it,
+            'merge' walks two sides that are already in ascending key order
+            side by side, holding one key's rows at a time.  A 'sort' join of
+            two sides known to be in key order (sorted, pivoted, ...) is run as
+            a 'merge' join.
+        :param prefilter: 'left' or 'right', a side whose rows without a match
+            are dropped before they're grouped.  The keys of the other side are
+            read first, and that side is read again for the join, so only its
+            keys are held.  A from_sqlite() side only reads the rows with one
+            of them.  It pays off when few rows of that side have a match, and
+            only applies to a side the join doesn't keep every row of.  It's
+            skipped if the other side reads a source with a watermark, so the
+            source is only read once.
+        """
 
         if how not in ("inner", "left", "outer", "right"):
             raise ValueError("{!r} is an invalid join type".format(how))
 
+        if strategy not in ("hash", "merge", "sort"):
+            raise ValueError("{!r} is an invalid join strategy".format(strategy))
+
+        if prefilter not in (None, "left", "right"):
+            raise ValueError("{!r} is an invalid join side".format(prefilter))
+
+        if prefilter is not None and (
+            how == "outer" or (how, prefilter) in (("left", "left"), ("right", "right"))
+        ):
+            raise ValueError(
+                "A {} join keeps every {} row, so they can't be prefiltered".format(
+                    how, prefilter
+                )
+            )
+        join_prefilter = prefilter
+
         relationship = JoinRelationship.by_name(relationship)
+        right_input, join_args = right, (left_on, right_on, how)
 
         # We perform a right join by simply replacing left and right and doing a
         # left-join.
@@ -330,9 +1228,15 @@ class Table(with_metaclass(Schema, object)):
             left, right = right, cls
             left_on, right_on = right_on, left_on
             how = "left"
+            prefilter = {"left": "right", "right": "left"}.get(prefilter)
         else:
             left = cls
 
+        if (prefilter == "left" and reads_watermark(right.plan)) or (
+            prefilter == "right" and reads_watermark(left.plan)
+        ):
+            prefilter = None
+
         left_on, right_on = tuple_wrapper(left_on), tuple_wrapper(right_on)
 
         if len(left_on) != len(right_on):
@@ -341,40 +1245,90 @@ class Table(with_metaclass(Schema, object)):
                 "right side has {} fields.".format(len(left_on), len(right_on))
             )
 
-        def rows(**kwargs):  # type: (...) -> Rows
-            lrows, rrows = left.rows(**kwargs), right.rows(**kwargs)
-            if lrows or rrows:
-                left_key = tuple(
-                    (fld.table_name, fld.name) for fld in left_on
-                )  # type: Tuple[Primitive]
-                right_key = tuple(
-                    (fld.table_name, fld.name) for fld in right_on
-                )  # type: Tuple[Primitive]
-
-                if relationship == JoinRelationship.OneToOne:
-                    left_one_row_per_key = True
-                    right_one_row_per_key = True
-                elif relationship == JoinRelationship.OneToMany:
-                    left_one_row_per_key = True
-                    right_one_row_per_key = False
-                elif relationship == JoinRelationship.ManyToOne:
-                    left_one_row_per_key = False
-                    right_one_row_per_key = True
-                else:
-                    left_one_row_per_key = False
-                    right_one_row_per_key = False
+        left_key = tuple(
+            (fld.table_name, fld.name) for fld in left_on
+        )  # type: Tuple[Primitive]
+        right_key = tuple(
+            (fld.table_name, fld.name) for fld in right_on
+        )  # type: Tuple[Primitive]
+
+        if (
+            strategy == "sort"
+            and sorted_on(left.plan, left_key)
+            and sorted_on(right.plan, right_key)
+        ):
+            strategy = "merge"
+
+        if relationship == JoinRelationship.OneToOne:
+            left_one_row_per_key = True
+            right_one_row_per_key = True
+        elif relationship == JoinRelationship.OneToMany:
+            left_one_row_per_key = True
+            right_one_row_per_key = False
+        elif relationship == JoinRelationship.ManyToOne:
+            left_one_row_per_key = False
+            right_one_row_per_key = True
+        else:
+            left_one_row_per_key = False
+            right_one_row_per_key = False
+
+        combine = row_combiner(left.fields.keys(), right.fields.keys())
 
+        def rows(**kwargs):  # type: (...) -> Rows
+            if prefilter == "left":
+                right_keys = join_keys(right, right_key, kwargs)
+                lrows = semi_join_rows(left, left_key, right_keys, kwargs)
+                rrows = right.rows(**kwargs)
+            elif prefilter == "right":
+                left_keys = join_keys(left, left_key, kwargs)
+                lrows = left.rows(**kwargs)
+                rrows = semi_join_rows(right, right_key, left_keys, kwargs)
+            else:
+                lrows, rrows = left.rows(**kwargs), right.rows(**kwargs)
+            if strategy == "hash":
+                for row in hash_join_rows(
+                    left_rows=lrows,
+                    right_rows=rrows,
+                    left_key=left_key,
+                    right_key=right_key,
+                    left_one_row_per_key=left_one_row_per_key,
+                    right_one_row_per_key=right_one_row_per_key,
+                    left_dummy_row=create_dummy_row(left),
+                    right_dummy_row=create_dummy_row(right),
+                    how=how,
+                    combine=combine,
+                    left_key_getter=left.accessors.getter(left_key),
+                    right_key_getter=right.accessors.getter(right_key),
+                ):
+                    yield row
+            elif strategy == "merge":
+                for row in merge_join_rows(
+                    left_rows=lrows,
+                    right_rows=rrows,
+                    left_key=left_key,
+                    right_key=right_key,
+                    left_one_row_per_key=left_one_row_per_key,
+                    right_one_row_per_key=right_one_row_per_key,
+                    left_dummy_row=create_dummy_row(left),
+                    right_dummy_row=create_dummy_row(right),
+                    how=how,
+                    combine=combine,
+                    left_accessors=left.accessors,
+                    right_accessors=right.accessors,
+                ):
+                    yield row
+            elif lrows or rrows:
                 left_rows = group_rows_by_keys(
                     rows=lrows,
                     key=left_key,
-                    fields=left.fields,
+                    accessors=left.accessors,
                     one_row_per_key=left_one_row_per_key,
                 )
 
                 right_rows = group_rows_by_keys(
                     rows=rrows,
                     key=right_key,
-                    fields=right.fields,
+                    accessors=right.accessors,
                     one_row_per_key=right_one_row_per_key,
                 )
 
@@ -386,9 +1340,7 @@ class Table(with_metaclass(Schema, object)):
                         else:
                             default_row = []
                         for right_row in right_rows.get(left_key_val, default_row):
-                            combined_row = left_row
-                            combined_row.update(right_row)
-                            yield combined_row
+                            yield combine(left_row, right_row)
                             if how == "outer":
                                 right_keys_used.add(left_key_val)
 
@@ -396,28 +1348,52 @@ class Table(with_metaclass(Schema, object)):
                     unused_right_keys = set(right_rows.keys()) - right_keys_used
                     for right_key_val in unused_right_keys:
                         for right_row in right_rows[right_key_val]:
-                            default_row = create_dummy_row(left)
-                            combined_row = default_row
-                            combined_row.update(right_row)
-                            yield combined_row
+                            yield combine(create_dummy_row(left), right_row)
 
         fields = OrderedDict(
             ((fld.table_name, fld.name), fld)
             for fld in chain(left.fields.values(), right.fields.values())
         )
 
-        return new_table(base_name=left.__name__, fields=fields, rows_method=rows)
+        return new_table(
+            base_name=left.__name__,
+            fields=fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "join",
+                inputs=[cls.plan, right_input.plan],
+                args={
+                    "left_on": join_args[0],
+                    "right_on": join_args[1],
+                    "how": join_args[2],
+                    "relationship": relationship,
+                    "strategy": strategy,
+                    "prefilter": join_prefilter,
+                },
+                fields=fields,
+            ),
+        )
 
     @classmethod
     def pivot(
         cls,
         group_by_fields,  # type: Sequence[Field]
         aggregations,  # type: List[Tuple[Field, str]]
+        strategy="hash",  # type: str
+        sort=True,  # type: bool
     ):  # type: (...) -> Tbl
-        """Group-by and aggregate a table"""
+        """Group-by and aggregate a table
+
+        :param strategy: 'hash' makes a single pass over the rows keeping one
+            accumulator per group and aggregate, 'sort' sorts and groups the rows.
+        :param sort: Return the groups in key order.  Only applies to the 'hash'
+            strategy; when False the groups come out in order of first appearance.
+        """
+        if strategy not in ("hash", "sort"):
+            raise ValueError("{!r} is an invalid pivot strategy".format(strategy))
 
         agg_map = OrderedDict(
-            ((fld.table_name, fld.name), AggregationMethod.by_name(agg_name).fn)
+            ((fld.table_name, fld.name), AggregationMethod.by_name(agg_name))
             for fld, agg_name in aggregations
         )
         aggregate_fields = [a[0] for a in aggregations]
@@ -434,34 +1410,140 @@ class Table(with_metaclass(Schema, object)):
             ]
         )  # type: MutableMapping[Tuple[TableName, FieldName], Field]
 
-        def rows(**kwargs):  # type: (...) -> Rows
+        def sorted_rows(**kwargs):  # type: (...) -> Rows
             return (
-                OrderedDict(
-                    chain(
-                        zip(grp_flds, list_wrapper(grp or [None])),
-                        (
+                to_row(
+                    OrderedDict(
+                        chain(
+                            zip(grp_flds, list_wrapper(grp or [None])),
                             (
-                                fld_name,
-                                agg(
-                                    row[fld_name] or defaults[fld_name] for row in rows
-                                ),
-                            )
-                            for fld_name, agg in agg_map.items()
-                        ),
+                                (
+                                    fld_name,
+                                    agg.fn(
+                                        row[fld_name] or defaults[fld_name]
+                                        for row in rows
+                                    ),
+                                )
+                                for fld_name, agg in agg_map.items()
+                            ),
+                        )
                     )
                 )
                 for grp, rows in groupby(
                     sorted(
                         cls.rows(**kwargs),
-                        key=field_value_getter_or_default(
-                            field_names=grp_flds, fields=fields
-                        ),
+                        key=cls.accessors.getter(grp_flds, or_defaults=True),
                     ),
-                    key=field_value_getter(field_names=grp_flds),
+                    key=cls.accessors.getter(grp_flds),
                 )
             )
 
-        return new_table(base_name=cls.__name__, fields=fields, rows_method=rows)
+        def hashed_rows(**kwargs):  # type: (...) -> Rows
+            return hash_aggregate_rows(
+                rows=cls.rows(**kwargs),
+                group_by=grp_flds,
+                aggregations=[
+                    (fld_name, defaults[fld_name], agg.accumulator)
+                    for fld_name, agg in agg_map.items()
+                ],
+                sort_key=field_value_getter_or_default(
+                    field_names=grp_flds, fields=fields
+                ) if sort else None,
+                accessors=cls.accessors,
+            )
+
+        if strategy == "sort":
+            rows = sorted_rows
+        else:
+            rows = hashed_rows
+
+        return new_table(
+            base_name=cls.__name__,
+            fields=fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "pivot",
+                inputs=[cls.plan],
+                args={
+                    "group_by_fields": group_by_fields,
+                    "aggregations": aggregations,
+                    "strategy": strategy,
+                    "sort": sort,
+                },
+                fields=fields,
+            ),
+        )
+
+    @classmethod
+    def incremental_pivot(
+        cls,
+        group_by_fields,  # type: Sequence[Field]
+        aggregations,  # type: List[Tuple[Field, str]]
+        state=None,  # type: Optional[str]
+        changed_only=True,  # type: bool
+    ):  # type: (...) -> Tbl
+        """Group-by and aggregate rows as they're appended to a table
+
+        One accumulator state per group and aggregation is kept between reads,
+        and every read folds the table's rows into them, so the table should
+        only produce the rows added since the last read (e.g. from_csv or
+        from_sqlite with a watermark, called anew for every run).  The groups
+        come out in key order.
+
+        :param state: Path of a file to keep the states in between runs.  It's
+            saved as soon as the new rows have been folded in.
+        :param changed_only: Only return the groups the new rows changed.
+            False returns every group.
+        """
+        agg_map = OrderedDict(
+            ((fld.table_name, fld.name), AggregationMethod.by_name(agg_name))
+            for fld, agg_name in aggregations
+        )
+        aggregate_fields = [a[0] for a in aggregations]
+        group_by_fields = list_wrapper(group_by_fields)
+        grp_flds = [(fld.table_name, fld.name) for fld in group_by_fields]
+        fields = OrderedDict(
+            [
+                ((fld.table_name, fld.name), fld)
+                for fld in chain(group_by_fields, aggregate_fields)
+            ]
+        )  # type: MutableMapping[Tuple[TableName, FieldName], Field]
+        aggregate_state = AggregateState(
+            group_by=grp_flds,
+            aggregations=[
+                (fld_name, str(agg), fld.data_type.default)
+                for (fld_name, agg), fld in zip(agg_map.items(), aggregate_fields)
+            ],
+            key_defaults=[fld.data_type.default for fld in group_by_fields],
+            path=state,
+        )
+        new_row = row_class(fields.keys())
+
+        def rows(**kwargs):  # type: (...) -> Rows
+            changed = aggregate_state.fold(
+                cls.rows(**kwargs),
+                get_key=cls.accessors.getter(grp_flds),
+                get_values=cls.accessors.getter(list(agg_map)),
+            )
+            for values in aggregate_state.results(changed if changed_only else None):
+                yield new_row(values)
+
+        return new_table(
+            base_name=cls.__name__,
+            fields=fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "incremental_pivot",
+                inputs=[cls.plan],
+                args={
+                    "group_by_fields": group_by_fields,
+                    "aggregations": aggregations,
+                    "state": state,
+                    "changed_only": changed_only,
+                },
+                fields=fields,
+            ),
+        )
 
     @classmethod
     def from_csv(
@@ -469,13 +1551,65 @@ class Table(with_metaclass(Schema, object)):
         file_path,  # type: str
         has_header=True,  # type: bool
         ignore_errors=False,  # type: bool
+        columns=None,  # type: Optional[List[Field]]
+        processes=None,  # type: Optional[int]
+        ordered=True,  # type: bool
+        watermark=None,  # type: Optional[str]
     ):  # type: (...) -> Table
-        """Read a .csv and generate a series of rows to pass through the pipeline"""
+        """Read a .csv and generate a series of rows to pass through the pipeline
+
+        :param columns: Only convert and keep the cells of these fields
+        :param processes: Parse and convert ranges of the file in a pool of
+            this many processes.  The table has to be importable by the
+            processes, e.g. defined at the top level of a module.
+        :param ordered: With processes, yield the rows in file order.  False
+            yields the rows of each range as soon as it's been parsed.
+        :param watermark: Path of a file holding the offset the last run
+            stopped at.  Only the rows appended since then are read, serially,
+            and the offset is moved once every row has been read.  Every read
+            of the table gets the rows that were new when it was first read,
+            so call from_csv() again for the rows appended since.
+        """
         # We should convert values that are entered in from the outside world
         # after that we can assume the values match their specified data type.
+        if columns is None:
+            fields = cls.fields
+        else:
+            fields = field_subset(
+                cls.fields, {(fld.table_name, fld.name) for fld in columns}
+            )
+        pinned = {}  # type: Dict[str, Any]
 
         def rows(**kwargs):  # type: (...) -> Rows
-            mapper = row_wrapper_typed(table=cls, ignore_errors=ignore_errors)
+            if processes and processes > 1 and watermark is None:
+                for row in parallel_csv_rows(
+                    table=cls,
+                    file_path=file_path,
+                    fields=fields,
+                    has_header=has_header,
+                    ignore_errors=ignore_errors,
+                    subset=columns is not None,
+                    processes=processes,
+                    ordered=ordered,
+                ):
+                    yield row
+                return
+            if columns is None:
+                mapper = row_wrapper_typed(table=cls, ignore_errors=ignore_errors)
+            else:
+                mapper = row_wrapper_subset(
+                    table=cls, fields=fields, ignore_errors=ignore_errors
+                )
+            if watermark is not None:
+                if "tail" not in pinned:
+                    pinned["tail"] = csv_tail(file_path, has_header, watermark)
+                source, start, end = pinned["tail"]
+                for row in csv.reader(csv_lines(file_path, start, end)):
+                    yield mapper(*row)
+                if "saved" not in pinned:
+                    save_watermark(watermark, source, end)
+                    pinned["saved"] = True
+                return
             with open(file_path, mode="r") as fh:
                 reader = csv.reader(fh)
                 if has_header:
@@ -483,7 +1617,25 @@ class Table(with_metaclass(Schema, object)):
                 for row in reader:
                     yield mapper(*row)
 
-        return new_table(base_name=cls.__name__, fields=cls.fields, rows_method=rows)
+        return new_table(
+            base_name=cls.__name__,
+            fields=fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "from_csv",
+                inputs=[cls.plan],
+                args={
+                    "file_path": file_path,
+                    "has_header": has_header,
+                    "ignore_errors": ignore_errors,
+                    "columns": columns,
+                    "processes": processes,
+                    "ordered": ordered,
+                    "watermark": watermark,
+                },
+                fields=fields,
+            ),
+        )
 
     @staticmethod
     @abstractmethod
@@ -506,39 +1658,68 @@ class Table(with_metaclass(Schema, object)):
             for col in columns
         ]  # type: List[Field]
 
+        fields = OrderedDict(((fld.table_name, fld.name), fld) for fld in cols)
+
         def rows(**kwargs):  # type: (...) -> Rows
             fld_names = [(fld.table_name, fld.name) for fld in cols]
+            new_row = row_class(fields.keys())
+            if len(fields) == len(fld_names):
+                get_values = values_getter(fld_names)
+            else:
+                # A field selected twice only appears once
+                get_values = values_getter(fields.keys())
             for row in cls.rows(**kwargs):
-                yield OrderedDict((fld_name, row[fld_name]) for fld_name in fld_names)
+                yield new_row(get_values(row))
 
-        fields = OrderedDict(((fld.table_name, fld.name), fld) for fld in cols)
-
-        return new_table(base_name=cls.__name__, fields=fields, rows_method=rows)
+        return new_table(
+            base_name=cls.__name__,
+            fields=fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "select", inputs=[cls.plan], args={"columns": cols}, fields=fields
+            ),
+        )
 
     @classmethod
     def sort(
         cls, *order_by
     ):  # type: (List[Tuple[Field, Union[str, SortDirection]]]) -> Tbl
         """Sort the table based on one or more fields"""
+        order_by = [
+            (fld, SortDirection.by_name(direction))
+            for fld, direction in list_wrapper(order_by)
+        ]
+        if all(direction == SortDirection.Descending for _, direction in order_by):
+            # A uniform direction doesn't need any inverted keys
+            key = cls.accessors.sort_key(
+                [(fld, SortDirection.Ascending) for fld, _ in order_by]
+            )
+            reverse = True
+        else:
+            key = cls.accessors.sort_key(order_by)
+            reverse = False
 
         def rows(**kwargs):  # type: (Dict[str, Any]) -> Rows
-            sorted_rows = cls.rows(**kwargs)
-            for fld, direction in reversed(list_wrapper(order_by)):
-                direction = SortDirection.by_name(direction)
-                if direction == SortDirection.Ascending:
-                    reverse = False
-                else:
-                    reverse = True
-                sorted_rows = sorted(
-                    sorted_rows,
-                    key=field_value_getter_or_default(
-                        field_names=((fld.table_name, fld.name),), fields=cls.fields
-                    ),
-                    reverse=reverse,
-                )
-            return sorted_rows
+            return sorted(cls.rows(**kwargs), key=key, reverse=reverse)
 
-        return new_table(base_name=cls.__name__, fields=cls.fields, rows_method=rows)
+        def top_rows(n, **kwargs):  # type: (int, Dict[str, Any]) -> List[Row]
+            return first_n_sorted(
+                rows=cls.rows(**kwargs), n=n, key=key, reverse=reverse
+            )
+
+        sorted_tbl = new_table(
+            base_name=cls.__name__,
+            fields=cls.fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "sort",
+                inputs=[cls.plan],
+                args={"order_by": order_by},
+                fields=cls.fields,
+            ),
+        )
+        sorted_tbl._top_rows = staticmethod(top_rows)
+        return sorted_tbl
 
     @classmethod
     def sql_fields(cls):  # type: () -> Dict[FieldName, Field]
@@ -558,50 +1739,144 @@ class Table(with_metaclass(Schema, object)):
         db_path,  # type: str
         table_name,  # type: str
         mode="o",  # type: str
+        keys=None,  # type: Optional[List[Field]]
+        skip_unchanged=False,  # type: bool
+        batch_size=None,  # type: Optional[int]
+        indexes=None,  # type: Optional[List[Union[Field, Sequence[Field]]]]
+        journal_mode=None,  # type: Optional[str]
+        synchronous=None,  # type: Optional[str]
+        progress=None,  # type: Optional[Callable[[int, float], None]]
         **kwargs  # type: Dict[str, Any]
     ):  # type: (...) -> None
         """Write rows to a sqlite database
 
+        The rows are written in a single transaction.  Passing a batch_size or a
+        progress callback loads them in bulk: rows are converted in batches in
+        this thread while a writer thread inserts the previous batches, and the
+        indexes already on the table are dropped for the load and created again
+        after it.
+
         :param db_path: file path to the sqlite database
         :param table_name: Name of the table in the sqlite database
-        :param mode: available modes include 'a' = append, 'o' = overwrite
+        :param mode: available modes include 'a' = append, 'o' = overwrite,
+            'u' = upsert: insert rows whose keys aren't in the table yet and
+            update the rows whose keys are
+        :param keys: Fields identifying a row, for mode 'u'.  A unique index on
+            them is created if the table doesn't have one.
+        :param skip_unchanged: With mode 'u', keep a hash of each row's values in
+            a _row_hash column and leave the rows whose hash hasn't changed alone
+        :param batch_size: Rows to insert at a time when loading in bulk
+        :param indexes: Fields, or sequences of fields, to index.  The indexes
+            are created after the rows are loaded.
+        :param journal_mode: sqlite journal mode for the load, e.g. 'WAL'.  The
+            database's journal mode is restored afterwards.
+        :param synchronous: sqlite synchronous setting for the load, e.g. 'OFF'
+        :param progress: Called by the writer thread after each batch with the
+            number of rows written (inserted or updated) so far and the rows
+            written per second
         :return: None
         """
+        if mode not in ("a", "o", "u"):
+            raise ValueError("Unrecognized mode {!r}".format(mode))
+        elif mode == "u" and not keys:
+            raise ValueError("mode 'u' needs the key fields of the rows")
+        elif mode == "u" and sqlite3.sqlite_version_info < (3, 24, 0):
+            raise ValueError(
+                "mode 'u' needs SQLite 3.24 or later, this is {}".format(
+                    sqlite3.sqlite_version
+                )
+            )
+        if journal_mode is not None and journal_mode.upper() not in sqlite_journal_modes:
+            raise ValueError("Unrecognized journal_mode {!r}".format(journal_mode))
+        if synchronous is not None and str(synchronous).upper() not in sqlite_synchronous:
+            raise ValueError("Unrecognized synchronous setting {!r}".format(synchronous))
+
         sql_flds = cls.sql_fields()
         field_list = ", ".join(
             "{} {}".format(fld_name, fld.data_type.sqlite_data_type)
             for fld_name, fld in sql_flds.items()
         )
         create_sql = "CREATE TABLE IF NOT EXISTS {} ({})".format(table_name, field_list)
-        fld_list = ", ".join(sql_flds.keys())
-        fld_value_dummies = ", ".join("?" for _ in sql_flds.keys())
+        columns = {
+            (fld.table_name, fld.name): fld_name for fld_name, fld in sql_flds.items()
+        }
+        insert_columns = list(sql_flds.keys())
+        row_hash = mode == "u" and skip_unchanged
+        if row_hash:
+            insert_columns.append(row_hash_column)
         insert_sql = (
             "INSERT INTO {table_name}({field_names}) "
             "VALUES ({field_dummies})".format(
                 table_name=table_name,
-                field_names=fld_list,
-                field_dummies=fld_value_dummies,
+                field_names=", ".join(insert_columns),
+                field_dummies=", ".join("?" for _ in insert_columns),
             )
         )
-        converters = {
-            col: fld.data_type.sqlite_converter
-            for col, fld in enumerate(sql_flds.values())
-        }
-        converted_rows = (
-            [converters[col](cell) for col, cell in enumerate(row.values())]
-            for row in cls.rows(**kwargs)
-        )
-        with contextlib.closing(
-            sqlite3.connect(
-                database=db_path,
-                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        key_columns = None
+        if mode == "u":
+            key_columns = [columns[(fld.table_name, fld.name)] for fld in keys]
+            insert_sql += upsert_sql(
+                table_name, key_columns, insert_columns, skip_unchanged
+            )
+        index_sql = []
+        for index_fields in indexes or []:
+            index_columns = [
+                columns[(fld.table_name, fld.name)] for fld in tuple_wrapper(index_fields)
+            ]
+            index_sql.append(
+                "CREATE INDEX IF NOT EXISTS {table_name}_{suffix}_idx "
+                "ON {table_name}({columns})".format(
+                    table_name=table_name,
+                    suffix="_".join(index_columns),
+                    columns=", ".join(index_columns),
+                )
+            )
+        to_values = cls.accessors.sqlite_values()
+        if row_hash:
+            to_values = with_content_hash(to_values)
+        converted_rows = six.moves.map(to_values, cls.rows(**kwargs))
+        load = functools.partial(
+            load_sqlite,
+            db_path=db_path,
+            table_name=table_name,
+            mode=mode,
+            create_sql=create_sql,
+            insert_sql=insert_sql,
+            index_sql=index_sql,
+            key_columns=key_columns,
+            row_hash=row_hash,
+            journal_mode=journal_mode,
+            synchronous=synchronous,
+        )
+        if batch_size is None and progress is None:
+            load(batches=[converted_rows], rebuild_indexes=False)
+        else:
+            load_sqlite_in_background(
+                load=functools.partial(load, rebuild_indexes=True, progress=progress),
+                batches=sqlite_batches(converted_rows, batch_size or sqlite_batch_size),
             )
-        ) as con:
-            with con:
-                if mode == "o":
-                    con.execute("DROP TABLE IF EXISTS {}".format(table_name))
-                con.execute(create_sql)
-                con.executemany(insert_sql, converted_rows)
+
+    @classmethod
+    def top(
+        cls, n, *order_by
+    ):  # type: (int, List[Tuple[Field, Union[str, SortDirection]]]) -> Tbl
+        """Keep the first n rows of the table in the given sort order"""
+        sorted_tbl = cls.sort(*order_by)
+
+        def rows(**kwargs):  # type: (Dict[str, Any]) -> Rows
+            return sorted_tbl._top_rows(n, **kwargs)
+
+        return new_table(
+            base_name=cls.__name__,
+            fields=cls.fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "top",
+                inputs=[cls.plan],
+                args={"n": n, "order_by": sorted_tbl.plan.args["order_by"]},
+                fields=cls.fields,
+            ),
+        )
 
     @classmethod
     def unique(cls):
@@ -613,16 +1888,35 @@ class Table(with_metaclass(Schema, object)):
                     used_rows.add(row_vals)
                     yield row
 
-        return new_table(base_name=cls.__name__, fields=cls.fields, rows_method=rows)
+        return new_table(
+            base_name=cls.__name__,
+            fields=cls.fields,
+            rows_method=rows,
+            plan=PlanNode("unique", inputs=[cls.plan], fields=cls.fields),
+        )
 
     @classmethod
     def where(cls, condition):  # type: (Callable[[Row], bool]) -> Tbl
         """Filter rows by a series of predicates"""
+        predicate = compile_expression(condition)
+        filter_rows = vectorized.batch_filter(condition, predicate)
 
         def rows(**kwargs):  # type: (Dict[str, Any]) -> Rows
-            return filter(condition, cls.rows(**kwargs))
+            if filter_rows is not None:
+                return filter_rows(cls.rows(**kwargs))
+            return filter(predicate, cls.rows(**kwargs))
 
-        return new_table(base_name=cls.__name__, fields=cls.fields, rows_method=rows)
+        return new_table(
+            base_name=cls.__name__,
+            fields=cls.fields,
+            rows_method=rows,
+            plan=PlanNode(
+                "where",
+                inputs=[cls.plan],
+                args={"condition": condition},
+                fields=cls.fields,
+            ),
+        )
 
     @classmethod
     def to_csv(cls, file_path, **kwargs):  # type: (str, Dict[str, Any]) -> str
@@ -671,10 +1965,22 @@ def field_value_getter_or_default(
     return get_or_default
 
 
+def first_n_sorted(
+    rows,  # type: Iterable[Row]
+    n,  # type: int
+    key,  # type: Callable[[Row], Any]
+    reverse=False,  # type: bool
+):  # type: (...) -> List[Row]
+    """Same as sorted(rows, key=key, reverse=reverse)[:n] using a heap of n rows"""
+    if reverse:
+        return heapq.nlargest(n, rows, key=key)
+    return heapq.nsmallest(n, rows, key=key)
+
+
 def group_rows_by_keys(
     rows,  # type: Rows
-    key,  # type: Tuple[Primitive]
-    fields,  # type: Dict[Tuple[TableName, FieldName], Field]
+    key,  # type: Tuple[Tuple[TableName, FieldName]]
+    accessors,  # type: FieldAccessors
     one_row_per_key,  # type: bool
 ):  # type: (...) -> Dict[Tuple[Primitive], Rows]
     if one_row_per_key:
@@ -684,24 +1990,659 @@ def group_rows_by_keys(
     return OrderedDict(
         (fk, rows_fn(r))
         for fk, r in groupby(
-            sorted(
-                rows, key=field_value_getter_or_default(field_names=key, fields=fields)
-            ),
-            key=field_value_getter(key),
+            sorted(rows, key=accessors.getter(key, or_defaults=True)),
+            key=accessors.getter(key),
         )
     )
 
 
+def hash_aggregate_rows(
+    rows,  # type: Iterable[Row]
+    group_by,  # type: List[Tuple[TableName, FieldName]]
+    aggregations,  # type: List[Tuple[Tuple[TableName, FieldName], Primitive, Accumulator]]
+    sort_key=None,  # type: Optional[Callable[[Row], Tuple[Primitive]]]
+    accessors=None,  # type: Optional[FieldAccessors]
+):  # type: (...) -> Rows
+    """Group and aggregate rows in a single pass
+
+    Only the group keys and one accumulator state per group and aggregation are
+    held in memory.
+
+    :param aggregations: (field, value to use for nulls, accumulator) per
+        aggregated field
+    :param sort_key: If given, the groups are returned sorted by this key
+    :param accessors: FieldAccessors of the rows' table, used to read the group
+        and aggregated values.  Without them each value is looked up by key.
+    """
+    initials = [acc.initial for _, _, acc in aggregations]
+    steps = [
+        (i, default, acc.step) for i, (_, default, acc) in enumerate(aggregations)
+    ]
+    aggregated = [fld_name for fld_name, _, _ in aggregations]
+    if accessors is None:
+        get_key, get_values = field_value_getter(group_by), field_value_getter(aggregated)
+    else:
+        get_key, get_values = accessors.getter(group_by), accessors.getter(aggregated)
+
+    groups = OrderedDict()  # type: Dict[Tuple[Primitive], List[Any]]
+    for row in rows:
+        key_val = get_key(row)
+        states = groups.get(key_val)
+        if states is None:
+            states = groups[key_val] = [initial() for initial in initials]
+        for (i, default, step), value in zip(steps, get_values(row)):
+            states[i] = step(states[i], value or default)
+
+    key_vals = list(groups.keys())
+    if sort_key is not None:
+        key_vals.sort(key=lambda k: sort_key(OrderedDict(zip(group_by, k))))
+
+    for key_val in key_vals:
+        states = groups.pop(key_val)
+        yield to_row(
+            OrderedDict(
+                chain(
+                    zip(group_by, key_val),
+                    (
+                        (fld_name, acc.result(state))
+                        for (fld_name, _, acc), state in zip(aggregations, states)
+                    ),
+                )
+            )
+        )
+
+
+class AggregateState(object):
+    """Accumulator states of a pivot by group, which new rows are folded into
+
+    :param group_by: Keys of the fields the rows are grouped by
+    :param aggregations: (field key, aggregation method name, value to use for
+        nulls) per aggregated field
+    :param key_defaults: Values to sort null group keys as, per group field
+    :param path: File the states are kept in between runs, if any
+    """
+
+    __slots__ = (
+        "group_by",
+        "aggregations",
+        "accumulators",
+        "key_defaults",
+        "path",
+        "groups",
+    )
+
+    def __init__(self, group_by, aggregations, key_defaults, path=None):
+        # type: (List[Tuple[TableName, FieldName]], List[Tuple[Tuple[TableName, FieldName], str, Primitive]], List[Primitive], Optional[str]) -> None
+        self.group_by = group_by
+        self.aggregations = aggregations
+        self.accumulators = [
+            AggregationMethod.by_name(agg_name).accumulator
+            for _, agg_name, _ in aggregations
+        ]
+        self.key_defaults = key_defaults
+        self.path = path
+        self.groups = OrderedDict()  # type: Dict[Tuple[Primitive, ...], List[Any]]
+
+    def definition(self):  # type: () -> Tuple[Any, ...]
+        """What the saved states have to have been aggregated by"""
+        return (
+            list(self.group_by),
+            [(fld_name, agg_name) for fld_name, agg_name, _ in self.aggregations],
+        )
+
+    def load(self):  # type: () -> None
+        try:
+            with open(self.path, mode="rb") as fh:
+                definition, groups = pickle.load(fh)
+        except (IOError, OSError):
+            return
+        if definition != self.definition():
+            raise ValueError(
+                "{} holds the states of a different pivot: {}".format(
+                    self.path, definition
+                )
+            )
+        self.groups = groups
+
+    def save(self):  # type: () -> None
+        temp_path = self.path + ".tmp"
+        with open(temp_path, mode="wb") as fh:
+            pickle.dump((self.definition(), self.groups), fh, pickle.HIGHEST_PROTOCOL)
+        replace_file(temp_path, self.path)
+
+    def fold(self, rows, get_key, get_values):
+        # type: (Iterable[Row], Callable[[Row], Tuple[Primitive, ...]], Callable[[Row], Tuple[Primitive, ...]]) -> Set[Tuple[Primitive, ...]]
+        """Fold rows into the states of their groups
+
+        :return: the keys of the groups that changed
+        """
+        if self.path is not None:
+            self.load()
+        initials = [acc.initial for acc in self.accumulators]
+        steps = [
+            (i, default, acc.step)
+            for i, ((_, _, default), acc) in enumerate(
+                zip(self.aggregations, self.accumulators)
+            )
+        ]
+        groups = self.groups
+        changed = set()  # type: Set[Tuple[Primitive, ...]]
+        for row in rows:
+            key_val = get_key(row)
+            states = groups.get(key_val)
+            if states is None:
+                states = groups[key_val] = [initial() for initial in initials]
+            for (i, default, step), value in zip(steps, get_values(row)):
+                states[i] = step(states[i], value or default)
+            changed.add(key_val)
+        if self.path is not None and changed:
+            self.save()
+        return changed
+
+    def results(self, keys=None):
+        # type: (Optional[Iterable[Tuple[Primitive, ...]]]) -> Iterator[Tuple[Primitive, ...]]
+        """Group keys followed by aggregated values, for some groups or all of
+        them, in key order"""
+        key_defaults = self.key_defaults
+        key_vals = sorted(
+            self.groups if keys is None else keys,
+            key=lambda k: tuple(v or d for v, d in zip(k, key_defaults)),
+        )
+        for key_val in key_vals:
+            states = self.groups[key_val]
+            yield key_val + tuple(
+                acc.result(state) for acc, state in zip(self.accumulators, states)
+            )
+
+
+def join_keys(table, key, kwargs):
+    # type: (Tbl, Tuple[Tuple[TableName, FieldName], ...], Dict[str, Any]) -> Set[Tuple[Primitive, ...]]
+    """The distinct keys of a table's rows, read without holding the rows"""
+    get_key = table.accessors.getter(key)
+    return {get_key(row) for row in table.rows(**kwargs)}
+
+
+def semi_join_rows(
+    table,  # type: Tbl
+    key,  # type: Tuple[Tuple[TableName, FieldName], ...]
+    other_keys,  # type: Set[Tuple[Primitive, ...]]
+    kwargs,  # type: Dict[str, Any]
+):  # type: (...) -> Rows
+    """Rows of a table whose key is among the keys of the other side of a join
+
+    A table that can filter its rows by a list of keys as it reads them (see
+    Table._semi_join_rows) is asked to, and any other is filtered in Python.
+    """
+    if table._semi_join_rows is not None:
+        rows = table._semi_join_rows(key, other_keys, **kwargs)
+        if rows is not None:
+            return rows
+    get_key = table.accessors.getter(key)
+    return (row for row in table.rows(**kwargs) if get_key(row) in other_keys)
+
+
+def split_smaller_side(
+    left_rows,  # type: Iterable[Row]
+    right_rows,  # type: Iterable[Row]
+):  # type: (...) -> Tuple[bool, List[Row], Rows]
+    """Read both sides in lockstep until one of them runs out
+
+    Neither side knows its length up front, so the side that is exhausted first
+    is the smaller one.  Only as many rows of the larger side are buffered as the
+    smaller side has.
+
+    :return: whether the left side is the smaller one, the rows of the smaller
+        side, and an iterator over all of the rows of the larger side
+    """
+    left_rows, right_rows = iter(left_rows), iter(right_rows)
+    left_buffer, right_buffer = [], []  # type: List[Row], List[Row]
+    while True:
+        try:
+            left_buffer.append(next(left_rows))
+        except StopIteration:
+            return True, left_buffer, chain(right_buffer, right_rows)
+        try:
+            right_buffer.append(next(right_rows))
+        except StopIteration:
+            return False, right_buffer, chain(left_buffer, left_rows)
+
+
+def sorted_key_groups(rows, key, accessors, side):
+    # type: (Rows, Tuple[Tuple[TableName, FieldName], ...], FieldAccessors, str) -> Iterator[Tuple[Tuple[Primitive, ...], List[Row]]]
+    """Runs of rows with the same key, checking that the keys only go up
+
+    Keys are compared with nulls as the default of their field's type, like
+    sort() orders them.
+    """
+    order_key = accessors.getter(key, or_defaults=True)
+    previous = None
+    for key_val, grp in groupby(rows, key=order_key):
+        if previous is not None and not previous < key_val:
+            raise ValueError(
+                "The {} side of a merge join isn't sorted by its join key: {!r} "
+                "came after {!r}.".format(side, key_val, previous)
+            )
+        previous = key_val
+        yield key_val, list(grp)
+
+
+def merge_join_rows(
+    left_rows,  # type: Iterable[Row]
+    right_rows,  # type: Iterable[Row]
+    left_key,  # type: Tuple[Tuple[TableName, FieldName]]
+    right_key,  # type: Tuple[Tuple[TableName, FieldName]]
+    left_one_row_per_key,  # type: bool
+    right_one_row_per_key,  # type: bool
+    left_dummy_row,  # type: Row
+    right_dummy_row,  # type: Row
+    how,  # type: str
+    combine,  # type: Callable[[Row, Row], Row]
+    left_accessors,  # type: FieldAccessors
+    right_accessors,  # type: FieldAccessors
+):  # type: (...) -> Rows
+    """Join two row streams that are both in ascending key order
+
+    Only the rows of the current key of each side are held in memory.  The
+    rows come out in key order, including the unmatched rows of an outer join.
+    A side that turns out not to be in order raises a ValueError.
+    """
+    keep_unmatched_left = how in ("left", "outer")
+    keep_unmatched_right = how == "outer"
+    left_groups = sorted_key_groups(left_rows, left_key, left_accessors, "left")
+    right_groups = sorted_key_groups(right_rows, right_key, right_accessors, "right")
+    get_left_key = left_accessors.getter(left_key)
+    get_right_key = right_accessors.getter(right_key)
+    left_grp, right_grp = next(left_groups, None), next(right_groups, None)
+    while left_grp is not None and right_grp is not None:
+        if left_grp[0] < right_grp[0]:
+            if keep_unmatched_left:
+                for left_row in left_grp[1]:
+                    yield combine(left_row, right_dummy_row)
+            left_grp = next(left_groups, None)
+        elif right_grp[0] < left_grp[0]:
+            if keep_unmatched_right:
+                for right_row in right_grp[1]:
+                    yield combine(left_dummy_row, right_row)
+            right_grp = next(right_groups, None)
+        else:
+            # a null and the default of its type are ordered together, but
+            # only match themselves
+            lookup = OrderedDict()  # type: Dict[Tuple[Primitive], List[Row]]
+            for right_row in right_grp[1]:
+                grp = lookup.setdefault(get_right_key(right_row), [])
+                if not (right_one_row_per_key and grp):
+                    grp.append(right_row)
+            left_keys_seen = set()
+            for left_row in left_grp[1]:
+                key_val = get_left_key(left_row)
+                if left_one_row_per_key and key_val in left_keys_seen:
+                    continue
+                left_keys_seen.add(key_val)
+                grp = lookup.get(key_val)
+                if grp:
+                    for right_row in grp:
+                        yield combine(left_row, right_row)
+                elif keep_unmatched_left:
+                    yield combine(left_row, right_dummy_row)
+            if keep_unmatched_right:
+                for key_val, grp in lookup.items():
+                    if key_val not in left_keys_seen:
+                        for right_row in grp:
+                            yield combine(left_dummy_row, right_row)
+            left_grp, right_grp = next(left_groups, None), next(right_groups, None)
+    if keep_unmatched_left:
+        while left_grp is not None:
+            for left_row in left_grp[1]:
+                yield combine(left_row, right_dummy_row)
+            left_grp = next(left_groups, None)
+    if keep_unmatched_right:
+        while right_grp is not None:
+            for right_row in right_grp[1]:
+                yield combine(left_dummy_row, right_row)
+            right_grp = next(right_groups, None)
+
+
+def hash_join_rows(
+    left_rows,  # type: Iterable[Row]
+    right_rows,  # type: Iterable[Row]
+    left_key,  # type: Tuple[Tuple[TableName, FieldName]]
+    right_key,  # type: Tuple[Tuple[TableName, FieldName]]
+    left_one_row_per_key,  # type: bool
+    right_one_row_per_key,  # type: bool
+    left_dummy_row,  # type: Row
+    right_dummy_row,  # type: Row
+    how,  # type: str
+    combine=None,  # type: Optional[Callable[[Row, Row], Row]]
+    left_key_getter=None,  # type: Optional[Callable[[Row], Tuple[Primitive]]]
+    right_key_getter=None,  # type: Optional[Callable[[Row], Tuple[Primitive]]]
+):  # type: (...) -> Rows
+    """Join two row streams by building a dict on the smaller side
+
+    The rows of the larger side are streamed through the dict, so they are
+    emitted in the order they arrive.  Build rows that never matched (left and
+    outer joins) are emitted at the end.
+
+    :param combine: Merges a left and a right row.  Defaults to copying the
+        left row into an OrderedDict and updating it with the right row.
+    :param left_key_getter: Reads the key values of a left row, e.g. from the
+        left table's FieldAccessors.  Defaults to looking up each key.
+    :param right_key_getter: The same for the right rows
+    """
+    left_key_getter = left_key_getter or field_value_getter(left_key)
+    right_key_getter = right_key_getter or field_value_getter(right_key)
+    build_is_left, build_rows, probe_rows = split_smaller_side(left_rows, right_rows)
+    if build_is_left:
+        build_key, probe_key = left_key_getter, right_key_getter
+        build_one_row_per_key = left_one_row_per_key
+        probe_one_row_per_key = right_one_row_per_key
+        build_dummy_row, probe_dummy_row = left_dummy_row, right_dummy_row
+        keep_unmatched_build = how in ("left", "outer")
+        keep_unmatched_probe = how == "outer"
+    else:
+        build_key, probe_key = right_key_getter, left_key_getter
+        build_one_row_per_key = right_one_row_per_key
+        probe_one_row_per_key = left_one_row_per_key
+        build_dummy_row, probe_dummy_row = right_dummy_row, left_dummy_row
+        keep_unmatched_build = how == "outer"
+        keep_unmatched_probe = how in ("left", "outer")
+
+    if combine is None:
+
+        def combine(left_row, right_row):  # type: (Row, Row) -> Row
+            combined_row = OrderedDict(left_row.items())
+            combined_row.update(right_row.items())
+            return combined_row
+
+    lookup = OrderedDict()  # type: Dict[Tuple[Primitive], List[Row]]
+    for row in build_rows:
+        grp = lookup.setdefault(build_key(row), [])
+        if not (build_one_row_per_key and grp):
+            grp.append(row)
+    del build_rows
+
+    matched_keys = set()
+    probe_keys_seen = set()
+    for probe_row in probe_rows:
+        key_val = probe_key(probe_row)
+        if probe_one_row_per_key:
+            if key_val in probe_keys_seen:
+                continue
+            probe_keys_seen.add(key_val)
+        grp = lookup.get(key_val)
+        if grp:
+            if keep_unmatched_build:
+                matched_keys.add(key_val)
+            for build_row in grp:
+                if build_is_left:
+                    yield combine(build_row, probe_row)
+                else:
+                    yield combine(probe_row, build_row)
+        elif keep_unmatched_probe:
+            if build_is_left:
+                yield combine(build_dummy_row, probe_row)
+            else:
+                yield combine(probe_row, build_dummy_row)
+
+    if keep_unmatched_build:
+        for key_val, grp in lookup.items():
+            if key_val not in matched_keys:
+                for build_row in grp:
+                    if build_is_left:
+                        yield combine(build_row, probe_dummy_row)
+                    else:
+                        yield combine(probe_dummy_row, build_row)
+
+
+# Rows converted and inserted at a time when to_sqlite loads in bulk
+sqlite_batch_size = 10000
+
+sqlite_journal_modes = frozenset(["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"])
+sqlite_synchronous = frozenset(["OFF", "NORMAL", "FULL", "EXTRA", "0", "1", "2", "3"])
+
+
+def sqlite_batches(values, batch_size):
+    # type: (Iterable[Tuple[Primitive, ...]], int) -> Iterator[List[Tuple[Primitive, ...]]]
+    values = iter(values)
+    while True:
+        batch = list(islice(values, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+# Column where to_sqlite keeps a hash of each row's values for skip_unchanged
+row_hash_column = "_row_hash"
+
+
+def upsert_sql(table_name, key_columns, columns, skip_unchanged):
+    # type: (str, List[str], List[str], bool) -> str
+    """The ON CONFLICT clause that turns an INSERT into an upsert"""
+    updates = [col for col in columns if col not in key_columns]
+    if not updates:
+        return " ON CONFLICT({}) DO NOTHING".format(", ".join(key_columns))
+    sql = " ON CONFLICT({keys}) DO UPDATE SET {updates}".format(
+        keys=", ".join(key_columns),
+        updates=", ".join("{col} = excluded.{col}".format(col=col) for col in updates),
+    )
+    if skip_unchanged:
+        sql += " WHERE {table}.{col} IS NOT excluded.{col}".format(
+            table=table_name, col=row_hash_column
+        )
+    return sql
+
+
+if hasattr(hashlib, "blake2b"):
+
+    def content_hash(values):  # type: (Tuple[Primitive, ...]) -> int
+        """A 64 bit hash of a row's values that's the same in every process"""
+        digest = hashlib.blake2b(repr(values).encode("utf-8"), digest_size=8).digest()
+        return struct.unpack(">q", digest)[0]
+
+
+else:  # Python 2.7
+
+    def content_hash(values):  # type: (Tuple[Primitive, ...]) -> int
+        """A 64 bit hash of a row's values that's the same in every process"""
+        digest = hashlib.md5(repr(values).encode("utf-8")).digest()
+        return struct.unpack(">q", digest[:8])[0]
+
+
+def with_content_hash(to_values):
+    # type: (Callable[[Row], Tuple[Primitive, ...]]) -> Callable[[Row], Tuple[Primitive, ...]]
+    """Add the content_hash of a row's values to the end of them"""
+
+    def get(row):  # type: (Row) -> Tuple[Primitive, ...]
+        values = to_values(row)
+        return values + (content_hash(values),)
+
+    return get
+
+
+def unique_index_on(con, table_name, columns):
+    # type: (sqlite3.Connection, str, List[str]) -> Optional[str]
+    """Name of a unique index (or primary key) on exactly these columns"""
+    for index in con.execute("PRAGMA index_list({})".format(table_name)).fetchall():
+        index_name, unique = index[1], index[2]
+        indexed = [
+            info[2]
+            for info in con.execute(
+                "PRAGMA index_info({})".format(quote_identifier(index_name))
+            ).fetchall()
+        ]
+        if unique and sorted(indexed) == sorted(columns):
+            return index_name
+    return None
+
+
+def quote_identifier(name):  # type: (str) -> str
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def load_sqlite(
+    db_path,  # type: str
+    table_name,  # type: str
+    mode,  # type: str
+    create_sql,  # type: str
+    insert_sql,  # type: str
+    index_sql,  # type: List[str]
+    batches,  # type: Iterable[Iterable[Tuple[Primitive, ...]]]
+    key_columns=None,  # type: Optional[List[str]]
+    row_hash=False,  # type: bool
+    journal_mode=None,  # type: Optional[str]
+    synchronous=None,  # type: Optional[str]
+    rebuild_indexes=False,  # type: bool
+    progress=None,  # type: Optional[Callable[[int, float], None]]
+):  # type: (...) -> None
+    """Insert batches of values into a sqlite table in one transaction
+
+    :param index_sql: Statements creating indexes, run after the rows are in
+    :param key_columns: Columns of the conflict target of an upsert, which
+        need a unique index while the rows are loaded
+    :param row_hash: Add the row_hash_column to the table if it's missing
+    :param rebuild_indexes: Drop the indexes already on the table while
+        loading, and create them again afterwards
+    """
+    start = time.time()
+    with contextlib.closing(
+        sqlite3.connect(
+            database=db_path,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        )
+    ) as con:
+        previous_journal_mode = None
+        if journal_mode is not None:
+            previous_journal_mode = con.execute("PRAGMA journal_mode").fetchone()[0]
+            con.execute("PRAGMA journal_mode={}".format(journal_mode))
+        if synchronous is not None:
+            con.execute("PRAGMA synchronous={}".format(synchronous))
+        with con:
+            # sqlite3 would commit the DDL statements straight away
+            con.execute("BEGIN")
+            if mode == "o":
+                con.execute("DROP TABLE IF EXISTS {}".format(table_name))
+            con.execute(create_sql)
+            if row_hash:
+                table_columns = [
+                    info[1]
+                    for info in con.execute("PRAGMA table_info({})".format(table_name))
+                ]
+                if row_hash_column not in table_columns:
+                    con.execute(
+                        "ALTER TABLE {} ADD COLUMN {} INTEGER".format(
+                            table_name, row_hash_column
+                        )
+                    )
+            key_index = None
+            if key_columns:
+                key_index = unique_index_on(con, table_name, key_columns)
+                if key_index is None:
+                    key_index = "{}_{}_key".format(table_name, "_".join(key_columns))
+                    con.execute(
+                        "CREATE UNIQUE INDEX {} ON {}({})".format(
+                            key_index, table_name, ", ".join(key_columns)
+                        )
+                    )
+            existing_index_sql = []
+            if rebuild_indexes:
+                existing = con.execute(
+                    "SELECT name, sql FROM sqlite_master "
+                    "WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                    (table_name,),
+                ).fetchall()
+                for index_name, sql in existing:
+                    if index_name != key_index:
+                        con.execute("DROP INDEX {}".format(quote_identifier(index_name)))
+                        existing_index_sql.append(sql)
+            rows_written = 0
+            for batch in batches:
+                cur = con.executemany(insert_sql, batch)
+                if progress is not None:
+                    rows_written += cur.rowcount
+                    progress(rows_written, rows_written / max(time.time() - start, 1e-9))
+            for sql in existing_index_sql + index_sql:
+                con.execute(sql)
+        if previous_journal_mode is not None:
+            con.execute("PRAGMA journal_mode={}".format(previous_journal_mode))
+
+
+class LoadAborted(Exception):
+    """Raised in the writer thread when the rows can't all be converted"""
+
+
+def load_sqlite_in_background(load, batches):
+    # type: (Callable[..., None], Iterable[List[Tuple[Primitive, ...]]]) -> None
+    """Convert batches of rows in this thread while another thread inserts them
+
+    sqlite3 lets go of the GIL while sqlite runs each insert, so converting the
+    next batch overlaps with inserting the last one.  If either side fails the
+    transaction is rolled back and the error is raised here.
+
+    :param load: load_sqlite, given everything but the batches
+    """
+    done, abort = object(), object()
+    queue = six.moves.queue.Queue(maxsize=2)
+    errors = []  # type: List[Tuple[type, BaseException, Any]]
+
+    def queued_batches():  # type: () -> Iterator[List[Tuple[Primitive, ...]]]
+        while True:
+            batch = queue.get()
+            if batch is done:
+                return
+            elif batch is abort:
+                raise LoadAborted()
+            yield batch
+
+    def write():  # type: () -> None
+        try:
+            load(batches=queued_batches())
+        except LoadAborted:
+            pass
+        except BaseException:
+            errors.append(sys.exc_info())
+            # keep taking batches so the converting thread isn't blocked
+            while queue.get() not in (done, abort):
+                pass
+
+    writer = threading.Thread(target=write, name="to_sqlite writer")
+    writer.daemon = True
+    writer.start()
+    finished = False
+    try:
+        for batch in batches:
+            if errors:
+                break
+            queue.put(batch)
+        finished = True
+    finally:
+        queue.put(done if finished else abort)
+        writer.join()
+    if errors:
+        six.reraise(*errors[0])
+
+
 def new_table(
     base_name,  # type: TableName
     fields,  # type: Dict[Tuple[TableName, FieldName], Field]
     rows_method,  # type: Callable[[Any], Rows]
+    plan=None,  # type: Optional[PlanNode]
+    base=None,  # type: Optional[Tbl]
 ):  # type: (...) -> Tbl
-    """Create a new Table subclass from a bag of fields"""
+    """Create a new Table subclass from a bag of fields
+
+    :param rows_method: produces the rows from the input tables as written
+    :param plan: describes the operation so it can be optimized before it's run.
+        Without a plan the table is treated as an opaque source of rows.
+    :param base: Table class to derive the new table from, Table by default
+    """
     new_tbl = cast("Tbl", type(
-        new_table_name(base_name), (Table,), {"fields": fields, "_derived_table": True}
+        new_table_name(base_name),
+        (base or Table,),
+        {"fields": fields, "_derived_table": True},
     ))
-    new_tbl.rows = staticmethod(rows_method)
+    new_tbl.plan = plan or PlanNode("table", fields=fields)
+    new_tbl.plan.table = new_tbl
+    new_tbl._rows = staticmethod(rows_method)
+    new_tbl.rows = staticmethod(lambda **kwargs: execute(new_tbl, **kwargs))
     return new_tbl
 
 
@@ -727,5 +2668,5 @@ def dedupe_field_names(
 
 
 def create_dummy_row(table):  # type: (Tbl) -> Row
-    """Wrap a row of data for the table inside a namedtuple"""
-    return OrderedDict((fld, None) for fld in table.fields.keys())
+    """A row of the table with no values"""
+    return table.accessors.row_class((None,) * len(table.accessors.keys))
@@ -0,0 +1,497 @@
+"""Evaluate numeric expressions over batches of rows with NumPy
+
+NumPy is optional (the "vectorized" extra installs it).  When it's installed,
+where() and assign() read their rows in batches and evaluate an expression
+built from Int, Float and Currency values, numeric literals, arithmetic,
+comparisons, `&` and `|` as a handful of array operations per batch instead of
+one chain of Python calls per row.
+
+The arrays reproduce what the functions in messydata.operators return value
+for value, including their handling of falsy values (a product with a falsy
+side is the int 0, comparing against 0 is only true if both sides are falsy,
+...) and the type each result would have.  Every value is kept as a float64
+with a code recording the Python type it stands for: ints are only accepted
+while they fit in the 53 bits a float64 represents exactly, and Currency
+values are kept as exact counts of cents.  Comparisons of Currency values
+are supported, arithmetic on them is not.
+
+Whenever a batch holds something the arrays can't reproduce exactly (a
+string, a None the row functions would raise on, an int too big, Decimal
+arithmetic, a division by an int that truncates to 0, ...), that batch is
+evaluated row by row with the compiled expression instead, which also
+raises the same errors the row path always has.
+"""
+from itertools import islice, repeat
+
+import six
+
+from messydata import compiler
+from messydata.field import *
+from messydata.field import DeferredRowValue, Field
+from messydata.operators import Operator
+from messydata.row import Record
+from messydata.types_ import *
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - NumPy is an optional dependency
+    numpy = None
+
+__all__ = ()
+
+# Flip to False to always evaluate expressions one row at a time
+vectorize_expressions = True
+
+# Number of rows read and evaluated at once
+batch_size = 4096
+
+# Ints are only packed while their magnitude is below this, so that float64
+# holds them and the results of adding or subtracting them exactly
+MAX_EXACT_INT = 2 ** 53
+
+# Codes of the Python type each value in a vector stands for
+INT, FLOAT, CURRENCY, BOOL = range(4)
+
+numeric_types = {DataType.Currency, DataType.Float, DataType.Int}
+
+arithmetic_operators = {
+    Operator.Add,
+    Operator.Divide,
+    Operator.Multiply,
+    Operator.Negate,
+    Operator.Subtract,
+}
+comparison_operators = {
+    Operator.Equals,
+    Operator.GreaterThan,
+    Operator.GreaterThanOrEquals,
+    Operator.LessThan,
+    Operator.LessThanOrEquals,
+    Operator.NotEquals,
+}
+logical_operators = {Operator.And, Operator.Or}
+
+# The type both sides of a comparison are cast to, see converters.coalesce_pair
+comparison_casts = {
+    (INT, INT): INT,
+    (INT, FLOAT): FLOAT,
+    (INT, CURRENCY): CURRENCY,
+    (FLOAT, INT): INT,
+    (FLOAT, FLOAT): FLOAT,
+    (FLOAT, CURRENCY): CURRENCY,
+    (CURRENCY, INT): INT,
+    (CURRENCY, FLOAT): FLOAT,
+    (CURRENCY, CURRENCY): CURRENCY,
+}
+
+Vector = NamedTuple("Vector", [("values", Any), ("kinds", Any), ("nulls", Any)])
+
+
+class Unsupported(Exception):
+    """The batch holds values the arrays can't reproduce exactly"""
+
+
+def is_numeric_literal(value):  # type: (Any) -> bool
+    return type(value) in (Decimal, float, int)
+
+
+def can_vectorize(operand):  # type: (Any) -> bool
+    """Can the expression be evaluated over arrays?"""
+    if isinstance(operand, Expression):
+        operator = operand.operator
+        if operator in logical_operators:
+            return all(
+                isinstance(side, Expression)
+                and side.operator in comparison_operators | logical_operators
+                and can_vectorize(side)
+                for side in (operand.operand1, operand.operand2)
+            )
+        if operator not in arithmetic_operators | comparison_operators:
+            return False
+        if not operator.is_binary:
+            return can_vectorize(operand.operand1)
+        return can_vectorize(operand.operand1) and can_vectorize(operand.operand2)
+    elif isinstance(operand, DeferredRowValue):
+        return False
+    elif isinstance(operand, Field):
+        return operand.data_type in numeric_types
+    return is_numeric_literal(operand)
+
+
+def batches(rows, size):  # type: (Iterable[Row], int) -> Iterator[List[Row]]
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def field_values(rows, key):
+    # type: (List[Row], Tuple[TableName, FieldName]) -> List[Primitive]
+    """The values of one field in a batch of rows"""
+    cls = rows[0].__class__
+    if issubclass(cls, Record) and set(six.moves.map(type, rows)) == {cls}:
+        return list(
+            six.moves.map(tuple.__getitem__, rows, repeat(cls._positions[key]))
+        )
+    return [row[key] for row in rows]
+
+
+def currency_cents(value):  # type: (Decimal) -> int
+    if not value.is_finite() or value.as_tuple().exponent != -2:
+        raise Unsupported
+    return int(value.scaleb(2))
+
+
+def check_ints(values, kinds):  # type: (Any, Any) -> None
+    if numpy.any((kinds == INT) & (numpy.abs(values) >= MAX_EXACT_INT)):
+        raise Unsupported
+
+
+def to_vector(values):  # type: (List[Primitive]) -> Vector
+    """Pack a list of values"""
+    types = set(six.moves.map(type, values))
+    nulls = numpy.zeros(len(values), dtype=bool)
+    if type(None) in types:
+        types.discard(type(None))
+        nulls = numpy.array([value is None for value in values])
+    if types == {Decimal}:
+        cents = [0 if value is None else currency_cents(value) for value in values]
+        if max(six.moves.map(abs, cents)) >= MAX_EXACT_INT:
+            raise Unsupported
+        kinds = numpy.full(len(values), CURRENCY, dtype=numpy.int8)
+        return Vector(numpy.array(cents, dtype=numpy.float64), kinds, nulls)
+    if not types <= {float, int}:
+        raise Unsupported
+    if numpy.any(nulls):
+        values = [0 if value is None else value for value in values]
+    if types == {int}:
+        kinds = numpy.full(len(values), INT, dtype=numpy.int8)
+    elif types == {float}:
+        kinds = numpy.full(len(values), FLOAT, dtype=numpy.int8)
+    else:
+        kinds = numpy.array(
+            [FLOAT if type(value) is float else INT for value in values],
+            dtype=numpy.int8,
+        )
+    try:
+        # An int converts exactly if it's small enough and to something at
+        # least as big otherwise, so the big ones can be found after converting
+        vector = Vector(numpy.array(values, dtype=numpy.float64), kinds, nulls)
+    except OverflowError:
+        raise Unsupported
+    check_ints(vector.values, vector.kinds)
+    return vector
+
+
+def literal_vector(value, size):  # type: (Primitive, int) -> Vector
+    return Vector(*(numpy.repeat(array, size) for array in to_vector([value])))
+
+
+def to_values(vector):  # type: (Vector) -> List[Primitive]
+    """Unpack a vector into the values the row functions would have returned"""
+    values, kinds, nulls = vector
+    if not numpy.any(kinds != kinds[0]):
+        kind = kinds[0]
+        if kind == FLOAT:
+            result = values.tolist()
+        elif kind == INT:
+            result = values.astype(numpy.int64).tolist()
+        elif kind == BOOL:
+            result = values.astype(bool).tolist()
+        else:
+            raise Unsupported
+    else:
+        if numpy.any(kinds == CURRENCY) or numpy.any(kinds == BOOL):
+            raise Unsupported
+        with numpy.errstate(invalid="ignore"):
+            ints = values.astype(numpy.int64).tolist()
+        floats = values.tolist()
+        result = [
+            int_value if kind == INT else float_value
+            for float_value, int_value, kind in zip(floats, ints, kinds.tolist())
+        ]
+    if numpy.any(nulls):
+        for pos in numpy.flatnonzero(nulls).tolist():
+            result[pos] = None
+    return result
+
+
+def truthy(vector):  # type: (Vector) -> Any
+    return ~vector.nulls & (vector.values != 0)
+
+
+def require_numbers(*vectors):  # type: (*Vector) -> None
+    """Arithmetic on Currency values or booleans isn't reproduced"""
+    for vector in vectors:
+        if numpy.any((vector.kinds == CURRENCY) | (vector.kinds == BOOL)):
+            raise Unsupported
+
+
+def int_of(vector, where):  # type: (Vector, Any) -> Any
+    """The values as int() would convert them, checked where `where` is set"""
+    if numpy.any(where & ~numpy.isfinite(vector.values)):
+        raise Unsupported
+    return numpy.trunc(vector.values)
+
+
+def add(left, right):  # type: (Vector, Vector) -> Vector
+    """add_fields: left + type(left)(right) if both are truthy"""
+    require_numbers(left, right)
+    left_truthy = truthy(left)
+    both = left_truthy & truthy(right)
+    truncate = both & (left.kinds == INT) & (right.kinds == FLOAT)
+    right_values = numpy.where(truncate, int_of(right, truncate), right.values)
+    keep_left = left_truthy
+    vector = Vector(
+        numpy.where(
+            both,
+            left.values + right_values,
+            numpy.where(keep_left, left.values, right.values),
+        ),
+        numpy.where(keep_left, left.kinds, right.kinds),
+        ~keep_left & right.nulls,
+    )
+    check_ints(vector.values, vector.kinds)
+    return vector
+
+
+def subtract(left, right):  # type: (Vector, Vector) -> Vector
+    """subtract_fields: left - type(left)(right) if both are truthy"""
+    require_numbers(left, right)
+    left_truthy = truthy(left)
+    both = left_truthy & truthy(right)
+    if numpy.any(~left_truthy & right.nulls):
+        raise Unsupported  # subtract_fields raises on a None right side
+    truncate = both & (left.kinds == INT) & (right.kinds == FLOAT)
+    right_values = numpy.where(truncate, int_of(right, truncate), right.values)
+    vector = Vector(
+        numpy.where(
+            both,
+            left.values - right_values,
+            numpy.where(left_truthy, left.values, -right.values),
+        ),
+        numpy.where(left_truthy, left.kinds, right.kinds),
+        numpy.zeros(len(left.values), dtype=bool),
+    )
+    check_ints(vector.values, vector.kinds)
+    return vector
+
+
+def multiply(left, right):  # type: (Vector, Vector) -> Vector
+    """multiply_fields: a float product if both are truthy, otherwise the int 0"""
+    require_numbers(left, right)
+    both = truthy(left) & truthy(right)
+    return Vector(
+        numpy.where(both, left.values * right.values, 0.0),
+        numpy.where(both, FLOAT, INT).astype(numpy.int8),
+        numpy.zeros(len(left.values), dtype=bool),
+    )
+
+
+def divide(left, right):  # type: (Vector, Vector) -> Vector
+    """divide_fields: left / type(left)(right) if both are truthy, else a 0"""
+    require_numbers(left, right)
+    left_truthy = truthy(left)
+    both = left_truthy & truthy(right)
+    if numpy.any(~left_truthy & right.nulls):
+        raise Unsupported  # divide_fields raises when both sides are None
+    truncate = both & (left.kinds == INT) & (right.kinds == FLOAT)
+    right_values = numpy.where(truncate, int_of(right, truncate), right.values)
+    if numpy.any(both & (right_values == 0)):
+        raise Unsupported  # ZeroDivisionError
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        quotients = left.values / numpy.where(both, right_values, 1.0)
+    return Vector(
+        numpy.where(both, quotients, 0.0),
+        numpy.where(
+            both, FLOAT, numpy.where(left_truthy, left.kinds, right.kinds)
+        ).astype(numpy.int8),
+        numpy.zeros(len(left.values), dtype=bool),
+    )
+
+
+def negate(vector):  # type: (Vector) -> Vector
+    """negate_field: -value if it's truthy, otherwise the value itself"""
+    require_numbers(vector)
+    return Vector(
+        numpy.where(truthy(vector), -vector.values, vector.values),
+        vector.kinds,
+        vector.nulls,
+    )
+
+
+def cast(vector, kinds):  # type: (Vector, Any) -> Any
+    """The values after upcast_values converted them to the types in `kinds`"""
+    values = vector.values
+    to_int = (kinds == INT) & (vector.kinds != INT)
+    if numpy.any(to_int):
+        # int() truncates floats, and Decimals to whole units
+        if numpy.any(to_int & ~numpy.isfinite(values)):
+            raise Unsupported
+        units = numpy.where(vector.kinds == CURRENCY, values / 100, values)
+        values = numpy.where(to_int, numpy.trunc(units), values)
+    to_float = (kinds == FLOAT) & (vector.kinds == CURRENCY)
+    if numpy.any(to_float):
+        values = numpy.where(to_float, values / 100, values)
+    to_currency = (kinds == CURRENCY) & (vector.kinds != CURRENCY)
+    if numpy.any(to_currency):
+        # Quantizing a float to cents isn't reproduced
+        if numpy.any(to_currency & (vector.kinds == FLOAT)):
+            raise Unsupported
+        values = numpy.where(to_currency, values * 100, values)
+        if numpy.any(to_currency & (numpy.abs(values) >= MAX_EXACT_INT)):
+            raise Unsupported
+    return values
+
+
+def compare(left, right, operator):  # type: (Vector, Vector, Operator) -> Vector
+    """Comparison functions: upcast both sides, then compare if both are truthy"""
+    if numpy.any(left.nulls | right.nulls):
+        raise Unsupported  # upcast_values raises on None
+    if numpy.any((left.kinds == BOOL) | (right.kinds == BOOL)):
+        raise Unsupported
+    kinds = numpy.zeros(len(left.values), dtype=numpy.int8)
+    for (left_kind, right_kind), kind in comparison_casts.items():
+        kinds[(left.kinds == left_kind) & (right.kinds == right_kind)] = kind
+    left_values, right_values = cast(left, kinds), cast(right, kinds)
+    left_truthy, right_truthy = left_values != 0, right_values != 0
+    compared = getattr(numpy, comparison_ufuncs[operator])(left_values, right_values)
+    result = numpy.where(
+        left_truthy & right_truthy, compared, ~left_truthy & ~right_truthy
+    )
+    return bool_vector(result)
+
+
+def logical(left, right, operator):  # type: (Vector, Vector, Operator) -> Vector
+    if numpy.any((left.kinds != BOOL) | (right.kinds != BOOL)):
+        raise Unsupported
+    left_values, right_values = left.values != 0, right.values != 0
+    if operator == Operator.And:
+        return bool_vector(left_values & right_values)
+    return bool_vector(left_values | right_values)
+
+
+def bool_vector(flags):  # type: (Any) -> Vector
+    return Vector(
+        flags.astype(numpy.float64),
+        numpy.full(len(flags), BOOL, dtype=numpy.int8),
+        numpy.zeros(len(flags), dtype=bool),
+    )
+
+
+comparison_ufuncs = {
+    Operator.Equals: "equal",
+    Operator.GreaterThan: "greater",
+    Operator.GreaterThanOrEquals: "greater_equal",
+    Operator.LessThan: "less",
+    Operator.LessThanOrEquals: "less_equal",
+    Operator.NotEquals: "not_equal",
+}
+arithmetic_functions = {
+    Operator.Add: add,
+    Operator.Divide: divide,
+    Operator.Multiply: multiply,
+    Operator.Subtract: subtract,
+}
+
+
+def evaluate(operand, rows, columns):
+    # type: (Any, List[Row], Dict[Tuple[TableName, FieldName], Vector]) -> Vector
+    """Evaluate an expression over a batch of rows
+
+    :param columns: Vectors of the fields already read from the batch
+    """
+    if isinstance(operand, Expression):
+        operator = operand.operator
+        left = evaluate(operand.operand1, rows, columns)
+        if not operator.is_binary:
+            return negate(left)
+        right = evaluate(operand.operand2, rows, columns)
+        if operator in comparison_operators:
+            return compare(left, right, operator)
+        elif operator in logical_operators:
+            return logical(left, right, operator)
+        return arithmetic_functions[operator](left, right)
+    elif isinstance(operand, Field):
+        key = (operand.table_name, operand.name)
+        if key not in columns:
+            columns[key] = to_vector(field_values(rows, key))
+        return columns[key]
+    return literal_vector(operand, len(rows))
+
+
+def batch_evaluator(expression):
+    # type: (Any) -> Optional[Callable[[List[Row]], Vector]]
+    """Function that evaluates an expression over a batch of rows, or None if
+    the expression can't be vectorized or NumPy isn't installed"""
+    if (
+        numpy is None
+        or not vectorize_expressions
+        or compiler.interpret_expressions
+    ):
+        return None
+    if not isinstance(expression, Expression) or not can_vectorize(expression):
+        return None
+
+    def evaluate_batch(rows):  # type: (List[Row]) -> Vector
+        with numpy.errstate(over="ignore", invalid="ignore"):
+            return evaluate(expression, rows, {})
+
+    return evaluate_batch
+
+
+def batch_filter(condition, predicate):
+    # type: (Any, Callable[[Row], bool]) -> Optional[Callable[[Iterable[Row]], Rows]]
+    """Function that filters rows a batch at a time, or None if the condition
+    can't be vectorized
+
+    :param condition: Condition passed to where()
+    :param predicate: The compiled condition, used for batches that the arrays
+        can't reproduce
+    """
+    evaluate_batch = batch_evaluator(condition)
+    if evaluate_batch is None:
+        return None
+
+    def filter_rows(rows):  # type: (Iterable[Row]) -> Rows
+        for batch in batches(rows, batch_size):
+            try:
+                keep = truthy(evaluate_batch(batch))
+            except Unsupported:
+                for row in batch:
+                    if predicate(row):
+                        yield row
+                continue
+            for pos in numpy.flatnonzero(keep).tolist():
+                yield batch[pos]
+
+    return filter_rows
+
+
+def batch_calculator(expression, calculate):
+    # type: (Any, Callable[[Row], Primitive]) -> Optional[Callable[[Iterable[Row]], Iterator[Tuple[List[Row], List[Primitive]]]]]
+    """Function that splits rows into batches and pairs each batch with the
+    values of an expression, or None if the expression can't be vectorized
+
+    :param expression: Expression passed to assign()
+    :param calculate: The compiled expression, used for batches that the
+        arrays can't reproduce
+    """
+    evaluate_batch = batch_evaluator(expression)
+    if evaluate_batch is None:
+        return None
+
+    def calculate_batches(rows):
+        # type: (Iterable[Row]) -> Iterator[Tuple[List[Row], List[Primitive]]]
+        for batch in batches(rows, batch_size):
+            try:
+                values = to_values(evaluate_batch(batch))
+            except Unsupported:
+                for row in batch:
+                    yield [row], [calculate(row)]
+                continue
+            yield batch, values
+
+    return calculate_batches
@@ -0,0 +1,113 @@
+import datetime
+from collections import OrderedDict
+from decimal import Decimal
+
+import pytest
+
+from messydata.accessors import DescendingKey, FieldAccessors
+from messydata.table import SortDirection
+
+from tests.conftest import *
+
+
+def sales_row_as_dict(row):
+    return OrderedDict(row.items())
+
+
+def test_tables_get_accessors():
+    accessors = Sales.accessors
+    assert isinstance(accessors, FieldAccessors)
+    assert tuple(Sales.fields.keys()) == accessors.keys
+    assert Sales.rows()[0].__class__ is accessors.row_class
+    expected = (0, 0, 0, datetime.datetime.min, Decimal(0), datetime.datetime.min)
+    assert expected == accessors.defaults, "\nACTUAL: {}".format(accessors.defaults)
+
+
+def test_derived_tables_get_accessors():
+    tbl = Sales.select(Sales.amount, Sales.id)
+    expected = (("Sales", "amount"), ("Sales", "id"))
+    assert expected == tbl.accessors.keys, "\nACTUAL: {}".format(tbl.accessors.keys)
+    assert (Decimal(0), 0) == tbl.accessors.defaults
+
+
+def test_converters_by_position():
+    converters = Sales.accessors.converters_for(ignore_errors=False)
+    assert Decimal("1.50") == converters[4]("1.5")
+    with pytest.raises(TypeError):
+        converters[0]("x")
+    assert Sales.accessors.converters_for(ignore_errors=True)[0]("x") is None
+    assert Sales.accessors.sqlite_converters[0](0) is None
+    assert 2.5 == Sales.accessors.sqlite_converters[4](Decimal("2.50"))
+
+
+def test_getter_reads_records_and_dicts_alike():
+    keys = [("Sales", "customer_id"), ("Sales", "item_id")]
+    get = Sales.accessors.getter(keys)
+    get_or_default = Sales.accessors.getter(keys, or_defaults=True)
+    for row in Sales.rows():
+        expected = tuple(row[key] for key in keys)
+        assert expected == get(row) == get(sales_row_as_dict(row))
+        expected = tuple(row[key] or 0 for key in keys)
+        assert expected == get_or_default(row) == get_or_default(sales_row_as_dict(row))
+
+
+def test_getters_are_built_once():
+    keys = [("Sales", "id")]
+    assert Sales.accessors.getter(keys) is Sales.accessors.getter(keys)
+    assert Sales.accessors.getter(keys) is not Sales.accessors.getter(keys, or_defaults=True)
+
+
+def test_getter_of_no_fields():
+    assert () == Sales.accessors.getter([])(Sales.rows()[0])
+
+
+def test_sort_key_reads_positions():
+    order_by = [
+        (Sales.customer_id, SortDirection.Ascending),
+        (Sales.amount, SortDirection.Descending),
+    ]
+    key = Sales.accessors.sort_key(order_by)
+    assert "item(row, 1)" in key.source
+    for row in Sales.rows():
+        expected = (row[("Sales", "customer_id")] or 0, -row[("Sales", "amount")])
+        assert expected == key(row) == key(sales_row_as_dict(row))
+
+
+def test_sort_key_of_one_field_is_not_a_tuple():
+    key = Sales.accessors.sort_key([(Sales.payment_due, SortDirection.Descending)])
+    actual = [key(row) for row in Sales.rows()]
+    expected = [
+        datetime.date.min - datetime.date(2010, 1, 11),
+        datetime.date.min - datetime.date(2010, 1, 12),
+        datetime.date.min - datetime.date(2010, 1, 13),
+        datetime.timedelta(0),
+        datetime.timedelta(0),
+    ]
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_sort_key_wraps_descending_strings():
+    key = Customer.accessors.sort_key([(Customer.last_name, SortDirection.Descending)])
+    actual = sorted(Customer.rows(), key=key)
+    expected = ["Stefanovic", "Smith", "Jones", None]
+    assert expected == [row[("Customer", "last_name")] for row in actual]
+    assert isinstance(key(next(Customer.rows())), DescendingKey)
+
+
+def test_data_type_properties_are_not_rebuilt():
+    assert DataType.Int.converter is DataType.Int.converter
+    assert DataType.Currency.default is DataType.Currency.default
+    assert DataType.Date.sqlite_converter is DataType.Date.sqlite_converter
+
+
+def test_sqlite_values_converts_only_what_sqlite3_needs():
+    get = Sales.accessors.sqlite_values()
+    assert "sqlite0(item(row, 0))" in get.source
+    assert "item(row, 3)," in get.source
+    for row in Sales.rows():
+        expected = tuple(
+            convert(value)
+            for convert, value in zip(Sales.accessors.sqlite_converters, row.values())
+        )
+        assert expected == get(row) == get(sales_row_as_dict(row))
+        assert tuple is type(get(row))
@@ -0,0 +1,267 @@
+import csv
+import os
+
+import pytest
+
+from backports.tempfile import TemporaryDirectory
+
+from messydata.cache import RowCache, plan_fingerprint
+from messydata.plan import optimize
+
+from tests.conftest import *
+
+
+class Counted(object):
+    """rows(**kwargs) method that counts how often it's run"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def __call__(self, n=None, **kwargs):
+        self.calls += 1
+        return iter(self.rows[:n])
+
+
+def test_rows_are_produced_once_per_kwargs():
+    produce = Counted(list(range(10)))
+    row_cache = RowCache(produce)
+    assert list(range(10)) == list(row_cache.rows())
+    assert list(range(10)) == list(row_cache.rows())
+    assert [0, 1] == list(row_cache.rows(n=2))
+    assert [0, 1] == list(row_cache.rows(n=2))
+    assert 2 == produce.calls
+    assert (2, 2) == (row_cache.hits, row_cache.misses)
+
+
+def test_least_recently_read_rows_are_evicted():
+    produce = Counted(list(range(10)))
+    row_cache = RowCache(produce, max_rows=7)
+    for n in (3, 2, 3, 4):
+        list(row_cache.rows(n=n))
+    # reading 3 rows again left the 2 rows as the least recently read
+    assert [(("n", 3),), (("n", 4),)] == list(row_cache.results)
+    assert 7 == row_cache.size
+    assert 3 == produce.calls
+
+    # more rows than the budget aren't stored
+    assert list(range(10)) == list(row_cache.rows())
+    assert () not in row_cache.results
+    assert 7 == row_cache.size
+
+
+def test_unhashable_kwargs_are_not_cached():
+    produce = Counted([1, 2])
+    row_cache = RowCache(produce)
+    list(row_cache.rows(ids=[1, 2]))
+    list(row_cache.rows(ids=[1, 2]))
+    assert 2 == produce.calls
+    assert 0 == row_cache.size
+
+
+def test_invalidate():
+    produce = Counted(list(range(5)))
+    row_cache = RowCache(produce)
+    list(row_cache.rows())
+    list(row_cache.rows(n=1))
+    row_cache.invalidate(n=1)
+    assert [()] == list(row_cache.results)
+    assert 5 == row_cache.size
+    row_cache.invalidate()
+    assert 0 == row_cache.size
+    list(row_cache.rows())
+    assert 3 == produce.calls
+
+
+class Countries(Table):
+    id = IntField("ID")
+    name = StringField("Name")
+
+    calls = 0
+
+    @staticmethod
+    def rows(**kwargs):
+        Countries.calls += 1
+        for row in [(1, "Canada"), (2, "Mexico"), (3, "Peru")]:
+            if kwargs.get("id") in (None, row[0]):
+                yield Countries(*row)
+
+
+def test_cached_table():
+    cached = Countries.cache(max_rows=100)
+    Countries.calls = 0
+    assert Countries.all() == cached.all() == cached.all()
+    assert 2 == Countries.calls
+    assert [Countries.all()[1]] == cached.all(id=2) == cached.all(id=2)
+    assert 4 == Countries.calls
+    expected = (
+        "cache(directory=None, hash_sources=False, max_bytes=None, max_rows=100)\n"
+        "  table(Countries)"
+    )
+    assert expected == cached.explain()
+
+    # tables built on the cache read the cached rows
+    tbl = cached.where(Countries.id > 1).select(Countries.name)
+    assert [{"Name": "Mexico"}, {"Name": "Peru"}] == tbl.all()
+    assert "cache" == optimize(tbl.plan).inputs[0].inputs[0].operator
+    assert 4 == Countries.calls
+
+    tbl.invalidate(id=2)
+    cached.all(id=2)
+    cached.all()
+    assert 5 == Countries.calls
+    tbl.invalidate()
+    cached.all()
+    assert 6 == Countries.calls
+
+
+def test_cache_keeps_sqlite_reads_out_of_the_query():
+    with TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "test.db")
+        Customer.to_sqlite(db_path=db_path, table_name="customer")
+        customers = Customer.from_sqlite(db_path=db_path, table_name="customer")
+        tbl = customers.cache().sort((Customer.id, "desc"))
+        assert ["sort", "cache"] == [
+            optimize(tbl.plan).operator,
+            optimize(tbl.plan).inputs[0].operator,
+        ]
+        expected = customers.sort((Customer.id, "desc")).all()
+        assert expected == tbl.all(), "\nACTUAL: {}".format(tbl.all())
+
+
+def write_customers_csv(fp, names):
+    with open(fp, mode="w") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["id", "First Name", "Last Name"])
+        for i, (first_name, last_name) in enumerate(names):
+            writer.writerow([i, first_name, last_name])
+
+
+def customer_pivot(fp):
+    return Customer.from_csv(fp).where(Customer.id > 0).pivot(
+        [Customer.last_name], [(Customer.id, "max")]
+    )
+
+
+def not_produced(**kwargs):
+    raise AssertionError("the rows should have been read from disk")
+
+
+def cached_files(folder):
+    return sorted(name for name in os.listdir(folder) if name.endswith(".rows"))
+
+
+class Family(Table):
+    last_name = StringField("Family")
+    city = StringField("City")
+
+    @staticmethod
+    def rows(**kwargs):
+        return []
+
+
+def customer_families(customers_fp, families_fp):
+    # customers with the same last name share their family's values
+    return Customer.from_csv(customers_fp).join(
+        Family.from_csv(families_fp), Customer.last_name, Family.last_name
+    )
+
+
+@pytest.mark.parametrize("hash_sources", [False, True])
+def test_cache_on_disk(hash_sources):
+    with TemporaryDirectory() as folder:
+        fp = os.path.join(folder, "customers.csv")
+        families_fp = os.path.join(folder, "families.csv")
+        cache_dir = os.path.join(folder, "cache")
+        write_customers_csv(fp, [("Mark", "Smith"), ("Bob", "Smith"), ("Al", "Jones")])
+        with open(families_fp, mode="w") as fh:
+            fh.write("Family,City\nSmith,Toronto\nJones,Lima\n")
+        expected = customer_families(fp, families_fp).all()
+        cached = customer_families(fp, families_fp).cache(
+            directory=cache_dir, hash_sources=hash_sources
+        )
+        assert expected == cached.all()
+        assert 1 == len(cached_files(cache_dir))
+
+        # a later run of the same pipeline replays the file
+        replayed = customer_families(fp, families_fp).cache(
+            directory=cache_dir, hash_sources=hash_sources
+        )
+        replayed.row_cache.produce = not_produced
+        assert expected == replayed.all(), "\nACTUAL: {}".format(replayed.all())
+
+        # until a source changes
+        with open(families_fp, mode="a") as fh:
+            fh.write("Stefanovic,Belgrade\n")
+        expected = customer_families(fp, families_fp).all()
+        assert expected == cached.all(), "\nACTUAL: {}".format(cached.all())
+        assert 2 == len(cached_files(cache_dir))
+
+        cached.invalidate()
+        assert [] == cached_files(cache_dir)
+
+
+def test_cache_on_disk_evicts_least_recently_read_files():
+    with TemporaryDirectory() as folder:
+        fp = os.path.join(folder, "customers.csv")
+        cache_dir = os.path.join(folder, "cache")
+        write_customers_csv(fp, [("Mark", "Stefanovic"), ("Bob", "Smith")])
+        cached = customer_pivot(fp).cache(directory=cache_dir)
+        cached.all(a=1)
+        size = os.path.getsize(os.path.join(cache_dir, cached_files(cache_dir)[0]))
+
+        cached = customer_pivot(fp).cache(directory=cache_dir, max_bytes=size * 2)
+        cached.all(a=2)
+        os.utime(os.path.join(cache_dir, cached_files(cache_dir)[0]), (0, 0))
+        os.utime(os.path.join(cache_dir, cached_files(cache_dir)[1]), (1, 1))
+        oldest = cached_files(cache_dir)[0]
+        cached.all(a=3)
+        files = cached_files(cache_dir)
+        assert 2 == len(files) and oldest not in files, "\nACTUAL: {}".format(files)
+
+
+def test_fingerprints_follow_the_plan():
+    fp = "customers.csv"
+    assert plan_fingerprint(customer_pivot(fp).plan) == plan_fingerprint(
+        customer_pivot(fp).plan
+    )
+    changed = Customer.from_csv(fp).where(Customer.id > 1).pivot(
+        [Customer.last_name], [(Customer.id, "max")]
+    )
+    assert plan_fingerprint(customer_pivot(fp).plan) != plan_fingerprint(changed.plan)
+    by_function = [
+        Customer.from_csv(fp).where(lambda row: row[("Customer", "id")] > 1).plan,
+        Customer.from_csv(fp).where(lambda row: row[("Customer", "id")] > 2).plan,
+    ]
+    assert plan_fingerprint(by_function[0]) != plan_fingerprint(by_function[1])
+
+
+def test_fingerprints_follow_what_functions_close_over():
+    fp = "customers.csv"
+
+    def above(threshold):
+        return Customer.from_csv(fp).where(
+            lambda row: row[("Customer", "id")] > threshold
+        )
+
+    def above_default(threshold):
+        return Customer.from_csv(fp).where(
+            lambda row, t=threshold: row[("Customer", "id")] > t
+        )
+
+    for make in (above, above_default):
+        assert plan_fingerprint(make(1).plan) == plan_fingerprint(make(1).plan)
+        assert plan_fingerprint(make(1).plan) != plan_fingerprint(make(2).plan)
+
+    limit = object()
+    tbl = Customer.from_csv(fp).where(lambda row: row is not limit)
+    with pytest.raises(ValueError):
+        plan_fingerprint(tbl.plan)
+
+
+def test_cache_on_disk_needs_file_sources():
+    with TemporaryDirectory() as folder:
+        with pytest.raises(ValueError):
+            Sales.where(Sales.amount > 100).cache(directory=folder)
+        with pytest.raises(ValueError):
+            Sales.from_iterable([]).cache(directory=folder)
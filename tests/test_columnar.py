@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from decimal import Decimal
+
+import pytest
+from hypothesis import given
+
+from messydata.columnar import Column, ColumnarTable
+
+from tests.conftest import *
+
+
+@pytest.mark.parametrize(
+    "data_type, values", [
+        (DataType.Int, [1, None, -5, 2 ** 62]),
+        (DataType.Float, [1.5, None, 0.0]),
+        (DataType.Boolean, [True, None, False]),
+        (DataType.Currency, [Decimal("100.00"), None, Decimal("-0.05")]),
+        (DataType.Date, [datetime.date(2010, 1, 1), None, datetime.date.min]),
+        (DataType.DateTime, [
+            datetime.datetime(2010, 1, 1, 13, 45, 12, 5), None, datetime.datetime.min
+        ]),
+    ]
+)
+def test_column_packs_values(data_type, values):
+    column = Column(data_type)
+    for value in values:
+        column.append(value)
+    assert column.is_packed
+    assert values == list(column)
+    assert values == [column[i] for i in range(len(values))]
+
+
+@pytest.mark.parametrize(
+    "data_type, values", [
+        (DataType.Int, [1, 2 ** 70]),
+        (DataType.Int, [1, True]),
+        (DataType.Int, [1, 2.5]),
+        (DataType.Currency, [Decimal("1.00"), Decimal("1.005")]),
+        (DataType.Currency, [Decimal("1.00"), 3]),
+        (DataType.String, ["a", None]),
+    ]
+)
+def test_column_falls_back_to_a_list(data_type, values):
+    column = Column(data_type)
+    for value in values:
+        column.append(value)
+    assert not column.is_packed
+    assert values == list(column)
+    assert [type(v) for v in values] == [type(v) for v in column]
+
+
+@given(st.lists(st.one_of(st.none(), st.integers(-2 ** 63, 2 ** 63 - 1))))
+def test_column_null_bitmap(values):
+    column = Column(DataType.Int)
+    for value in values:
+        column.append(value)
+    assert values == list(column)
+
+
+def test_columnar_table_matches_source():
+    columnar = ColumnarTable.from_table(Sales)
+    assert 5 == columnar.row_count
+    assert Sales.all() == columnar.all()
+    assert [1, 2, 3, 4, 4] == list(columnar.column(Sales.id))
+
+
+def test_columnar_table_feeds_operators():
+    columnar = ColumnarTable.from_table(Sales)
+    expected = Sales.pivot([Sales.customer_id], [(Sales.amount, "sum")]).all()
+    actual = columnar.pivot([Sales.customer_id], [(Sales.amount, "sum")]).all()
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_columnar_select_reads_only_selected_columns():
+    columnar = ColumnarTable.from_table(Sales)
+    expected = [
+        OrderedDict([("Amount", Decimal("100.00")), ("ID", 1)]),
+        OrderedDict([("Amount", Decimal("200.00")), ("ID", 2)]),
+        OrderedDict([("Amount", Decimal("300.00")), ("ID", 3)]),
+        OrderedDict([("Amount", Decimal("300.00")), ("ID", 4)]),
+        OrderedDict([("Amount", Decimal("300.00")), ("ID", 4)]),
+    ]
+    actual = columnar.select(Sales.amount, Sales.id).all()
+    assert expected == actual, "\nACTUAL: {}".format(actual)
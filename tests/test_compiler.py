@@ -0,0 +1,68 @@
+import pytest
+
+from messydata import compiler
+from messydata.compiler import compile_expression
+from messydata.field import CalculatedField
+
+from tests.conftest import *
+
+
+@pytest.mark.parametrize(
+    "table, expression", [
+        (Sales, Sales.amount * 1.04),
+        (Sales, Sales.amount >= 200),
+        (Sales, -Sales.id),
+        (Sales, Sales.sales_date + 3),
+        (Sales, Sales.customer_id.is_null() | (Sales.amount < 300)),
+        (Customer, Customer.first_name + " " + Customer.last_name),
+    ]
+)
+def test_compiled_expression_matches_interpreter(table, expression):
+    compiled = compile_expression(expression)
+    for row in table.rows():
+        assert expression(row) == compiled(row)
+
+
+def test_compiled_expression_is_flat():
+    compiled = compile_expression(2 * Sales.amount + Sales.id)
+    assert 1 == compiled.source.count("def ")
+    assert [201, 402, 603, 604, 604] == [compiled(row) for row in Sales.rows()]
+
+
+def test_compile_calculated_field():
+    calc = CalculatedField(
+        display_name="Discounted Amount",
+        expression=Sales.amount * 0.9,
+    )
+    compiled = compile_expression(calc)
+    assert [calc(row) for row in Sales.rows()] == [compiled(row) for row in Sales.rows()]
+
+
+def test_compile_deferred_row_value():
+    deferred = Customer.last_name.endswith("vic")
+    compiled = compile_expression(deferred)
+    assert [True, False, False, False] == [compiled(row) for row in Customer.rows()]
+
+
+def test_compile_lambda_is_returned_unchanged():
+    fn = lambda row: True
+    assert fn is compile_expression(fn)
+
+
+def test_compile_unrecognized_operand():
+    with pytest.raises(ValueError) as e:
+        compile_expression(Sales.amount + [1])
+    assert "Unrecognized expression value: [1]" == str(e.value)
+
+
+def test_interpret_expressions_switch():
+    expression = Sales.amount > 100
+    assert expression is compile_expression(expression, interpret=True)
+
+    compiler.interpret_expressions = True
+    try:
+        assert expression is compile_expression(expression)
+        actual = Sales.where(expression).select(Sales.id).all()
+    finally:
+        compiler.interpret_expressions = False
+    assert [2, 3, 4, 4] == [row["ID"] for row in actual]
@@ -1,4 +1,6 @@
 import pytest
+from hypothesis import given
+from hypothesis import strategies as st
 
 from messydata.converters import *
 
@@ -100,6 +102,73 @@ def test_try_datetime_invalid_input():
     assert try_datetime(ignore_errors=True)("abc") is None
 
 
+def outcome(fn, *args):
+    try:
+        return fn(*args)
+    except Exception:
+        return Exception
+
+
+def digits(max_value, width):
+    return st.integers(min_value=0, max_value=max_value).map(
+        lambda i: str(i).zfill(width)
+    )
+
+
+@st.composite
+def date_strings(draw):
+    """Strings in the layouts DateParser knows, with some out of range parts"""
+    year, month, day = draw(digits(2100, 4)), draw(digits(13, 2)), draw(digits(32, 2))
+    layout = draw(st.sampled_from(["iso", "us", "month_name"]))
+    if layout == "iso":
+        text = "{}-{}-{}".format(year, month, day)
+    elif layout == "us":
+        text = "{}/{}/{}".format(month.lstrip("0"), day, year)
+    else:
+        text = "{}-{}-{}".format(day, draw(st.sampled_from(["Jan", "feb", "DEC", "Foo"])), year)
+    if layout != "month_name" and draw(st.booleans()):
+        time = "{}:{}".format(draw(digits(25, 2)), draw(digits(60, 2)))
+        if draw(st.booleans()):
+            time += ":" + draw(digits(60, 2))
+            if draw(st.booleans()):
+                time += "." + draw(st.text("0123456789", min_size=1, max_size=6))
+        text += draw(st.sampled_from(["T", " "])) + time
+    return text
+
+
+@given(
+    texts=st.lists(
+        st.one_of(date_strings(), st.text(max_size=12), st.sampled_from(["", " 1/2/2010"])),
+        max_size=10,
+    )
+)
+def test_date_parser_matches_dateutil(texts):
+    date_parser = DateParser()
+    for text in texts:
+        expected = outcome(parse, text)
+        actual = outcome(date_parser.parse, text)
+        assert expected == actual, "\nTEXT: {!r}\nACTUAL: {!r}".format(text, actual)
+
+
+def test_date_parser_sniffs_the_layout_of_a_column():
+    date_parser = DateParser(cache_size=0)
+    assert date_parser.layout is None
+    assert datetime.datetime(2010, 1, 2) == date_parser.parse("1/2/2010")
+    assert date_parser.layout is us_layout
+    assert datetime.datetime(2010, 1, 3) == date_parser.parse("2010-01-03")
+    assert date_parser.layout is iso_layout
+    # dateutil parses what no layout matches, which doesn't change the layout
+    assert datetime.datetime(2010, 1, 4) == date_parser.parse("January 4, 2010")
+    assert date_parser.layout is iso_layout
+
+
+def test_date_parser_caches_values():
+    date_parser = DateParser(cache_size=2)
+    first = date_parser.parse("2010-01-02")
+    assert first is date_parser.parse("2010-01-02")
+    assert 1 == date_parser.parse.cache_info().hits
+
+
 @pytest.mark.parametrize(
     "val, expected", [
         (None, None),
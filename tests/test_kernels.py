@@ -0,0 +1,131 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from messydata.compiler import compile_expression
+from messydata.field import Expression
+from messydata.kernels import kernel_builders, select_kernel
+from messydata.operators import Operator
+from messydata.row import make_row
+
+from tests.conftest import *
+
+value_strategies = {
+    bool: st.booleans(),
+    int: st.integers(min_value=-10 ** 6, max_value=10 ** 6),
+    float: st.floats(min_value=-1e6, max_value=1e6),
+    Decimal: st.decimals(places=2, min_value=-10 ** 6, max_value=10 ** 6),
+    datetime.date: st.dates(),
+    datetime.datetime: st.datetimes(),
+    str: st.one_of(
+        st.text(max_size=5), st.sampled_from(["1", "2.5", "2010-01-02", "true"])
+    ),
+}
+any_value_st = st.one_of(st.none(), *value_strategies.values())
+
+
+def outcome(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        return type(e)
+
+
+def same(expected, actual):
+    if expected != expected:  # nan
+        return actual != actual
+    return type(expected) is type(actual) and expected == actual
+
+
+@given(
+    operator=st.sampled_from(sorted(kernel_builders, key=lambda op: op.name)),
+    left_type=st.sampled_from(sorted(value_strategies, key=lambda t: t.__name__)),
+    right_type=st.sampled_from(sorted(value_strategies, key=lambda t: t.__name__)),
+    data=st.data(),
+)
+def test_kernels_match_operator_functions(operator, left_type, right_type, data):
+    kernel, _ = select_kernel(operator, left_type, right_type)
+    # values of the declared types most of the time, anything now and then
+    left = data.draw(st.one_of(value_strategies[left_type], any_value_st))
+    right = data.draw(st.one_of(value_strategies[right_type], any_value_st))
+    if operator.is_binary:
+        args = (left, right)
+    else:
+        args = (left,)
+    expected, actual = outcome(operator.fn, *args), outcome(kernel, *args)
+    assert same(expected, actual), "\nACTUAL: {!r}\nEXPECTED: {!r}".format(
+        actual, expected
+    )
+
+
+@pytest.mark.parametrize(
+    "operator, left_type, right_type",
+    [
+        (Operator.Equals, int, int),
+        (Operator.LessThan, int, float),
+        (Operator.GreaterThan, datetime.date, str),
+        (Operator.Add, Decimal, Decimal),
+        (Operator.Add, datetime.date, int),
+        (Operator.Subtract, datetime.datetime, float),
+        (Operator.Multiply, int, Decimal),
+        (Operator.Divide, float, int),
+        (Operator.Negate, Decimal, None),
+    ],
+)
+def test_known_types_get_a_kernel(operator, left_type, right_type):
+    kernel, _ = select_kernel(operator, left_type, right_type)
+    assert kernel is not operator.fn
+
+
+@pytest.mark.parametrize(
+    "operator, left_type, right_type",
+    [
+        (Operator.Equals, int, None),
+        (Operator.Add, None, int),
+        (Operator.Add, str, int),
+        (Operator.Multiply, str, str),
+        (Operator.And, bool, bool),
+    ],
+)
+def test_unknown_or_mixed_types_fall_back(operator, left_type, right_type):
+    kernel, _ = select_kernel(operator, left_type, right_type)
+    assert kernel is operator.fn
+
+
+def test_kernels_are_shared():
+    assert select_kernel(Operator.Equals, int, int) is select_kernel(
+        Operator.Equals, int, int
+    )
+
+
+def test_expressions_pick_kernels_from_field_types():
+    expression = Sales.customer_id == 1
+    assert expression.kernel is not Operator.Equals.fn
+    assert bool is expression.result_type
+
+    total = Sales.amount + Sales.amount
+    assert Decimal is total.result_type
+    assert total.kernel is not Operator.Add.fn
+    # the result type of an expression is the operand type of the next one
+    doubled = Expression(Operator.GreaterThan, total, Decimal(10))
+    assert doubled.kernel is not Operator.GreaterThan.fn
+
+    later = Sales.sales_date + 3
+    assert datetime.datetime is later.result_type
+
+
+def test_expressions_evaluate_unconverted_values():
+    keys = list(Sales.fields.keys())
+    row = make_row(keys, ["1", "2", "3", "2010-01-02", "10.5", None])
+    for expression, expected in (
+        # the general operator functions deal with whatever the kernels get
+        (Sales.customer_id == 2, True),
+        (Sales.amount > 10, True),
+        (Sales.sales_date + 3, "2010-01-023"),
+    ):
+        for fn in (expression, compile_expression(expression)):
+            actual = outcome(fn, row)
+            assert expected == actual, "\nACTUAL: {!r}".format(actual)
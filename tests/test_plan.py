@@ -0,0 +1,251 @@
+import csv
+import os
+from collections import OrderedDict
+
+import pytest
+from backports.tempfile import TemporaryDirectory
+
+from messydata import plan
+from messydata.plan import expression_fields, optimize
+
+from tests.conftest import *
+
+
+def sales_with_customers():
+    return Sales.join(
+        right=Customer,
+        how="left",
+        left_on=Sales.customer_id,
+        right_on=Customer.id
+    )
+
+
+def operators(node):
+    return [node.operator] + [op for child in node.inputs for op in operators(child)]
+
+
+def run_unoptimized(tbl):
+    plan.optimize_plans = False
+    try:
+        return tbl.all()
+    finally:
+        plan.optimize_plans = True
+
+
+def test_plan_describes_operators():
+    tbl = sales_with_customers().where(Sales.amount >= 200).select(Sales.id)
+    assert ["select", "where", "join", "table", "table"] == operators(tbl.plan)
+    assert Sales is tbl.plan.inputs[0].inputs[0].inputs[0].table
+
+
+def test_explain():
+    expected = (
+        "select(columns=[Sales.id])\n"
+        "  where(condition=[Amount] >= 200)\n"
+        "    table(Sales)"
+    )
+    actual = Sales.where(Sales.amount >= 200).select(Sales.id).explain()
+    assert expected == actual
+
+
+def test_filter_pushed_below_join_and_assign():
+    tbl = sales_with_customers().assign(
+        "Tax", Sales.amount * 0.1
+    ).where(
+        Sales.amount >= 200
+    )
+    expected = ["assign", "join", "where", "table", "table"]
+    assert expected == operators(optimize(tbl.plan))
+
+    plan.optimize_plans = False
+    try:
+        unoptimized = tbl.all()
+    finally:
+        plan.optimize_plans = True
+    assert unoptimized == tbl.all()
+
+
+def test_filter_not_pushed_to_null_supplying_side():
+    tbl = sales_with_customers().where(Customer.first_name.startswith("M"))
+    assert ["where", "join", "table", "table"] == operators(optimize(tbl.plan))
+    assert [1, 3, 4] == [row["ID"] for row in tbl.all()]
+
+
+def test_filter_pushed_to_right_side_of_inner_join():
+    tbl = Sales.join(
+        right=Customer,
+        how="inner",
+        left_on=Sales.customer_id,
+        right_on=Customer.id
+    ).where(Customer.first_name.startswith("Mi"))
+    assert ["join", "table", "where", "table"] == operators(optimize(tbl.plan))
+    assert [4] == [row["ID"] for row in tbl.all()]
+
+
+def test_lambda_filter_is_not_pushed_down():
+    tbl = sales_with_customers().where(lambda row: row[("Sales", "amount")] > 100)
+    assert ["where", "join", "table", "table"] == operators(optimize(tbl.plan))
+
+
+def test_adjacent_selects_are_merged():
+    tbl = Sales.select(Sales.id, Sales.amount, Sales.customer_id).select(Sales.amount)
+    optimized = optimize(tbl.plan)
+    assert ["select", "table"] == operators(optimized)
+    assert [Sales.amount] == optimized.args["columns"]
+
+
+def test_sort_of_sort_is_a_single_sort():
+    tbl = Sales.sort((Sales.id, "asc")).sort((Sales.amount, "desc"))
+    optimized = optimize(tbl.plan)
+    assert ["sort", "table"] == operators(optimized)
+    assert [3, 4, 4, 2, 1] == [row["ID"] for row in tbl.all()]
+
+
+def test_empty_sort_is_dropped():
+    assert ["table"] == operators(optimize(Sales.sort().plan))
+    assert Sales.all() == Sales.sort().all()
+
+
+@pytest.mark.parametrize(
+    "expression, expected", [
+        (Sales.amount >= 200, {("Sales", "amount")}),
+        (Sales.customer_id.is_null(), {("Sales", "customer_id")}),
+        (Sales.customer_id.is_null() | (Sales.id == 2),
+         {("Sales", "customer_id"), ("Sales", "id")}),
+        (lambda row: True, None),
+    ]
+)
+def test_expression_fields(expression, expected):
+    assert expected == expression_fields(expression)
+
+
+def test_unread_calculation_is_dropped():
+    tbl = Sales.assign("Tax", Sales.amount * 0.1).select(Sales.id)
+    assert ["select", "table"] == operators(optimize(tbl.plan))
+    assert [1, 2, 3, 4, 4] == [row["ID"] for row in tbl.all()]
+
+
+def test_join_inputs_are_narrowed():
+    tbl = sales_with_customers().select(Sales.id, Customer.first_name)
+    optimized = optimize(tbl.plan)
+    assert ["select", "join", "select", "table", "select", "table"] == operators(
+        optimized
+    )
+    left, right = optimized.inputs[0].inputs
+    assert [Sales.id, Sales.customer_id] == left.args["columns"]
+    assert [Customer.id, Customer.first_name] == right.args["columns"]
+
+    plan.optimize_plans = False
+    try:
+        unoptimized = tbl.all()
+    finally:
+        plan.optimize_plans = True
+    assert unoptimized == tbl.all()
+
+
+def test_columns_pruned_into_csv_source():
+    with TemporaryDirectory() as folder:
+        fp = os.path.join(folder, "customer.csv")
+        with open(fp, "w") as fh:
+            writer = csv.writer(fh, lineterminator="\n")
+            writer.writerow(Customer.field_display_names())
+            writer.writerows(row.values() for row in Customer.display_rows())
+
+        tbl = Customer.from_csv(fp).where(Customer.id > 4).select(
+            Customer.first_name
+        )
+        source = optimize(tbl.plan).inputs[0].inputs[0]
+        assert "from_csv" == source.operator
+        assert [Customer.id, Customer.first_name] == source.args["columns"]
+
+        actual = tbl.all()
+    expected = [
+        OrderedDict([("First Name", "Mike")]),
+        OrderedDict([("First Name", "Sally")]),
+        OrderedDict([("First Name", "Mr. X")]),
+    ]
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_sort_order_survives_order_preserving_operators():
+    keys = [("Sales", "customer_id"), ("Sales", "id")]
+    tbl = Sales.sort((Sales.customer_id, "asc"), (Sales.id, "asc"))
+    filtered = tbl.where(Sales.amount > 100).select(Sales.customer_id, Sales.id)
+    assert plan.sorted_on(filtered.plan, keys)
+    assert plan.sorted_on(tbl.plan, keys[:1])
+    assert not plan.sorted_on(tbl.plan, keys[1:])
+    # without the more significant field the rest isn't ordered anymore
+    assert not plan.sorted_on(tbl.select(Sales.id).plan, keys[1:])
+    assert not plan.sorted_on(Sales.sort((Sales.customer_id, "desc")).plan, keys[:1])
+    assert not plan.sorted_on(Sales.plan, keys[:1])
+    pivoted = Sales.pivot([Sales.customer_id], [(Sales.amount, "sum")])
+    assert plan.sorted_on(pivoted.plan, keys[:1])
+
+
+def test_reassigned_calculation_is_not_pruned():
+    # the second "X" keeps the position of the first, so it isn't the last field
+    tbl = (
+        Sales.assign("X", Sales.id * 2, data_type="float")
+        .assign("Y", Sales.id + 1)
+        .assign("X", Sales.id * 3, data_type="float")
+    )
+    assert ("Calculation", "x") == tbl.plan.args["key"]
+    selected = tbl.select(tbl.fields[("Calculation", "x")])
+    expected = [3.0, 6.0, 9.0, 12.0, 12.0]
+    actual = [row["X"] for row in selected.all()]
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+    ordered = Sales.sort((Sales.id, "asc")).assign("X", Sales.id * 2).assign("Y", Sales.id + 1)
+    assert plan.sorted_on(ordered.plan, [("Sales", "id")])
+
+
+class Left(Table):
+    k = IntField("k")
+
+    @staticmethod
+    def rows(**kwargs):
+        return [Left(1)]
+
+
+class Right(Table):
+    k = IntField("rk")
+    x = StringField("x")
+
+    @staticmethod
+    def rows(**kwargs):
+        return [Right(1, "a"), Right(1, "b")]
+
+
+@pytest.mark.parametrize("strategy", ["hash", "sort"])
+@pytest.mark.parametrize(
+    "how, relationship",
+    [
+        ("inner", JoinRelationship.ManyToOne),
+        ("inner", JoinRelationship.OneToOne),
+        ("right", JoinRelationship.OneToMany),
+    ],
+)
+def test_filter_not_pushed_below_join_that_keeps_first_row(how, relationship, strategy):
+    joined = Left.join(
+        right=Right,
+        left_on=Left.k,
+        right_on=Right.k,
+        how=how,
+        relationship=relationship,
+        strategy=strategy,
+    )
+    tbl = joined.where(Right.x == "b")
+    assert "where" == optimize(tbl.plan).operator
+    expected = run_unoptimized(tbl)
+    assert expected == tbl.all(), "\nACTUAL: {}".format(tbl.all())
+
+
+def test_filter_not_pushed_below_assign_it_reads():
+    tbl = (
+        Sales.assign("X", Sales.id * 2, data_type="float")
+        .assign("X", Sales.id * 3, data_type="float")
+    )
+    filtered = tbl.where(tbl.fields[("Calculation", "x")] > 6)
+    assert ["where", "assign", "table"] == operators(optimize(filtered.plan))
+    expected = [3, 4, 4]
+    actual = [row["ID"] for row in filtered.all()]
+    assert expected == actual, "\nACTUAL: {}".format(actual)
@@ -0,0 +1,62 @@
+import pickle
+from collections import OrderedDict
+
+from messydata.row import make_row, row_class, row_combiner, to_row, values_getter
+
+from tests.conftest import *
+
+keys = (("Sales", "id"), ("Sales", "amount"))
+
+
+def test_row_reads_like_a_dict():
+    row = make_row(keys, (1, 100))
+    assert 100 == row[("Sales", "amount")]
+    assert row.get(("Sales", "missing")) is None
+    assert ("Sales", "id") in row
+    assert list(keys) == list(row)
+    assert (1, 100) == row.values()
+    assert [(("Sales", "id"), 1), (("Sales", "amount"), 100)] == row.items()
+
+
+def test_row_equals_ordered_dict():
+    row = make_row(keys, (1, 100))
+    assert OrderedDict(zip(keys, (1, 100))) == row
+    assert row == OrderedDict(zip(keys, (1, 100)))
+    assert row != OrderedDict(zip(reversed(keys), (100, 1)))
+    assert row == dict(zip(keys, (1, 100)))
+    assert row != (1, 100)
+
+
+def test_rows_of_a_schema_share_a_class():
+    assert row_class(keys) is type(make_row(keys, (1, 100)))
+    assert type(Sales(1, 4, 1, None, 100, None)) is type(Sales(2, 4, 1, None, 100, None))
+
+
+def test_row_has_no_instance_dict():
+    assert not hasattr(make_row(keys, (1, 100)), "__dict__")
+
+
+def test_row_pickles():
+    row = make_row(keys, (1, 100))
+    assert row == pickle.loads(pickle.dumps(row))
+
+
+def test_to_row():
+    mapping = OrderedDict(zip(keys, (1, 100)))
+    assert mapping == to_row(mapping)
+
+
+def test_values_getter_reads_other_row_formats():
+    get = values_getter(reversed(keys))
+    assert (100, 1) == get(make_row(keys, (1, 100)))
+    assert (100, 1) == get(dict(zip(keys, (1, 100))))
+
+
+def test_row_combiner_prefers_right_values():
+    right_keys = (("Sales", "amount"), ("Customer", "id"))
+    combine = row_combiner(keys, right_keys)
+    actual = combine(make_row(keys, (1, 100)), make_row(right_keys, (None, 4)))
+    expected = OrderedDict(
+        [(("Sales", "id"), 1), (("Sales", "amount"), None), (("Customer", "id"), 4)]
+    )
+    assert expected == actual, "\nACTUAL: {}".format(actual)
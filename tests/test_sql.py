@@ -0,0 +1,516 @@
+import os
+from collections import OrderedDict
+from decimal import Decimal
+
+import pytest
+from backports.tempfile import TemporaryDirectory
+
+from messydata import plan, table
+from messydata.field import Expression
+from messydata.operators import Operator
+from messydata.plan import optimize
+from messydata.sql import condition_to_sql, where_clause
+
+from tests.conftest import *
+
+columns = OrderedDict(zip(Sales.fields.keys(), Sales.sql_fields().keys()))
+
+
+@pytest.fixture
+def customer_db():
+    with TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "test.db")
+        Customer.to_sqlite(db_path=db_path, table_name="customer")
+        yield db_path
+
+
+class Prices(Table):
+    id = IntField("ID")
+    price = CurrencyField("Price")
+    weight = FloatField("Weight")
+
+    @staticmethod
+    def rows(**kwargs):
+        return [
+            Prices(1, Decimal("100.50"), 2.5),
+            Prices(2, Decimal("2.50"), 0.4),
+            Prices(3, Decimal("0.50"), 100.7),
+            Prices(4, Decimal("2"), -1.5),
+            Prices(5, Decimal(0), 0.0),
+        ]
+
+
+@pytest.fixture
+def prices_db():
+    with TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "test.db")
+        Prices.to_sqlite(db_path=db_path, table_name="prices")
+        yield db_path
+
+
+def test_comparison_to_sql():
+    expected = ("((amount IS NOT NULL AND amount <> 0) AND amount >= ?)", [200.0])
+    actual = condition_to_sql(Sales.amount >= Decimal(200), columns, Sales.fields)
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_comparison_to_int_truncates_like_python():
+    # the operator functions convert the amount to an int before comparing
+    cast = "CAST(amount AS INTEGER)"
+    expected = (
+        "(({c} IS NOT NULL AND {c} <> 0) AND {c} > ?)".format(c=cast), [100]
+    )
+    actual = condition_to_sql(Sales.amount > 100, columns, Sales.fields)
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+    # but a literal written first is converted to the type of the amount
+    actual = condition_to_sql(
+        Expression(Operator.LessThan, 100, Sales.amount), columns, Sales.fields
+    )
+    assert cast not in actual[0], "\nACTUAL: {}".format(actual)
+
+
+def test_float_compared_to_currency_stays_in_python():
+    # the float would be rounded to cents first
+    prices = OrderedDict(zip(Prices.fields.keys(), Prices.sql_fields().keys()))
+    condition = Prices.weight > Prices.price
+    assert condition_to_sql(condition, prices, Prices.fields) is None
+
+
+def test_comparison_to_falsy_literal():
+    # the operator functions treat two empty values as equal
+    expected = ("(NOT (customer_id IS NOT NULL AND customer_id <> 0))", [])
+    assert expected == condition_to_sql(Sales.customer_id == 0, columns, Sales.fields)
+
+
+@pytest.mark.parametrize(
+    "condition", [
+        Sales.amount * 2,
+        Sales.customer_id.is_null(),
+        Sales.sales_date > datetime.date(2010, 1, 1),
+        Sales.amount > "100",
+        lambda row: True,
+    ]
+)
+def test_untranslatable_conditions(condition):
+    assert condition_to_sql(condition, columns, Sales.fields) is None
+
+
+def test_where_clause_keeps_residual_conditions():
+    is_null = Sales.customer_id.is_null()
+    where_sql, params, residual = where_clause(
+        [Sales.amount > Decimal(100), is_null], columns, Sales.fields
+    )
+    assert " WHERE ((amount IS NOT NULL AND amount <> 0) AND amount > ?)" == where_sql
+    assert [100.0] == params
+    assert [is_null] == residual
+
+
+def test_from_sqlite_where(customer_db):
+    actual = Customer.from_sqlite(
+        db_path=customer_db,
+        table_name="customer",
+        where=[Customer.id > 4, Customer.first_name.startswith("M")]
+    ).all()
+    expected = [
+        OrderedDict([('id', 6), ('First Name', 'Mike'), ('Last Name', 'Smith')]),
+        OrderedDict([('id', 8), ('First Name', 'Mr. X'), ('Last Name', None)])
+    ]
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+@pytest.fixture
+def sales_db():
+    with TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "test.db")
+        Sales.to_sqlite(db_path=db_path, table_name="sales")
+        Customer.to_sqlite(db_path=db_path, table_name="customer")
+        yield db_path
+
+
+@pytest.mark.parametrize(
+    "condition", [
+        Sales.id >= 3,
+        Sales.amount == 300,
+        Sales.id != 4,
+        Sales.amount == 0,
+        Sales.amount > Sales.id,
+        Sales.sales_date < datetime.datetime(2010, 1, 3),
+        Sales.customer_id.is_null() | (Sales.id == 2),
+    ]
+)
+def test_where_pushed_into_sqlite_matches_python(sales_db, condition):
+    tbl = Sales.from_sqlite(db_path=sales_db, table_name="sales").where(condition)
+    plan.optimize_plans = False
+    try:
+        expected = tbl.all()
+    finally:
+        plan.optimize_plans = True
+    assert expected == tbl.all()
+
+
+@pytest.mark.parametrize(
+    "condition", [
+        Prices.price > 100,
+        Prices.price == 2,
+        Prices.price >= 2.5,
+        Prices.price > Decimal("100.5"),
+        Prices.price == 0,
+        Prices.weight >= 100,
+        Prices.weight == 0,
+        Prices.weight < 1.5,
+        Prices.price < Prices.weight,
+        Prices.weight > Prices.price,
+        Prices.id > Prices.weight,
+        Prices.id > 1.5,
+        Expression(Operator.LessThan, 2, Prices.price),
+        Expression(Operator.LessThan, 1.5, Prices.id),
+        Expression(Operator.Or, Prices.price == 2, Prices.weight > 100),
+    ]
+)
+def test_numeric_comparisons_pushed_into_sqlite_match_python(prices_db, condition):
+    tbl = Prices.from_sqlite(db_path=prices_db, table_name="prices").where(condition)
+    expected = run_in_python(tbl)
+    actual = tbl.all()
+    assert expected == actual, "\nACTUAL: {}\nEXPECTED: {}".format(actual, expected)
+
+
+def test_where_over_sqlite_is_pushed_into_the_source(customer_db):
+    tbl = Customer.from_sqlite(db_path=customer_db, table_name="customer").where(
+        Customer.id >= 6
+    )
+    optimized = optimize(tbl.plan)
+    assert "from_sqlite" == optimized.operator
+    assert 1 == len(optimized.args["where"])
+
+
+def test_from_sqlite_reads_only_selected_columns(customer_db):
+    tbl = Customer.from_sqlite(db_path=customer_db, table_name="customer").select(
+        Customer.last_name
+    )
+    source = plan.prune_columns(plan.rewrite(tbl.plan), set(tbl.fields)).inputs[0]
+    assert [Customer.last_name] == source.args["columns"]
+    assert 4 == len(tbl.all())
+
+
+def test_from_sqlite_columns_keep_residual_condition_fields(customer_db):
+    actual = Customer.from_sqlite(
+        db_path=customer_db,
+        table_name="customer",
+        where=Customer.first_name.startswith("M"),
+        columns=[Customer.id],
+    ).all()
+    expected = [
+        OrderedDict([("id", 4), ("First Name", "Mark")]),
+        OrderedDict([("id", 6), ("First Name", "Mike")]),
+        OrderedDict([("id", 8), ("First Name", "Mr. X")]),
+    ]
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def run_in_python(tbl):
+    plan.optimize_plans = False
+    try:
+        return tbl.all()
+    finally:
+        plan.optimize_plans = True
+
+
+def sqlite_pipelines(db_path):
+    sales = Sales.from_sqlite(db_path=db_path, table_name="sales")
+    customers = Customer.from_sqlite(db_path=db_path, table_name="customer")
+    joined = sales.join(
+        right=customers, how="left", left_on=Sales.customer_id, right_on=Customer.id
+    )
+    return [
+        sales.sort((Sales.customer_id, "desc"), (Sales.amount, "asc")),
+        sales.sort((Sales.payment_due, "asc")).select(Sales.id, Sales.payment_due),
+        sales.top(2, (Sales.amount, "desc")),
+        sales.select(Sales.id, Sales.amount).unique(),
+        sales.pivot([Sales.customer_id], [(Sales.amount, "sum"), (Sales.id, "max")]),
+        sales.pivot([Sales.sales_date], [(Sales.payment_due, "min")], sort=False),
+        sales.assign("Doubled", Sales.amount * 2).assign(
+            "Net", Sales.amount + -Sales.item_id, data_type="int"
+        ),
+        sales.assign("Ratio", Sales.amount / Sales.item_id, data_type="float"),
+        customers.assign("Name", Customer.first_name + " " + Customer.last_name),
+        joined.where(Sales.amount >= 200).select(Sales.id, Customer.first_name),
+        sales.join(
+            right=customers, left_on=Sales.customer_id, right_on=Customer.id
+        ).sort((Customer.last_name, "asc")),
+    ]
+
+
+@pytest.mark.parametrize("index", range(11))
+def test_pipeline_run_in_sqlite_matches_python(sales_db, index):
+    tbl = sqlite_pipelines(sales_db)[index]
+    assert "from_sqlite_query" == optimize(tbl.plan).operator
+    expected = run_in_python(tbl)
+    actual = tbl.all()
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def price_pipelines(db_path):
+    prices = Prices.from_sqlite(db_path=db_path, table_name="prices")
+    return [
+        prices.sort((Prices.weight, "desc")).where(Prices.price > 100),
+        prices.select(Prices.id, Prices.price).where(Prices.price == 2),
+        prices.sort((Prices.id, "asc")).where(Prices.weight >= 100),
+        prices.sort((Prices.id, "desc")).where(Prices.weight == 0),
+        prices.unique().where(Prices.price < Prices.weight),
+        prices.assign("Expensive", Prices.price > 100, data_type="bool"),
+        prices.assign("Heavy", Prices.weight >= 2, data_type="bool"),
+        prices.join(
+            right=prices.select(Prices.id).sort((Prices.id, "asc")),
+            left_on=Prices.id,
+            right_on=Prices.id,
+        ).where(Prices.price >= 2),
+    ]
+
+
+@pytest.mark.parametrize("index", range(8))
+def test_numeric_pipeline_run_in_sqlite_matches_python(prices_db, index):
+    tbl = price_pipelines(prices_db)[index]
+    assert "from_sqlite_query" == optimize(tbl.plan).operator
+    expected = run_in_python(tbl)
+    actual = tbl.all()
+    assert expected == actual, "\nACTUAL: {}\nEXPECTED: {}".format(actual, expected)
+
+
+def test_untranslatable_step_runs_in_python(sales_db):
+    sales = Sales.from_sqlite(db_path=sales_db, table_name="sales")
+    tbl = sales.sort((Sales.amount, "desc")).assign(
+        "No Customer", Sales.customer_id.is_null()
+    )
+    optimized = optimize(tbl.plan)
+    assert "assign" == optimized.operator
+    assert "from_sqlite_query" == optimized.inputs[0].operator
+    assert run_in_python(tbl) == tbl.all()
+
+
+def test_pipeline_over_two_databases_runs_in_python(sales_db, customer_db):
+    tbl = Sales.from_sqlite(db_path=sales_db, table_name="sales").join(
+        right=Customer.from_sqlite(db_path=customer_db, table_name="customer"),
+        left_on=Sales.customer_id,
+        right_on=Customer.id,
+    )
+    assert "join" == optimize(tbl.plan).operator
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_from_sqlite_in_parallel(monkeypatch, sales_db, ordered):
+    monkeypatch.setattr(table, "sqlite_range_size", 2)
+    sales = Sales.from_sqlite(db_path=sales_db, table_name="sales")
+    expected = sales.all()
+    actual = Sales.from_sqlite(
+        db_path=sales_db, table_name="sales", processes=2, ordered=ordered
+    ).all()
+    if not ordered:
+        expected.sort(key=repr)
+        actual.sort(key=repr)
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+    where = [Sales.amount > 100, Sales.customer_id.is_null()]
+    expected = sales.where(where[0]).where(where[1]).all()
+    tbl = Sales.from_sqlite(
+        db_path=sales_db, table_name="sales", where=where, processes=2
+    )
+    # a parallel scan isn't collapsed into one query
+    assert "from_sqlite" == optimize(tbl.where(Sales.id > 0).plan).operator
+    actual = tbl.all()
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_from_sqlite_in_parallel_resumes_from_checkpoint(monkeypatch, sales_db):
+    monkeypatch.setattr(table, "sqlite_range_size", 2)
+    checkpoint = os.path.join(os.path.dirname(sales_db), "scan.json")
+    failing = [True]
+
+    def fail_on_last_row(row):
+        if failing[0] and row[("Sales", "customer_id")] is None:
+            raise ValueError("failed")
+        return True
+
+    sales = Sales.from_sqlite(
+        db_path=sales_db,
+        table_name="sales",
+        where=[fail_on_last_row],
+        processes=2,
+        checkpoint=checkpoint,
+    )
+    read = []
+    with pytest.raises(ValueError):
+        for row in sales.rows():
+            read.append(row[("Sales", "customer_id")])
+    assert [4, 5, 4, 6] == read, "\nACTUAL: {}".format(read)
+    assert os.path.exists(checkpoint)
+
+    failing[0] = False
+    # the first two ranges were read before it failed
+    actual = [row[("Sales", "customer_id")] for row in sales.rows()]
+    assert [None] == actual, "\nACTUAL: {}".format(actual)
+    assert not os.path.exists(checkpoint)
+
+
+def test_from_sqlite_in_parallel_read_in_part_starts_over(monkeypatch, sales_db):
+    monkeypatch.setattr(table, "sqlite_range_size", 2)
+    checkpoint = os.path.join(os.path.dirname(sales_db), "scan.json")
+    sales = Sales.from_sqlite(
+        db_path=sales_db, table_name="sales", processes=2, checkpoint=checkpoint
+    )
+    rows = sales.rows()
+    for _ in range(3):
+        next(rows)
+    rows.close()
+    assert not os.path.exists(checkpoint)
+    assert 2 == len(sales.head(2))
+    assert not os.path.exists(checkpoint)
+
+    actual = [row["ID"] for row in sales.all()]
+    assert [1, 2, 3, 4, 4] == actual, "\nACTUAL: {}".format(actual)
+
+
+@pytest.mark.parametrize("processes", [None, 2])
+def test_from_sqlite_from_watermark(sales_db, processes):
+    watermark = os.path.join(os.path.dirname(sales_db), "sales.watermark")
+
+    def new_sales():
+        return Sales.from_sqlite(
+            db_path=sales_db,
+            table_name="sales",
+            where=Sales.amount > 100,
+            processes=processes,
+            watermark=watermark,
+        )
+
+    sales = new_sales()
+    assert "from_sqlite" == optimize(sales.sort((Sales.id, "asc")).plan).inputs[0].operator
+    expected = Sales.from_sqlite(
+        db_path=sales_db, table_name="sales", where=Sales.amount > 100
+    ).all()
+    assert expected == sales.all()
+    assert [] == new_sales().all()
+
+    Sales.from_iterable(Sales.rows()[1:3]).to_sqlite(
+        db_path=sales_db, table_name="sales", mode="a"
+    )
+    actual = [row["ID"] for row in new_sales().all()]
+    assert [2, 3] == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_from_sqlite_from_watermark_reads_the_same_rows_every_time(sales_db):
+    watermark = os.path.join(os.path.dirname(sales_db), "sales.watermark")
+    sales = Sales.from_sqlite(db_path=sales_db, table_name="sales", watermark=watermark)
+    assert 2 == len(sales.head(2))
+    expected = [1, 2, 3, 4, 4]
+    for _ in range(2):
+        actual = [row["ID"] for row in sales.all()]
+        assert expected == actual, "\nACTUAL: {}".format(actual)
+    Sales.from_iterable(Sales.rows()[1:3]).to_sqlite(
+        db_path=sales_db, table_name="sales", mode="a"
+    )
+    # a table built on it reads it, not a copy of it with a watermark of its own
+    filtered = sales.where(Sales.amount > 100).select(Sales.id)
+    actual = [row["ID"] for row in filtered.all()]
+    assert [2, 3, 4, 4] == actual, "\nACTUAL: {}".format(actual)
+
+    actual = [
+        row["ID"]
+        for row in Sales.from_sqlite(
+            db_path=sales_db, table_name="sales", watermark=watermark
+        ).all()
+    ]
+    assert [2, 3] == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_from_sqlite_from_watermark_field(sales_db):
+    watermark = os.path.join(os.path.dirname(sales_db), "sales.watermark")
+
+    def new_sales():
+        return Sales.from_sqlite(
+            db_path=sales_db,
+            table_name="sales",
+            watermark=watermark,
+            watermark_field=Sales.sales_date,
+        )
+
+    assert 5 == len(new_sales().all())
+    later = Sales(9, 1, 1, datetime.datetime(2010, 2, 1), 50, None)
+    same_day = Sales(10, 1, 1, datetime.datetime(2010, 1, 3), 50, None)
+    Sales.from_iterable([later, same_day]).to_sqlite(
+        db_path=sales_db, table_name="sales", mode="a"
+    )
+    actual = [row["ID"] for row in new_sales().all()]
+    assert [9] == actual, "\nACTUAL: {}".format(actual)
+    assert [] == new_sales().all()
+
+
+def test_from_sqlite_reads_rows_by_key_list(sales_db):
+    sales = Sales.from_sqlite(
+        db_path=sales_db, table_name="sales", where=Sales.amount > 50
+    )
+    rows = sales._semi_join_rows(((("Sales", "customer_id")),), {(4,), (None,)})
+    actual = [row[("Sales", "id")] for row in rows]
+    assert [1, 3, 4] == actual, "\nACTUAL: {}".format(actual)
+    # dates are stored as text sqlite3 formats, so they're filtered in Python
+    assert sales._semi_join_rows(((("Sales", "sales_date")),), {(None,)}) is None
+
+
+def test_key_list_clause_falls_back_on_unsafe_values():
+    assert table.key_list_clause("amount", Sales.amount, [("abc",)]) is None
+    assert table.key_list_clause("amount", Sales.amount, [(float("nan"),)]) is None
+    expected = ("(amount IN (SELECT value FROM json_each(?)) OR amount IS NULL)", ["[2.5]"])
+    actual = table.key_list_clause("amount", Sales.amount, [(2.5,), (None,)])
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+    # sqlite3 stores an Int 0 as a null, yet a 0 in the database is still found
+    expected = ("id IN (SELECT value FROM json_each(?))", ["[0]"])
+    assert expected == table.key_list_clause("id", Sales.id, [(0,)])
+
+
+@pytest.mark.parametrize("processes", [None, 2])
+def test_prefiltered_join_against_sqlite(monkeypatch, sales_db, processes):
+    monkeypatch.setattr(table, "sqlite_range_size", 2)
+    sales = Sales.from_sqlite(db_path=sales_db, table_name="sales", processes=processes)
+    customers = Customer.where(Customer.id < 6)
+
+    def join(prefilter):
+        return customers.join(
+            right=sales,
+            left_on=Customer.id,
+            right_on=Sales.customer_id,
+            prefilter=prefilter,
+        ).all()
+
+    expected, actual = join(None), join("right")
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+    assert [1, 3] == [row["ID"] for row in actual]
+
+
+def test_prefiltered_join_reads_a_watermarked_side_once(sales_db):
+    watermark = os.path.join(os.path.dirname(sales_db), "sales.watermark")
+    sales = Sales.from_sqlite(db_path=sales_db, table_name="sales", watermark=watermark)
+    customers = Customer.from_sqlite(db_path=sales_db, table_name="customer")
+    actual = sales.join(
+        right=customers,
+        left_on=Sales.customer_id,
+        right_on=Customer.id,
+        prefilter="right",
+    ).all()
+    assert [1, 3, 4] == [row["ID"] for row in actual], "\nACTUAL: {}".format(actual)
+
+
+def test_merge_join_runs_in_sqlite(sales_db):
+    sales = Sales.from_sqlite(db_path=sales_db, table_name="sales")
+    customers = Customer.from_sqlite(db_path=sales_db, table_name="customer")
+    tbl = sales.sort((Sales.customer_id, "asc")).join(
+        right=customers.sort((Customer.id, "asc")),
+        left_on=Sales.customer_id,
+        right_on=Customer.id,
+    )
+    assert "merge" == tbl.plan.args["strategy"]
+    assert "from_sqlite_query" == optimize(tbl.plan).operator
+    plan.optimize_plans = False
+    try:
+        expected = tbl.all()
+    finally:
+        plan.optimize_plans = True
+    assert expected == tbl.all(), "\nACTUAL: {}".format(tbl.all())
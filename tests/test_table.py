@@ -1,12 +1,16 @@
 from collections import OrderedDict
 
+import contextlib
+import csv
 import os
+import sqlite3
 import pytest
 import shutil
 from backports.tempfile import TemporaryDirectory
 from decimal import Decimal
 from hypothesis import given
 
+from messydata import table
 from messydata.table import concat, dedupe_field_names
 from tests.conftest import *
 
@@ -254,6 +258,107 @@ def test_read_write_csv():
         assert expected == actual, "\nACTUAL: {}".format(actual)
 
 
+def write_customers_csv(fp, names):
+    with open(fp, mode="w") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["id", "First Name", "Last Name"])
+        for i, (first_name, last_name) in enumerate(names):
+            writer.writerow([i, first_name, last_name])
+
+
+customer_names = [("Mark", "Stefanovic"), ("Bob", ""), ("Jo, Ann", 'O"Neil')] * 40
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_read_csv_in_parallel(monkeypatch, ordered):
+    monkeypatch.setattr(table, "csv_chunk_size", 100)
+    with TemporaryDirectory() as folder:
+        fp = os.path.join(folder, "tmp.csv")
+        write_customers_csv(fp, customer_names)
+        expected = Customer.from_csv(fp).all()
+        actual = Customer.from_csv(fp, processes=3, ordered=ordered).all()
+        if not ordered:
+            actual = sorted(actual, key=lambda row: row["id"])
+        assert expected == actual, "\nACTUAL: {}".format(actual)
+
+        actual = Customer.from_csv(fp, processes=3, columns=[Customer.last_name]).all()
+        assert [row["Last Name"] for row in expected] == [
+            row["Last Name"] for row in actual
+        ]
+
+
+def test_read_csv_in_parallel_with_quoted_newlines(monkeypatch):
+    monkeypatch.setattr(table, "csv_chunk_size", 100)
+    names = list(customer_names)
+    names[60] = ("Multi\nLine", 'A "quoted"\n\nname')
+    with TemporaryDirectory() as folder:
+        fp = os.path.join(folder, "tmp.csv")
+        write_customers_csv(fp, names)
+        expected = Customer.from_csv(fp).all()
+        assert len(names) == len(expected)
+        assert "Multi\nLine" == expected[60]["First Name"]
+        actual = Customer.from_csv(fp, processes=3).all()
+        assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_read_csv_from_watermark():
+    with TemporaryDirectory() as folder:
+        fp = os.path.join(folder, "tmp.csv")
+        watermark = os.path.join(folder, "customers.watermark")
+        write_customers_csv(fp, customer_names[:3])
+
+        def customers():
+            return Customer.from_csv(fp, watermark=watermark)
+
+        expected = Customer.from_csv(fp).all()
+        actual = customers().all()
+        assert expected == actual, "\nACTUAL: {}".format(actual)
+        assert [] == customers().all()
+
+        # only the rows appended since, up to the last complete line
+        with open(fp, mode="a") as fh:
+            fh.write('3,"Sue\nEllen",Smith\n4,Al,Jones\n5,Partial')
+        actual = [(row["id"], row["First Name"]) for row in customers().all()]
+        assert [(3, "Sue\nEllen"), (4, "Al")] == actual, "\nACTUAL: {}".format(actual)
+        with open(fp, mode="a") as fh:
+            fh.write("ly,Written\n")
+        actual = [(row["id"], row["First Name"]) for row in customers().all()]
+        assert [(5, "Partially")] == actual, "\nACTUAL: {}".format(actual)
+
+        # rows only count as read once all of them have been
+        with open(fp, mode="a") as fh:
+            fh.write("6,Bo,Li\n7,Cy,Po\n")
+        assert 1 == len(customers().head(1))
+        assert [6, 7] == [row["id"] for row in customers().all()]
+
+        # a file that was replaced is read from the start
+        write_customers_csv(fp, customer_names[:2])
+        assert 2 == len(customers().all())
+
+        # every read of a table gets the rows that were new at its first read
+        with open(fp, mode="a") as fh:
+            fh.write("8,Di,Ho\n")
+        new_customers = customers()
+        assert [8] == [row["id"] for row in new_customers.all()]
+        with open(fp, mode="a") as fh:
+            fh.write("9,Ed,Yu\n")
+        assert [8] == [row["id"] for row in new_customers.all()]
+        assert [9] == [row["id"] for row in customers().all()]
+
+
+def test_csv_byte_ranges_end_on_lines():
+    with TemporaryDirectory() as folder:
+        fp = os.path.join(folder, "tmp.csv")
+        write_customers_csv(fp, customer_names)
+        first_row, ranges = table.csv_byte_ranges(fp, has_header=True, chunk_size=100)
+        with open(fp, mode="rb") as fh:
+            data = fh.read()
+        assert len(b"id,First Name,Last Name\r\n") == first_row
+        assert first_row == ranges[0][0] and len(data) == ranges[-1][1]
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            assert end == start and data[end - 1:end] == b"\n"
+
+
 def test_inner_join_unenforced():
     # Customer id 5 on the sales table is an orphaned key and should
     # not be included.
@@ -600,6 +705,163 @@ def test_to_sqlite():
         assert expected == actual, str(actual)
 
 
+def test_to_sqlite_in_bulk():
+    with TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "test.db")
+        reports = []
+        Sales.to_sqlite(
+            db_path=db_path,
+            table_name="sales",
+            batch_size=2,
+            indexes=[Sales.customer_id, (Sales.sales_date, Sales.item_id)],
+            journal_mode="WAL",
+            synchronous="OFF",
+            progress=lambda rows, rate: reports.append(rows),
+        )
+        expected = Sales.all()
+        actual = Sales.from_sqlite(db_path=db_path, table_name="sales").all()
+        assert expected == actual, "\nACTUAL: {}".format(actual)
+        assert [2, 4, 5] == reports, "\nACTUAL: {}".format(reports)
+        with contextlib.closing(sqlite3.connect(db_path)) as con:
+            indexes = con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name"
+            ).fetchall()
+            assert [
+                ("sales_customer_id_idx",),
+                ("sales_sales_date_item_id_idx",),
+            ] == indexes
+            assert "delete" == con.execute("PRAGMA journal_mode").fetchone()[0]
+
+        # appending keeps the indexes that are there
+        Sales.to_sqlite(db_path=db_path, table_name="sales", mode="a", batch_size=2)
+        assert 10 == len(Sales.from_sqlite(db_path=db_path, table_name="sales").all())
+        with contextlib.closing(sqlite3.connect(db_path)) as con:
+            count = con.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index'"
+            ).fetchone()[0]
+            assert 2 == count
+
+
+def test_to_sqlite_in_bulk_rolls_back_errors():
+    def bad_rows(**kwargs):
+        for row in Customer.rows():
+            yield row
+        raise ValueError("bad row")
+
+    customers = Customer.from_iterable(bad_rows())
+    with TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "test.db")
+        Customer.to_sqlite(db_path=db_path, table_name="customer", indexes=[Customer.id])
+        with pytest.raises(ValueError):
+            customers.to_sqlite(
+                db_path=db_path, table_name="customer", mode="a", batch_size=1
+            )
+        # an error in the writer thread is raised too
+        with pytest.raises(sqlite3.OperationalError):
+            Sales.to_sqlite(db_path=db_path, table_name="customer", mode="a", batch_size=1)
+        actual = Customer.from_sqlite(db_path=db_path, table_name="customer").all()
+        assert Customer.all() == actual, "\nACTUAL: {}".format(actual)
+        with contextlib.closing(sqlite3.connect(db_path)) as con:
+            indexes = con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            ).fetchall()
+            assert [("customer_id_idx",)] == indexes
+
+
+def test_to_sqlite_upsert():
+    changed = [
+        Customer(4, "Mark", "Stefanovic"),
+        Customer(6, "Michael", "Smith"),
+        Customer(9, "Jane", "Doe"),
+    ]
+    with TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "test.db")
+        Customer.to_sqlite(
+            db_path=db_path, table_name="customer", mode="u", keys=[Customer.id]
+        )
+        written = []
+        Customer.from_iterable(changed).to_sqlite(
+            db_path=db_path,
+            table_name="customer",
+            mode="u",
+            keys=[Customer.id],
+            progress=lambda rows, rate: written.append(rows),
+        )
+        # every row with a key that's there is updated, changed or not
+        assert [3] == written
+        expected = [
+            OrderedDict([("id", 4), ("First Name", "Mark"), ("Last Name", "Stefanovic")]),
+            OrderedDict([("id", 6), ("First Name", "Michael"), ("Last Name", "Smith")]),
+            OrderedDict([("id", 7), ("First Name", "Sally"), ("Last Name", "Jones")]),
+            OrderedDict([("id", 8), ("First Name", "Mr. X"), ("Last Name", None)]),
+            OrderedDict([("id", 9), ("First Name", "Jane"), ("Last Name", "Doe")]),
+        ]
+        actual = (
+            Customer.from_sqlite(db_path=db_path, table_name="customer")
+            .sort((Customer.id, "asc"))
+            .all()
+        )
+        assert expected == actual, "\nACTUAL: {}".format(actual)
+        with contextlib.closing(sqlite3.connect(db_path)) as con:
+            indexes = con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            ).fetchall()
+            assert [("customer_id_key",)] == indexes
+
+
+def test_to_sqlite_upsert_skips_unchanged_rows():
+    changed = [
+        Customer(4, "Mark", "Stefanovic"),
+        Customer(6, "Michael", "Smith"),
+        Customer(9, "Jane", "Doe"),
+    ]
+    with TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "test.db")
+        Customer.to_sqlite(db_path=db_path, table_name="customer")
+        for _ in range(2):
+            written = []
+            Customer.from_iterable(changed).to_sqlite(
+                db_path=db_path,
+                table_name="customer",
+                mode="u",
+                keys=[Customer.id],
+                skip_unchanged=True,
+                progress=lambda rows, rate: written.append(rows),
+            )
+        # the second load finds every hash unchanged
+        assert [0] == written
+        written = []
+        Customer.to_sqlite(
+            db_path=db_path,
+            table_name="customer",
+            mode="u",
+            keys=[Customer.id],
+            skip_unchanged=True,
+            progress=lambda rows, rate: written.append(rows),
+        )
+        # 4 is unchanged, 6 changed back and 7 and 8 had no hash yet
+        assert [3] == written
+        actual = (
+            Customer.from_sqlite(db_path=db_path, table_name="customer")
+            .sort((Customer.id, "asc"))
+            .all()
+        )
+        expected = Customer.all() + Customer.from_iterable(changed[2:]).all()
+        assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_to_sqlite_upsert_needs_keys():
+    with pytest.raises(ValueError):
+        Customer.to_sqlite(db_path=":memory:", table_name="customer", mode="u")
+    with pytest.raises(ValueError):
+        Customer.to_sqlite(db_path=":memory:", table_name="customer", mode="x")
+
+
+def test_to_sqlite_rejects_unknown_pragmas():
+    with pytest.raises(ValueError):
+        Customer.to_sqlite(db_path=":memory:", table_name="customer", journal_mode="x")
+
+
 def test_unique():
     expected = [
         OrderedDict([('Customer ID', 4)]),
@@ -661,3 +923,362 @@ def test_all_rows_sortable(rows):
         (Sales.amount, "desc")
     ).all()
     assert len(actual) == len(rows)
+
+
+@pytest.mark.parametrize("how", ["inner", "left", "right", "outer"])
+@pytest.mark.parametrize(
+    "relationship", [JoinRelationship.Unenforced, JoinRelationship.OneToOne]
+)
+def test_hash_join_matches_sort_join(how, relationship):
+    def join(strategy):
+        return Sales.join(
+            right=Customer,
+            how=how,
+            left_on=Sales.customer_id,
+            right_on=Customer.id,
+            relationship=relationship,
+            strategy=strategy
+        ).all()
+
+    expected, actual = join("sort"), join("hash")
+    assert sorted(map(repr, expected)) == sorted(map(repr, actual)), str(actual)
+
+
+def test_hash_join_streams_larger_side():
+    class Clicks(Table):
+        customer_id = IntField("Clicked By")
+
+        @staticmethod
+        def rows(**kwargs):
+            i = 0
+            while True:  # never exhausted, so it can't be fully read
+                i += 1
+                yield Clicks(i % 10)
+
+    actual = Clicks.join(
+        right=Customer,
+        how="inner",
+        left_on=Clicks.customer_id,
+        right_on=Customer.id,
+        strategy="hash"
+    ).head(3)
+    expected = [
+        OrderedDict([('Clicked By', 4), ('id', 4), ('First Name', 'Mark'),
+                     ('Last Name', 'Stefanovic')]),
+        OrderedDict([('Clicked By', 6), ('id', 6), ('First Name', 'Mike'),
+                     ('Last Name', 'Smith')]),
+        OrderedDict([('Clicked By', 7), ('id', 7), ('First Name', 'Sally'),
+                     ('Last Name', 'Jones')])
+    ]
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_join_invalid_strategy():
+    with pytest.raises(ValueError) as e:
+        Sales.join(
+            right=Customer,
+            left_on=Sales.customer_id,
+            right_on=Customer.id,
+            strategy="abc"
+        )
+    assert "'abc' is an invalid join strategy" in str(e.value)
+
+
+@pytest.mark.parametrize("how", ["inner", "left", "right", "outer"])
+@pytest.mark.parametrize(
+    "relationship", [JoinRelationship.Unenforced, JoinRelationship.OneToOne]
+)
+def test_merge_join_matches_sort_join(how, relationship):
+    def join(strategy):
+        return Sales.sort((Sales.customer_id, "asc")).join(
+            right=Customer,
+            how=how,
+            left_on=Sales.customer_id,
+            right_on=Customer.id,
+            relationship=relationship,
+            strategy=strategy
+        ).all()
+
+    expected, actual = join("sort"), join("merge")
+    assert sorted(map(repr, expected)) == sorted(map(repr, actual)), str(actual)
+    if how in ("inner", "left"):
+        assert expected == actual, str(actual)
+
+
+def test_join_of_sorted_tables_merges():
+    tbl = Sales.sort((Sales.customer_id, "asc")).join(
+        right=Customer.sort((Customer.id, "asc")),
+        left_on=Sales.customer_id,
+        right_on=Customer.id,
+    )
+    assert "merge" == tbl.plan.args["strategy"]
+    unsorted = Sales.join(right=Customer, left_on=Sales.customer_id, right_on=Customer.id)
+    assert "sort" == unsorted.plan.args["strategy"]
+    assert unsorted.all() == tbl.all()
+
+
+def test_merge_join_streams_both_sides():
+    class Clicks(Table):
+        customer_id = IntField("Clicked By")
+
+        @staticmethod
+        def rows(**kwargs):
+            i = 0
+            while True:  # never exhausted, so it can't be fully read
+                i += 1
+                yield Clicks(i // 2)
+
+    class Visits(Table):
+        customer_id = IntField("Visited By")
+
+        @staticmethod
+        def rows(**kwargs):
+            i = 2
+            while True:
+                i += 1
+                yield Visits(i)
+
+    actual = Clicks.join(
+        right=Visits,
+        left_on=Clicks.customer_id,
+        right_on=Visits.customer_id,
+        strategy="merge",
+    ).head(3)
+    expected = [(3, 3), (3, 3), (4, 4)]
+    assert expected == [(row["Clicked By"], row["Visited By"]) for row in actual]
+
+
+def test_merge_join_of_unsorted_side():
+    tbl = Sales.join(
+        right=Customer,
+        left_on=Sales.customer_id,
+        right_on=Customer.id,
+        strategy="merge",
+    )
+    with pytest.raises(ValueError) as e:
+        tbl.all()
+    assert "The left side of a merge join isn't sorted" in str(e.value)
+
+
+@pytest.mark.parametrize("strategy", ["hash", "sort"])
+@pytest.mark.parametrize(
+    "how, prefilter",
+    [("inner", "left"), ("inner", "right"), ("left", "right"), ("right", "left")],
+)
+def test_prefiltered_join_matches_join(how, prefilter, strategy):
+    def join(prefilter):
+        return Sales.join(
+            right=Customer,
+            how=how,
+            left_on=Sales.customer_id,
+            right_on=Customer.id,
+            strategy=strategy,
+            prefilter=prefilter,
+        ).all()
+
+    expected, actual = join(None), join(prefilter)
+    assert sorted(map(repr, expected)) == sorted(map(repr, actual)), str(actual)
+
+
+def test_prefiltered_join_matches_null_keys():
+    class Refund(Table):
+        customer_id = IntField("Refunded To")
+
+        @staticmethod
+        def rows(**kwargs):
+            return [Refund(None), Refund(6)]
+
+    actual = Sales.join(
+        right=Refund,
+        left_on=Sales.customer_id,
+        right_on=Refund.customer_id,
+        prefilter="left",
+    ).all()
+    expected = [(4, None), (4, 6)]
+    assert expected == [(row["ID"], row["Refunded To"]) for row in actual], str(actual)
+
+
+def test_prefilter_streams_the_side_it_reads_keys_from():
+    reads = []
+
+    class Visits(Table):
+        customer_id = IntField("Visited By")
+
+        @staticmethod
+        def rows(**kwargs):
+            reads.append(True)
+            # a generator, so the rows are only held if the join holds them
+            return (Visits(i) for i in (4, 7, 9))
+
+    actual = Sales.join(
+        right=Visits,
+        left_on=Sales.customer_id,
+        right_on=Visits.customer_id,
+        prefilter="left",
+    ).all()
+    assert [1, 3] == [row["ID"] for row in actual], str(actual)
+    # once for the keys, once for the join
+    assert 2 == len(reads)
+
+
+@pytest.mark.parametrize("how, prefilter", [("left", "left"), ("right", "right"),
+                                            ("outer", "left"), ("inner", "both")])
+def test_join_invalid_prefilter(how, prefilter):
+    with pytest.raises(ValueError):
+        Sales.join(
+            right=Customer,
+            how=how,
+            left_on=Sales.customer_id,
+            right_on=Customer.id,
+            prefilter=prefilter,
+        )
+
+
+@pytest.mark.parametrize("agg", ["concat", "first", "last", "max", "min", "sum"])
+@pytest.mark.parametrize("field", [Sales.amount, Sales.item_id])
+def test_hash_pivot_matches_sort_pivot(agg, field):
+    def pivot(strategy):
+        return Sales.pivot(
+            [Sales.customer_id],
+            [(field, agg)],
+            strategy=strategy
+        ).all()
+
+    expected, actual = pivot("sort"), pivot("hash")
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+@pytest.mark.parametrize("strategy", ["abc", "merge"])
+def test_pivot_invalid_strategy(strategy):
+    with pytest.raises(ValueError) as e:
+        Sales.pivot([Sales.customer_id], [(Sales.amount, "sum")], strategy=strategy)
+    assert "{!r} is an invalid pivot strategy".format(strategy) in str(e.value)
+
+
+def test_hash_pivot_unsorted():
+    expected = [
+        OrderedDict([('Item ID', 1), ('Amount', Decimal('400.00'))]),
+        OrderedDict([('Item ID', 2), ('Amount', Decimal('500.00'))]),
+        OrderedDict([('Item ID', None), ('Amount', Decimal('300.00'))])
+    ]
+    actual = Sales.pivot([Sales.item_id], [(Sales.amount, "sum")], sort=False).all()
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_hash_pivot_multiple_aggregations():
+    expected = [
+        OrderedDict([('Item ID', None), ('Amount', Decimal('300.00')), ('ID', 3)]),
+        OrderedDict([('Item ID', 1), ('Amount', Decimal('400.00')), ('ID', 4)]),
+        OrderedDict([('Item ID', 2), ('Amount', Decimal('500.00')), ('ID', 4)])
+    ]
+    actual = Sales.pivot(
+        [Sales.item_id],
+        [(Sales.amount, "sum"), (Sales.id, "max")]
+    ).all()
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+@pytest.mark.parametrize("agg", ["concat", "first", "last", "max", "min", "sum"])
+@pytest.mark.parametrize("split", [0, 2, 4])
+def test_incremental_pivot_matches_pivot(agg, split):
+    batch = []
+    new_sales = Sales.from_iterable(batch)
+    aggregations = [(Sales.amount, agg), (Sales.item_id, agg)]
+    rolling = new_sales.incremental_pivot([Sales.customer_id], aggregations)
+    totals = new_sales.incremental_pivot(
+        [Sales.customer_id], aggregations, changed_only=False
+    )
+    for rows in (Sales.rows()[:split], Sales.rows()[split:]):
+        batch[:] = rows
+        changed = rolling.all()
+        actual = totals.all()
+        # only the groups of the batch's rows come out
+        assert len(set(row[("Sales", "customer_id")] for row in rows)) == len(changed)
+    expected = Sales.pivot([Sales.customer_id], aggregations).all()
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_incremental_pivot_keeps_state_in_a_file():
+    def rolling(state):
+        return Sales.from_iterable(batch).incremental_pivot(
+            [Sales.item_id], [(Sales.amount, "sum"), (Sales.id, "max")], state=state
+        )
+
+    with TemporaryDirectory() as folder:
+        state = os.path.join(folder, "sales.state")
+        batch = Sales.rows()[:3]
+        assert 3 == len(rolling(state).all())
+        # a later run picks up where the last one left off
+        batch = Sales.rows()[3:]
+        expected = [
+            OrderedDict([("Item ID", 1), ("Amount", Decimal("400.00")), ("ID", 4)]),
+            OrderedDict([("Item ID", 2), ("Amount", Decimal("500.00")), ("ID", 4)]),
+        ]
+        actual = rolling(state).all()
+        assert expected == actual, "\nACTUAL: {}".format(actual)
+
+        with pytest.raises(ValueError):
+            Sales.from_iterable(batch).incremental_pivot(
+                [Sales.item_id], [(Sales.amount, "max")], state=state
+            ).all()
+
+
+def test_aggregation_method_accumulator():
+    values = [3, 1, 2, 1]
+    for method in AggregationMethod:
+        acc = method.accumulator
+        state = acc.initial()
+        for value in values:
+            state = acc.step(state, value)
+        assert method.fn(iter(values)) == acc.result(state), str(method)
+
+
+@given(rows=example_sales_rows)
+def test_sort_mixed_directions_matches_sorting_per_field(rows):
+    order_by = [
+        (Sales.sales_date, "desc"),
+        (Sales.customer_id, "asc"),
+        (Sales.amount, "desc")
+    ]
+    expected = rows
+    for fld, direction in reversed(order_by):
+        expected = sorted(
+            expected,
+            key=lambda row: row[(fld.table_name, fld.name)] or fld.data_type.default,
+            reverse=direction == "desc"
+        )
+    actual = Sales.from_iterable(rows).sort(*order_by).rows()
+    assert expected == actual
+
+
+def test_sort_descending_strings_then_ascending_ids():
+    expected = ["Sally", "Mr. X", "Mike", "Mark"]
+    actual = [
+        row["First Name"]
+        for row in Customer.sort((Customer.first_name, "desc"), (Customer.id, "asc")).all()
+    ]
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+@given(rows=example_sales_rows)
+def test_sorted_head_matches_full_sort(rows):
+    sorted_sales = Sales.from_iterable(rows).sort(
+        (Sales.amount, "desc"), (Sales.customer_id, "asc")
+    )
+    assert sorted_sales.all()[:3] == sorted_sales.head(3)
+
+
+def test_top():
+    expected = [
+        OrderedDict([('id', 8), ('First Name', 'Mr. X'), ('Last Name', None)]),
+        OrderedDict([('id', 7), ('First Name', 'Sally'), ('Last Name', 'Jones')])
+    ]
+    actual = Customer.top(2, (Customer.id, "desc")).all()
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+def test_top_keeps_input_order_for_ties():
+    actual = [
+        row["ID"] for row in Sales.top(3, (Sales.amount, SortDirection.Descending)).all()
+    ]
+    assert [3, 4, 4] == actual, "\nACTUAL: {}".format(actual)
@@ -0,0 +1,198 @@
+from decimal import Decimal
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from messydata import vectorized
+from messydata.compiler import compile_expression
+from messydata.field import Expression
+from messydata.operators import Operator
+from messydata.row import make_row
+
+from tests.conftest import *
+
+needs_numpy = pytest.mark.skipif(
+    vectorized.numpy is None, reason="NumPy isn't installed"
+)
+
+
+
+class Numbers(Table):
+    a = IntField("a")
+    b = FloatField("b")
+    c = CurrencyField("c")
+
+    @staticmethod
+    def rows(**kwargs):
+        return []
+
+
+a, b, c = Numbers.a, Numbers.b, Numbers.c
+keys = list(Numbers.fields.keys())
+
+
+# Fields have no `-` operator and expressions can't be combined with operators
+def minus(left, right):
+    return Expression(Operator.Subtract, left, right)
+
+
+def times(left, right):
+    return Expression(Operator.Multiply, left, right)
+
+
+def both(left, right):
+    return Expression(Operator.And, left, right)
+
+
+def either(left, right):
+    return Expression(Operator.Or, left, right)
+
+
+number_st = st.one_of(
+    st.none(),
+    st.sampled_from([0, 0.0, 1, -1, 2 ** 53, 2 ** 60]),
+    st.integers(min_value=-1000, max_value=1000),
+    st.floats(),
+)
+currency_st = st.one_of(
+    st.none(),
+    st.decimals(places=2, min_value=-1000, max_value=1000),
+    st.sampled_from([0, Decimal("0.5")]),
+)
+rows_st = st.lists(
+    st.tuples(number_st, number_st, currency_st).map(lambda values: make_row(keys, values)),
+    min_size=1,
+    max_size=20,
+)
+
+expressions = [
+    a + b,
+    a + 1.5,
+    minus(b, a),
+    minus(a, b),
+    a * b,
+    a * 2,
+    a / b,
+    b / a,
+    -a,
+    -b + a,
+    a > b,
+    a >= 1,
+    b == a,
+    a != 0,
+    b < 2.5,
+    a <= b,
+    both(a > 0, b < 10),
+    either(a > b, a == 0),
+    c > 100,
+    c >= a,
+    b < c,
+    c == 1.5,
+    a * b + c,
+    Expression(Operator.Divide, times(a + b, minus(a, b)), 2),
+]
+
+
+def outcome(evaluate):
+    """repr of each value, so types, -0.0 and NaN are compared too"""
+    try:
+        return [repr(value) for value in evaluate()]
+    except Exception as e:
+        return type(e)
+
+
+@needs_numpy
+@pytest.mark.parametrize("expression", expressions, ids=str)
+@given(rows=rows_st)
+def test_batch_matches_row_by_row(expression, rows):
+    calculate = compile_expression(expression)
+    calculate_batches = vectorized.batch_calculator(expression, calculate)
+    assert calculate_batches is not None
+
+    expected = outcome(lambda: [calculate(row) for row in rows])
+    actual = outcome(
+        lambda: [value for _, values in calculate_batches(rows) for value in values]
+    )
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+
+
+@needs_numpy
+def test_batch_is_vectorized():
+    rows = [make_row(keys, (i, i / 2, None)) for i in range(6)]
+    evaluate_batch = vectorized.batch_evaluator(
+        Expression(Operator.GreaterThan, times(a, b), 4.0)
+    )
+    actual = vectorized.to_values(evaluate_batch(rows))
+    assert [False, False, False, True, True, True] == actual, "\nACTUAL: {}".format(actual)
+
+
+@needs_numpy
+def test_unsupported_batches_run_row_by_row():
+    rows = [make_row(keys, (i, 1.0, None)) for i in range(4)]
+    rows.append(make_row(keys, ("x", 1.0, None)))
+    rows.append(make_row(keys, (5, 1.0, None)))
+    batch_size = vectorized.batch_size
+    vectorized.batch_size = 2
+    try:
+        predicate = compile_expression(a > 1)
+        filter_rows = vectorized.batch_filter(a > 1, predicate)
+        actual = [row[keys[0]] for row in filter_rows(rows[:4] + rows[5:])]
+        assert [2, 3, 5] == actual, "\nACTUAL: {}".format(actual)
+
+        # The batch holding "x" raises the error the row path raises
+        with pytest.raises(TypeError):
+            list(filter_rows(rows))
+    finally:
+        vectorized.batch_size = batch_size
+
+
+@pytest.mark.parametrize(
+    "expression", [
+        Customer.first_name + " " + Customer.last_name,
+        Customer.last_name.endswith("vic"),
+        Sales.customer_id.is_null() | (Sales.amount < 300),
+        Expression(Operator.And, Sales.amount > 1, Sales.id),
+        Sales.sales_date + 3,
+        Sales.amount,
+        lambda row: True,
+    ]
+)
+def test_batch_evaluator_declines(expression):
+    assert vectorized.batch_evaluator(expression) is None
+
+
+def test_where_and_assign_without_numpy():
+    numpy = vectorized.numpy
+    vectorized.numpy = None
+    try:
+        expected = (
+            Sales.where(Sales.amount > 150)
+            .assign("Double", Sales.amount * 2, data_type="float")
+            .all()
+        )
+    finally:
+        vectorized.numpy = numpy
+    actual = (
+        Sales.where(Sales.amount > 150)
+        .assign("Double", Sales.amount * 2, data_type="float")
+        .all()
+    )
+    assert expected == actual, "\nACTUAL: {}".format(actual)
+    assert [400.0, 600.0, 600.0, 600.0] == [row["Double"] for row in actual]
+
+
+@needs_numpy
+def test_where_and_assign_over_batches():
+    batch_size = vectorized.batch_size
+    vectorized.batch_size = 2
+    try:
+        actual = (
+            Sales.where(Sales.id >= 2)
+            .assign("Scaled", minus(Sales.id * 1.5, Sales.customer_id), data_type="float")
+            .select(Sales.id, "Scaled")
+            .all()
+        )
+    finally:
+        vectorized.batch_size = batch_size
+    assert [-2.0, 0.5, 0.0, 6.0] == [row["Scaled"] for row in actual], "\nACTUAL: {}".format(actual)